@@ -1,4 +1,109 @@
+import os
+import threading
+from collections import defaultdict
+from limits.storage import MemoryStorage
 from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address)
+# The one SlowAPI limiter of the app. Counters live in the storage named by RATE_LIMIT_STORAGE_URI:
+# the default bounded in-memory store is per process, so with several workers point it at a
+# shared Redis-protocol server (redis://, valkey://... via the `limits` package) to enforce the
+# configured limit across all of them. A shared store that goes down falls back to memory.
+
+RATE_LIMIT_STORAGE_URI = os.environ.get("RATE_LIMIT_STORAGE_URI", "bounded-memory://")
+# sliding-window-counter, moving-window (exact, more memory) or fixed-window
+RATE_LIMIT_STRATEGY = os.environ.get("RATE_LIMIT_STRATEGY", "sliding-window-counter")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))
+
+
+class BoundedMemoryStorage(MemoryStorage):
+    """
+    MemoryStorage holding at most max_keys counters / windows. Expired keys are dropped by
+    MemoryStorage itself, past the bound the oldest keys are evicted, so a flood of client
+    addresses can't grow memory without limit (an evicted client just starts a fresh window).
+    """
+
+    # Works on MemoryStorage's storage / events / expirations / locks dicts, which aren't part
+    # of the limits API. pyproject pins limits to the 5.x series this was written against
+
+    STORAGE_SCHEME = ["bounded-memory"]
+
+    def __init__(self, uri: str = None, wrap_exceptions: bool = False, max_keys: int = RATE_LIMIT_MAX_KEYS, **options):
+        self.max_keys = int(max_keys)
+        self.evictions = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    def _evict(self):
+        # Dicts keep insertion order, the first keys are the oldest windows
+        while (self.storage or self.events) and len(self.storage) + len(self.events) >= self.max_keys:
+            table = self.storage if len(self.storage) >= len(self.events) else self.events
+            key = next(iter(table))
+            table.pop(key, None)
+            self.expirations.pop(key, None)
+            self.locks.pop(key, None)
+            self.evictions += 1
+
+    def key_count(self) -> int:
+        return len(self.storage) + len(self.events)
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        if key not in self.storage:
+            self._evict()
+        return super().incr(key, expiry, amount)
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if key not in self.events:
+            self._evict()
+        return super().acquire_entry(key, limit, expiry, amount)
+
+
+class MeteredLimiter(Limiter):
+    """Limiter counting allowed and limited requests per rate limited endpoint."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._route_counts = defaultdict(lambda: {"allowed": 0, "limited": 0})
+        self._counts_lock = threading.Lock()
+
+    # SlowAPI has no public hook that sees allowed requests, so this overrides its private
+    # _check_request_limit (and stats() reads _storage_dead). pyproject pins slowapi below 0.2
+    def _check_request_limit(self, request, endpoint_func, in_middleware: bool = True) -> None:
+        # Route limits are checked by the limit() decorator, the middleware pass only sees
+        # application wide limits, of which there are none
+        if in_middleware:
+            return super()._check_request_limit(request, endpoint_func, in_middleware)
+        # Keyed like SlowAPI keys route limits, e.g. routers.public.get_post_by_slug
+        name = f"{endpoint_func.__module__}.{endpoint_func.__name__}" if endpoint_func else request.url.path
+        try:
+            super()._check_request_limit(request, endpoint_func, in_middleware)
+        except RateLimitExceeded:
+            self._count(name, "limited")
+            raise
+        self._count(name, "allowed")
+
+    def _count(self, route: str, outcome: str):
+        with self._counts_lock:
+            self._route_counts[route][outcome] += 1
+
+    def stats(self) -> dict:
+        storage = self.limiter.storage
+        with self._counts_lock:
+            routes = {route: dict(counts) for route, counts in self._route_counts.items()}
+        return {
+            "storage": type(storage).__name__,
+            "strategy": RATE_LIMIT_STRATEGY,
+            "storage_dead": self._storage_dead,
+            "keys": storage.key_count() if isinstance(storage, BoundedMemoryStorage) else None,
+            "evictions": getattr(storage, "evictions", None),
+            "routes": routes,
+        }
+
+
+limiter = MeteredLimiter(
+    key_func=get_remote_address,
+    strategy=RATE_LIMIT_STRATEGY,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    storage_options={"max_keys": RATE_LIMIT_MAX_KEYS} if RATE_LIMIT_STORAGE_URI.startswith("bounded-memory") else {},
+    in_memory_fallback_enabled=not RATE_LIMIT_STORAGE_URI.startswith(("memory", "bounded-memory")),
+)
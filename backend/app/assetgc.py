@@ -0,0 +1,199 @@
+import os
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+import links
+from db import db
+from blobs import blob_keys, release_asset, asset_keys, keys_still_used
+from objectstore import R2_BUCKET, delete_objects, abort_multipart_upload
+from objectcache import object_cache, asset_doc_cache
+
+# Garbage collection of stored objects nothing points at any more:
+#   - assets no post references (replaced covers, Froala images of deleted drafts, uploads
+#     that were never attached), by cover_asset_id / html_asset_id / froala_asset_id_list,
+#     the matching key fields, and /api/assets/{id} links in post bodies
+#   - blobs left without an asset (a release interrupted half way)
+#   - direct uploads whose presigned URLs expired before /complete, plus their multipart uploads
+# Everything younger than the grace period is kept, so in-flight edits and uploads are safe.
+# A dry run reports what would go without changing anything. Objects are deleted in bulk
+# with DeleteObjects, and a key still used by a surviving asset is never deleted.
+
+GC_GRACE_PERIOD = int(os.environ.get("GC_GRACE_PERIOD", 24 * 3600))
+# 0 disables the periodic run, the admin endpoint and `python app/assetgc.py` still work
+GC_INTERVAL = float(os.environ.get("GC_INTERVAL", 0))
+UNFINISHED_UPLOAD_STATUSES = ("pending", "finalizing", "failed")
+
+POST_REFERENCE_PROJECTION = {
+    "cover_asset_id": 1, "html_asset_id": 1, "froala_asset_id_list": 1,
+    "cover_image_key": 1, "html_key": 1, "froala_image_key_list": 1,
+    "cover_image.asset_id": 1, "cover_image.path": 1, "body": 1,
+}
+
+
+async def referenced_assets() -> tuple:
+    """(asset ids, object keys) referenced by any post, soft deleted ones included since they can be restored."""
+    ids, keys = set(), set()
+    async for post in db.posts.find({}, POST_REFERENCE_PROJECTION):
+        cover = post.get("cover_image") if isinstance(post.get("cover_image"), dict) else {}
+        ids.update([post.get("cover_asset_id"), post.get("html_asset_id"), cover.get("asset_id")])
+        ids.update(post.get("froala_asset_id_list") or [])
+        ids.update(links.asset_ids(post.get("body") or ""))
+        froala_keys = post.get("froala_image_key_list") or []
+        keys.update([post.get("cover_image_key"), post.get("html_key"), cover.get("path")])
+        keys.update(froala_keys if isinstance(froala_keys, list) else [froala_keys])
+    ids.discard(None)
+    keys.discard(None)
+    return ids, keys
+
+
+async def collect(dry_run: bool = True, grace_period: int = GC_GRACE_PERIOD) -> dict:
+    """Finds (and unless dry_run, deletes) unreferenced assets, orphaned blobs and expired uploads. Returns a report."""
+    started = datetime.now(timezone.utc)
+    cutoff = started - timedelta(seconds=grace_period)
+    ref_ids, ref_keys = await referenced_assets()
+    keys, going_blobs = [], []
+    report = {"dry_run": dry_run, "grace_period": grace_period, "cutoff": cutoff.isoformat()}
+
+    # Assets. Direct uploads still being processed are about to move keys, they wait
+    orphans = []
+    cursor = db.assets.find({"created_at": {"$lt": cutoff}, "processing": {"$ne": "pending"}})
+    async for asset in cursor:
+        if asset["asset_id"] in ref_ids or asset["path"] in ref_keys or asset.get("blob_key") in ref_keys:
+            continue
+        orphans.append(asset)
+
+    removed = []
+    for asset in orphans:
+        if dry_run:
+            if not asset.get("blob_id"):
+                keys.extend(asset_keys(asset))
+            else:
+                # Shared blobs only lose a reference, their objects stay
+                blob = await db.blobs.find_one({"_id": asset["blob_id"]})
+                if blob and blob.get("refs", 0) <= 1:
+                    keys.extend(blob_keys(blob))
+                    going_blobs.append(blob["_id"])
+            removed.append(asset)
+            continue
+        # Whoever deletes the doc releases its blob, so concurrent runs can't release twice
+        res = await db.assets.delete_one({"asset_id": asset["asset_id"], "created_at": {"$lt": cutoff}})
+        if res.deleted_count:
+            keys.extend(await release_asset(asset))
+            asset_doc_cache.invalidate(asset["asset_id"])
+            removed.append(asset)
+    report["assets"] = {
+        "count": len(removed),
+        "bytes": sum(a.get("size") or 0 for a in removed),
+        "ids": [a["asset_id"] for a in removed],
+    }
+
+    # Blobs no asset points at
+    used_blobs = set(await db.assets.distinct("blob_id"))
+    orphan_blobs = []
+    async for blob in db.blobs.find({"created_at": {"$lt": cutoff}}):
+        if blob["_id"] in used_blobs:
+            continue
+        if not dry_run:
+            res = await db.blobs.delete_one({"_id": blob["_id"]})
+            if not res.deleted_count:
+                continue
+        orphan_blobs.append(blob)
+        going_blobs.append(blob["_id"])
+        keys.extend(blob_keys(blob))
+    report["blobs"] = {"count": len(orphan_blobs), "ids": [b["_id"] for b in orphan_blobs]}
+
+    # Direct uploads that were never completed
+    uploads = []
+    query = {"status": {"$in": list(UNFINISHED_UPLOAD_STATUSES)}, "expires_at": {"$lt": cutoff}}
+    async for upload in db.uploads.find(query):
+        uploads.append(upload)
+        keys.append(upload["key"])
+        if not dry_run and upload.get("multipart_upload_id"):
+            try:
+                await abort_multipart_upload(R2_BUCKET, upload["key"], upload["multipart_upload_id"])
+            except Exception as e:
+                # Completed or already aborted
+                print(f"Aborting multipart upload of {upload['key']} failed: {str(e)}")
+    if uploads and not dry_run:
+        await db.uploads.delete_many({"_id": {"$in": [u["_id"] for u in uploads]}})
+    report["uploads"] = {"count": len(uploads), "ids": [u["_id"] for u in uploads]}
+
+    keys = list(dict.fromkeys(keys))
+    # Keys a surviving asset or blob still uses stay. A dry run deletes nothing, so what it
+    # would delete is excluded explicitly
+    in_use = await keys_still_used(keys, [a["asset_id"] for a in removed], going_blobs)
+    keys = [k for k in keys if k not in in_use]
+    report["keys"] = keys
+    report["kept_in_use"] = sorted(in_use)
+    if dry_run or not keys:
+        report["deleted"], report["errors"] = 0, []
+    else:
+        result = await delete_objects(R2_BUCKET, keys)
+        for key in result["deleted"]:
+            object_cache.invalidate(key)
+        report["deleted"], report["errors"] = len(result["deleted"]), result["errors"]
+    report["seconds"] = round((datetime.now(timezone.utc) - started).total_seconds(), 3)
+    return report
+
+
+class AssetCollector:
+    def __init__(self, interval: float = GC_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_report = None
+
+    async def run(self, dry_run: bool = True, grace_period: int = GC_GRACE_PERIOD) -> dict:
+        report = await collect(dry_run, grace_period)
+        if not dry_run:
+            self.runs += 1
+            self.last_report = {k: report[k] for k in ("cutoff", "deleted", "seconds")}
+            self.last_report.update({k: report[k]["count"] for k in ("assets", "blobs", "uploads")})
+            self.last_report["errors"] = len(report["errors"])
+        return report
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._collect_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _collect_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run(dry_run=False)
+            except Exception as e:
+                self.failures += 1
+                print(f"Asset GC failed: {e}")
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "runs": self.runs, "failures": self.failures, "last_run": self.last_report}
+
+
+asset_collector = AssetCollector()
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    async def _main(dry_run: bool):
+        try:
+            return await asset_collector.run(dry_run=dry_run)
+        finally:
+            from objectstore import close
+
+            await close()
+
+    # Dry run unless --delete is given
+    print(json.dumps(asyncio.run(_main("--delete" not in sys.argv)), indent=2, default=str))
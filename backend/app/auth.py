@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+import httpx
+from jose import jwt, JWTError
+
+# Local Clerk session token verification. Signing keys come from Clerk's JWKS endpoint, are
+# kept in memory, refreshed in the background and re-fetched when an unknown kid shows up
+# (key rotation). Verified tokens are cached by their hash until min(TTL, exp), so repeated
+# admin calls (autosave, uploads) skip both the signature check and any network round trip.
+
+CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+CLERK_API_URL = os.getenv("CLERK_API_URL", "https://api.clerk.com")
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", f"{CLERK_API_URL}/v1/jwks")
+JWT_KEY = os.getenv("JWT_KEY")                   # Clerk JWT *public* key (PEM), used when no kid matches
+FRONTEND_BASE = os.getenv("FRONTEND_BASE")
+
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", 3600))
+# Floor between refreshes triggered by unknown kids, so junk tokens can't hammer Clerk
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 30))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 1024))
+AUTH_CLOCK_SKEW = int(os.getenv("AUTH_CLOCK_SKEW", 5))
+
+
+class KeyUnavailable(Exception):
+    """The token can't be verified locally (no matching key, not a JWT), the caller may fall back to a remote check."""
+
+
+class JWKSCache:
+    def __init__(self, url: str = CLERK_JWKS_URL, refresh_interval: float = JWKS_REFRESH_INTERVAL, min_refresh_interval: float = JWKS_MIN_REFRESH_INTERVAL):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    async def refresh(self, force: bool = False) -> bool:
+        async with self._lock:
+            # Another caller may have refreshed while this one waited on the lock
+            if not force and time.monotonic() - self._attempted_at < self.min_refresh_interval:
+                return False
+            self._attempted_at = time.monotonic()
+            try:
+                async with httpx.AsyncClient(timeout=5) as client:
+                    response = await client.get(self.url, headers={"Accept": "application/json", "Authorization": f"Bearer {CLERK_SECRET_KEY}"})
+                    response.raise_for_status()
+                    keys = {k["kid"]: k for k in response.json().get("keys", []) if k.get("kid")}
+            except Exception as e:
+                # Keep serving the keys we have, a refresh failure must not log everyone out
+                self.refresh_failures += 1
+                print(f"JWKS refresh failed: {e}")
+                return False
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self.refreshes += 1
+            return True
+
+    async def get_key(self, kid: Optional[str]) -> dict:
+        key = self._keys.get(kid)
+        if key is None and kid:
+            await self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise KeyUnavailable(f"No signing key for kid {kid}")
+        return key
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh(force=True)
+            await asyncio.sleep(self.refresh_interval if self._keys else self.min_refresh_interval)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._fetched_at else None,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+class TokenCache:
+    """LRU of verified token claims keyed by sha256(token), entries never outlive the token's exp."""
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, claims: dict):
+        expires_at = time.time() + self.ttl
+        if claims.get("exp"):
+            expires_at = min(expires_at, float(claims["exp"]))
+        if expires_at <= time.time():
+            return
+        key = self._key(token)
+        self._entries[key] = (claims, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+jwks_cache = JWKSCache()
+token_cache = TokenCache()
+_counters = {"local_verified": 0, "remote_verified": 0, "rejected": 0}
+
+
+async def verify_token_locally(token: str) -> dict:
+    """
+    Verifies signature, exp/nbf and azp against the cached JWKS (or JWT_KEY).
+    Raises JWTError for bad tokens and KeyUnavailable when there is nothing to verify against.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        # Opaque tokens (machine tokens, API keys) can only be checked by Clerk
+        raise KeyUnavailable("Token is not a JWT")
+    try:
+        key = await jwks_cache.get_key(header.get("kid"))
+    except KeyUnavailable:
+        if not JWT_KEY:
+            raise
+        key = JWT_KEY
+
+    claims = jwt.decode(token, key, algorithms=["RS256"], options={"verify_aud": False, "leeway": AUTH_CLOCK_SKEW})
+    if FRONTEND_BASE and claims.get("azp") and claims["azp"] != FRONTEND_BASE:
+        raise JWTError("Invalid authorized party")
+    return claims
+
+
+def record(outcome: str):
+    _counters[outcome] += 1
+
+
+def start():
+    jwks_cache.start()
+
+
+async def stop():
+    await jwks_cache.stop()
+
+
+def stats() -> dict:
+    return {**_counters, "token_cache": token_cache.stats(), "jwks": jwks_cache.stats()}
+
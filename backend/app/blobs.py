@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import db
+from objectstore import delete_objects, R2_BUCKET
+
+# Content addressed blobs: one document per stored upload in `blobs`, keyed by the upload
+# prefix and the sha256 of the uploaded bytes, with a reference count of the asset docs
+# pointing at it. Identical uploads reuse the stored object (and its variants) instead of
+# being processed and uploaded again, and objects are only deleted with their last reference.
+
+BLOB_FIELDS = ("key", "mime", "size", "etag", "compression", "variants")
+# Encodings of published pages, as in publish.ENCODING_SUFFIXES
+PAGE_ENCODINGS = ("identity", "gzip", "br")
+
+
+def blob_id(prefix: str, sha256: str) -> str:
+    # Cover images are compressed and froala images are not, so blobs are per prefix
+    return f"{prefix}:{sha256}"
+
+
+def blob_keys(blob: dict) -> list:
+    return [blob["key"], *(v["key"] for v in blob.get("variants") or [])]
+
+
+def asset_keys(asset: dict) -> list:
+    """Every key an asset doc points at: its object, blob, variants and published page encodings."""
+    keys = [asset.get("path"), asset.get("blob_key"), *(v["key"] for v in asset.get("variants") or [])]
+    keys.extend(e["key"] for e in (asset.get("encodings") or {}).values())
+    return [k for k in dict.fromkeys(keys) if k]
+
+
+async def acquire_blob(prefix: str, sha256: str) -> Optional[dict]:
+    """Takes a reference on an existing blob, None when this content was never stored."""
+    return await db.blobs.find_one_and_update(
+        {"_id": blob_id(prefix, sha256)},
+        {"$inc": {"refs": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def register_blob(prefix: str, sha256: str, blob: dict) -> dict:
+    """
+    Records a freshly stored blob with one reference. If an identical upload registered
+    first, a reference is taken on that one instead and the objects just stored are deleted.
+    """
+    doc = {k: blob.get(k) for k in BLOB_FIELDS}
+    doc.update({"_id": blob_id(prefix, sha256), "sha256": sha256, "refs": 1, "created_at": datetime.now(timezone.utc)})
+    try:
+        await db.blobs.insert_one(doc)
+        return doc
+    except DuplicateKeyError:
+        pass
+
+    existing = await acquire_blob(prefix, sha256)
+    if existing is None:
+        # The other upload's blob was released in between, keep ours after all
+        return await register_blob(prefix, sha256, blob)
+    await delete_objects(R2_BUCKET, blob_keys(doc))
+    return existing
+
+
+async def release_asset(asset: dict) -> list:
+    """
+    Drops the reference an asset doc holds and returns the R2 keys that are no longer used,
+    which the caller deletes. Assets stored before dedup own their objects outright.
+    """
+    if not asset.get("blob_id"):
+        # Published pages also own their precompressed copies
+        return asset_keys(asset)
+
+    blob = await db.blobs.find_one_and_update(
+        {"_id": asset["blob_id"]},
+        {"$inc": {"refs": -1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob is None or blob["refs"] > 0:
+        return []
+    # A concurrent acquire_blob may have taken a new reference since, then nothing is deleted
+    res = await db.blobs.delete_one({"_id": blob["_id"], "refs": {"$lte": 0}})
+    return blob_keys(blob) if res.deleted_count else []
+
+
+async def keys_still_used(keys: list, going_assets=(), going_blobs=()) -> set:
+    """
+    The keys among `keys` an asset or blob doc still points at, which must not be deleted.
+    Assets and blobs about to be deleted but still in the database are named in going_*.
+    """
+    if not keys:
+        return set()
+    used = set()
+    query = {
+        "$or": [
+            {"path": {"$in": keys}},
+            {"blob_key": {"$in": keys}},
+            {"variants.key": {"$in": keys}},
+            # Every HTML asset of a post records the same published page objects
+            *({f"encodings.{name}.key": {"$in": keys}} for name in PAGE_ENCODINGS),
+        ],
+        "asset_id": {"$nin": list(going_assets)},
+    }
+    async for asset in db.assets.find(query, {"path": 1, "blob_key": 1, "variants": 1, "encodings": 1}):
+        used.update(asset_keys(asset))
+    query = {"$or": [{"key": {"$in": keys}}, {"variants.key": {"$in": keys}}], "_id": {"$nin": list(going_blobs)}}
+    async for blob in db.blobs.find(query, {"key": 1, "variants": 1}):
+        used.update(blob_keys(blob))
+    return used & set(keys)
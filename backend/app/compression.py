@@ -0,0 +1,167 @@
+import os
+import zlib
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Compresses responses on the fly when the client accepts it: brotli or gzip, for
+# allowlisted text types above a minimum size. Responses that already carry a
+# Content-Encoding (precompressed published pages), ranges and 304s pass through untouched.
+# Strong ETags become weak, like nginx does, since the encoded bytes differ from the original
+# but If-None-Match still matches on the weak comparison.
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_TYPES = tuple(
+    t.strip() for t in os.environ.get(
+        "COMPRESS_TYPES",
+        "application/json,text/html,text/plain,text/css,text/javascript,application/javascript,image/svg+xml",
+    ).split(",") if t.strip()
+)
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+# Chunked bodies of a known length up to this size are compressed in one go, larger ones per chunk
+COMPRESS_BUFFER_BYTES = 1024 * 1024
+
+
+def _accepted(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name)
+    return accepted
+
+
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        # wbits 31 writes the gzip header and trailer
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESS_MIN_BYTES,
+        content_types: tuple = COMPRESS_TYPES,
+        gzip_level: int = COMPRESS_GZIP_LEVEL,
+        brotli_quality: int = COMPRESS_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _encoder(self, accept_encoding: str):
+        accepted = _accepted(accept_encoding)
+        if ("br" in accepted or "*" in accepted):
+            return lambda: _Brotli(self.brotli_quality)
+        if "gzip" in accepted or "*" in accepted:
+            return lambda: _Gzip(self.gzip_level)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        make_encoder = self._encoder(Headers(scope=scope).get("accept-encoding", ""))
+        if make_encoder is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict = {}
+        encoder = None
+        passthrough = False
+        started = False
+        buffered = None
+
+        async def _send(message: Message):
+            nonlocal encoder, passthrough, started, buffered
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether compression is worth it
+                start.update(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(scope=start)
+
+            if encoder is None:
+                content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+                length = int(headers["content-length"]) if "content-length" in headers else None
+                if length is None and not more_body:
+                    length = len(body)
+                if (
+                    start["status"] not in (200, 201, 203)
+                    or "content-encoding" in headers
+                    or content_type not in self.content_types
+                    or (length is not None and length < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = make_encoder()
+                headers["Content-Encoding"] = encoder.name
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                # Inner middlewares stream even small responses, those are still compressed whole
+                if more_body and length is not None and length <= COMPRESS_BUFFER_BYTES:
+                    buffered = bytearray()
+
+            if buffered is not None:
+                buffered += body
+                if more_body:
+                    return
+                body = bytes(buffered)
+            elif more_body:
+                # Streamed responses are flushed per chunk so clients still get them incrementally
+                if not started:
+                    del headers["content-length"]
+                    await send(start)
+                    started = True
+                await send({"type": "http.response.body", "body": encoder.compress(body) + encoder.flush(), "more_body": True})
+                return
+
+            chunk = encoder.compress(body) + encoder.finish()
+            if not started:
+                headers["Content-Length"] = str(len(chunk))
+                await send(start)
+                started = True
+            await send({"type": "http.response.body", "body": chunk, "more_body": False})
+
+        await self.app(scope, receive, _send)
@@ -1,25 +1,176 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import time
+import asyncio
+import threading
+import importlib.util
+from collections import deque
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/blogdb")
-_client = AsyncIOMotorClient(MONGO_URI)
 db_name = "blogdb"
-db = _client[db_name]
 
-# async def init_db():
-#     global _client, db
-#     if _client is None:
-#         _client = AsyncIOMotorClient(MONGO_URI)
-#         #db_name = _client.get_default_database().name if _client.get_default_database() else "blogdb"
-#         db_name = "blogdb"
-#         db = _client[db_name]
+# Pool / timeout tuning, these take precedence over the same options in MONGO_URI
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_MS = int(os.environ.get("MONGO_MAX_IDLE_MS", 300_000))
+# How long a request waits for a free pooled connection before failing (0 waits forever)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000))
+# Wire compression in order of preference, the server picks the first it supports.
+# zstandard is a dependency, snappy needs python-snappy installed; missing ones are skipped with a warning
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "zstd,zlib")
+# Reads of the public routers may go to secondaries, admin reads and all writes use the primary
+MONGO_PUBLIC_READ_PREFERENCE = os.environ.get("MONGO_PUBLIC_READ_PREFERENCE", "secondaryPreferred")
+MONGO_PUBLIC_MAX_STALENESS = int(os.environ.get("MONGO_PUBLIC_MAX_STALENESS", 90))
+HEALTH_DB_TIMEOUT = float(os.environ.get("HEALTH_DB_TIMEOUT", 2))
 
-async def init_db():
-    # ensures client is connected (Motor connects lazily; calling server_info forces connection)
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _compressors() -> list:
+    names = [c.strip() for c in MONGO_COMPRESSORS.split(",") if c.strip()]
+    available = [c for c in names if c in _COMPRESSOR_MODULES and importlib.util.find_spec(_COMPRESSOR_MODULES[c])]
+    dropped = [c for c in names if c not in available]
+    if dropped:
+        print(f"MONGO_COMPRESSORS: skipping {', '.join(dropped)} (unknown or package not installed), using {', '.join(available) or 'none'}")
+    return available
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters and checkout wait times, fed by pymongo's pool events."""
+
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self._counters = {
+            "open": 0, "in_use": 0, "created": 0, "closed": 0,
+            "checkouts": 0, "checkout_failures": 0, "pool_cleared": 0,
+        }
+
+    def _incr(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def pool_cleared(self, event):
+        self._incr(pool_cleared=1)
+
+    def connection_created(self, event):
+        self._incr(open=1, created=1)
+
+    def connection_closed(self, event):
+        self._incr(open=-1, closed=1)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._counters["checkouts"] += 1
+            self._counters["in_use"] += 1
+            if event.duration is not None:
+                self._waits.append(event.duration)
+
+    def connection_check_out_failed(self, event):
+        self._incr(checkout_failures=1)
+
+    def connection_checked_in(self, event):
+        self._incr(in_use=-1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = dict(self._counters)
+        ms = lambda seconds: round(seconds * 1000, 2)
+        return {
+            **counters,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "checkout_wait_ms": {
+                "avg": ms(sum(waits) / len(waits)) if waits else None,
+                "p95": ms(waits[int(len(waits) * 0.95) - 1]) if len(waits) >= 20 else None,
+                "max": ms(waits[-1]) if waits else None,
+            },
+        }
+
+
+pool_metrics = PoolMetrics()
+
+# The client is built on first use rather than at import: constructing it starts pymongo's
+# monitor threads and DNS / SRV resolution, which workers shouldn't pay before serving
+_client: Optional[AsyncIOMotorClient] = None
+
+def get_client() -> AsyncIOMotorClient:
+    global _client
+    if _client is None:
+        options = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+            "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+            "event_listeners": [pool_metrics],
+        }
+        if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+            options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+        compressors = _compressors()
+        if compressors:
+            options["compressors"] = compressors
+        _client = AsyncIOMotorClient(MONGO_URI, **options)
+    return _client
+
+def get_db() -> AsyncIOMotorDatabase:
+    return get_client()[db_name]
+
+def get_public_db() -> AsyncIOMotorDatabase:
+    mode = read_pref_mode_from_name(MONGO_PUBLIC_READ_PREFERENCE)
+    # Staleness bounds only apply to modes that can read from a secondary
+    staleness = MONGO_PUBLIC_MAX_STALENESS if MONGO_PUBLIC_READ_PREFERENCE != "primary" else -1
+    return get_client().get_database(db_name, read_preference=make_read_preference(mode, None, staleness))
+
+class _LazyDatabase:
+    """Stands in for the Motor database at import time, db.posts etc. resolve on first use."""
+
+    def __init__(self, resolve=get_db):
+        self._resolve = resolve
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+db = _LazyDatabase()
+# Read only handle for the public routers
+public_db = _LazyDatabase(get_public_db)
+
+async def ping_db(timeout: float = HEALTH_DB_TIMEOUT) -> dict:
+    """Readiness of the primary: {"ok", "latency_ms"} or {"ok": False, "error"}."""
+    start = time.perf_counter()
     try:
-        await _client.admin.command("ping")
+        await asyncio.wait_for(get_client().admin.command("ping"), timeout)
     except Exception as e:
-        print("Warning: could not ping MongoDB on startup:", e)
+        return {"ok": False, "error": str(e) or type(e).__name__}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+async def init_db():
+    # ensures client is connected (Motor connects lazily; calling server_info forces connection)
+    state = await ping_db(MONGO_SERVER_SELECTION_TIMEOUT_MS / 1000)
+    if not state["ok"]:
+        print("Warning: could not ping MongoDB on startup:", state["error"])
+    return state
+
+def close_db():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
 
 
 # Helper to convert ObjectId -> str responses
@@ -35,6 +186,12 @@ def doc_fix_ids(doc: dict):
         return doc
     
     doc = dict(doc)
+    # Internal index fields never go out in responses
+    doc.pop("search_terms", None)
+    doc.pop("published_body", None)
+    doc.pop("links_expire_at", None)
+    doc.pop("needs_sync", None)
+    doc.pop("refresh_claimed_until", None)
     if "_id" in doc:
         doc["id"] = str(doc["_id"])
         del doc["_id"]
@@ -1,60 +1,71 @@
 # deps_admin.py (drop-in)
 import os
+import hmac
+import asyncio
 from typing import Optional
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from clerk_backend_api import Clerk
-from clerk_backend_api.security.types import AuthenticateRequestOptions
+from jose import JWTError
+
+import auth
 
 security = HTTPBearer(auto_error=False)
 
 CLERK_API_KEY   = os.getenv("CLERK_SECRET_KEY")
 ADMIN_CLERK_ID  = os.getenv("ADMIN_CLERK_ID")
-JWT_KEY         = os.getenv("JWT_KEY")           # Clerk JWT *public* key (PEM)
-FRONTEND_BASE   = os.getenv("FRONTEND_BASE")     # e.g. https://sagnnik.github.io
+METRICS_TOKEN   = os.getenv("METRICS_TOKEN")
 
 if not CLERK_API_KEY:
     raise RuntimeError("Environment requires CLERK api key")
 
-clerk = Clerk(bearer_auth=CLERK_API_KEY)
+_clerk = None
+
+def get_clerk():
+    # The Clerk SDK is only needed for the remote fallback, so it is imported and built on first use
+    global _clerk
+    if _clerk is None:
+        from clerk_backend_api import Clerk
+        _clerk = Clerk(bearer_auth=CLERK_API_KEY)
+    return _clerk
+
+async def _remote_claims(request: Request) -> dict:
+    from clerk_backend_api.security.types import AuthenticateRequestOptions
+
+    # Clerk's SDK is blocking, keep it off the event loop
+    try:
+        opts = AuthenticateRequestOptions(authorized_parties=[auth.FRONTEND_BASE] if auth.FRONTEND_BASE else None)
+        request_state = await asyncio.to_thread(get_clerk().authenticate_request, request, opts)
+    except Exception as e:
+        raise HTTPException(status_code=401, detail=f"Auth error: {str(e)}")
+    if not request_state.is_signed_in:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return request_state.payload or {}
 
 async def require_admin(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
 ):
     # Ensure a token header arrived (either Authorization or Clerk-Token)
-    if not (request.headers.get("authorization") or request.headers.get("clerk-token")):
+    token = credentials.credentials if credentials else request.headers.get("clerk-token")
+    if not token:
         raise HTTPException(status_code=401, detail="Missing auth token")
 
-    request_state = None
-    err_jwt = None
-
-    # 1) Try local JWT verification if key is provided
-    if JWT_KEY:
-        try:
-            opts = AuthenticateRequestOptions(
-                jwt_key=JWT_KEY,
-                authorized_parties=[FRONTEND_BASE] if FRONTEND_BASE else None,
-            )
-            request_state = clerk.authenticate_request(request, opts)
-        except Exception as e:
-            err_jwt = str(e)
+    # 1) Token verified recently
+    payload = auth.token_cache.get(token)
 
-    # 2) Fallback: remote verification (supports session tokens)
-    if not request_state or not request_state.is_signed_in:
+    # 2) Local JWT verification against the cached JWKS
+    if payload is None:
         try:
-            request_state = clerk.authenticate_request(request)  # no options
-        except Exception as e:
-            raise HTTPException(status_code=401, detail=f"Auth error: {str(e)}")
-
-    if not request_state.is_signed_in:
-        # Surface JWT error once while debugging
-        msg = "Unauthorized"
-        if err_jwt:
-            msg += f" (JWT verify failed: {err_jwt})"
-        raise HTTPException(status_code=401, detail=msg)
-
-    payload = request_state.payload or {}
+            payload = await auth.verify_token_locally(token)
+            auth.record("local_verified")
+        except auth.KeyUnavailable:
+            # 3) Fallback: remote verification, only when there's nothing to verify against locally
+            payload = await _remote_claims(request)
+            auth.record("remote_verified")
+        except JWTError as e:
+            auth.record("rejected")
+            raise HTTPException(status_code=401, detail=f"Unauthorized (JWT verify failed: {str(e)})")
+        auth.token_cache.put(token, payload)
 
     # Clerk user id can be 'sub' for JWT or 'user_id' for session token
     clerk_user_id = payload.get("sub") or payload.get("user_id")
@@ -65,3 +76,13 @@ async def require_admin(
         raise HTTPException(status_code=403, detail="Forbidden: Admins Only")
 
     return {"clerk_user_id": clerk_user_id, "claims": payload, "is_admin": True}
+
+async def require_metrics_access(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    # Scrapers send METRICS_TOKEN as a bearer token, anyone else needs an admin session
+    token = credentials.credentials if credentials else None
+    if METRICS_TOKEN and token and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return {"metrics": True}
+    return await require_admin(request, credentials)
@@ -0,0 +1,51 @@
+import os
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+import fastjson
+
+# HTTP validators for the public JSON endpoints. Bodies are serialized once when the post
+# cache is filled and stored with their ETag (a hash of the JSON), so hits are sent as-is and
+# a matching If-None-Match is answered with a 304 without touching the database.
+# Cache-Control lets browsers / the CDN reuse a response for max-age and serve it stale
+# while they revalidate in the background.
+
+POST_MAX_AGE = int(os.environ.get("PUBLIC_POST_MAX_AGE", 60))
+POST_STALE_WHILE_REVALIDATE = int(os.environ.get("PUBLIC_POST_SWR", 600))
+LIST_MAX_AGE = int(os.environ.get("PUBLIC_LIST_MAX_AGE", 30))
+LIST_STALE_WHILE_REVALIDATE = int(os.environ.get("PUBLIC_LIST_SWR", 120))
+
+
+def cache_control(max_age: int, stale_while_revalidate: int) -> str:
+    return f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+
+POST_CACHE_CONTROL = cache_control(POST_MAX_AGE, POST_STALE_WHILE_REVALIDATE)
+LIST_CACHE_CONTROL = cache_control(LIST_MAX_AGE, LIST_STALE_WHILE_REVALIDATE)
+
+
+def etag_for(raw: bytes) -> str:
+    """Strong ETag of a serialized body."""
+    return '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+
+
+def tagged(body, **extra) -> dict:
+    """The cache entry for a response body: its JSON, ETag and any extra fields."""
+    raw = fastjson.dumps(body)
+    return {"json": raw.decode("utf-8"), "etag": etag_for(raw), **extra}
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def respond(request: Request, entry: dict, cache_control: str, headers: Optional[dict] = None) -> Response:
+    headers = {**(headers or {}), "ETag": entry["etag"], "Cache-Control": cache_control}
+    if not_modified(request, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["json"], media_type="application/json", headers=headers)
@@ -0,0 +1,129 @@
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from typing import Optional
+from fastapi import UploadFile, HTTPException
+
+# Streaming upload ingest: uploads are copied to a temp file in fixed size chunks while
+# the size limit is enforced and the sha256 is computed, so peak memory per upload is
+# one chunk. Image workers read the temp file by path instead of receiving the bytes.
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 256 * 1024))
+INGEST_DIR = os.environ.get("UPLOAD_DIR") or tempfile.gettempdir()
+# Hard cap on any request body, checked before the multipart parser buffers anything
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 12 * 1024 * 1024))
+
+os.makedirs(INGEST_DIR, exist_ok=True)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class IngestedFile:
+    def __init__(self, path: str, size: int, sha256: str, content_type: Optional[str], filename: Optional[str]):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.content_type = content_type
+        self.filename = filename
+
+    async def chunks(self, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        f = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def cleanup(self):
+        try:
+            await asyncio.to_thread(os.remove, self.path)
+        except OSError:
+            pass
+
+
+async def ingest_upload(file: UploadFile, max_bytes: Optional[int], chunk_size: int = UPLOAD_CHUNK_SIZE) -> IngestedFile:
+    async def _chunks():
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    return await ingest_stream(_chunks(), max_bytes, file.content_type, file.filename)
+
+
+async def ingest_stream(chunks, max_bytes: Optional[int], content_type: Optional[str] = None, filename: Optional[str] = None) -> IngestedFile:
+    # Aborts as soon as the running size passes max_bytes, the partial temp file is removed
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="ingest-", dir=INGEST_DIR)
+    out = os.fdopen(fd, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        out.close()
+        os.remove(path)
+        raise
+    out.close()
+
+    return IngestedFile(path, size, digest.hexdigest(), content_type, filename)
+
+
+def make_scratch_dir() -> str:
+    return tempfile.mkdtemp(prefix="scratch-", dir=INGEST_DIR)
+
+
+async def remove_scratch_dir(path: str):
+    await asyncio.to_thread(shutil.rmtree, path, True)
+
+
+class BodySizeLimitMiddleware:
+    """Rejects request bodies over max_body_bytes with a 413, by Content-Length up front or while streaming."""
+
+    def __init__(self, app, max_body_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            # Raised as HTTPException so FastAPI's body parsing passes it through as a 413
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Request body too large"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
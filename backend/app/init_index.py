@@ -1,29 +1,13 @@
 import asyncio
-from db import AsyncIOMotorClient, init_db, db
-from bson import ObjectId
+from db import init_db, db
+import migrations
 
+# Indexes are created by the versioned migrations in migrations.py, which record what has
+# been applied. Kept as the entry point deploy scripts run: python init_index.py
 async def init():
     await init_db()
-    from db import db as _db
-
-    print("Creating Indexes...")
-
-    #Posts
-    await _db.posts.create_index("slug", unique=True)
-    await _db.posts.create_index([("status", 1), ("published_at", -1)])
-    await _db.posts.create_index([("is_deleted", 1)])
-
-    #Assets
-    await _db.assets.create_index([("path", 1)], unique=True)
-    await _db.assets.create_index([("used_by_post", 1)])
-
-    #Users
-    await _db.users.create_index("clerk_user_id", unique=True)
-
-    print("Indexes Created")
+    version = await migrations.migrate(db)
+    print(f"Schema at version {version}")
 
 if __name__ == "__main__":
     asyncio.run(init())
-
-
-
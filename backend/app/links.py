@@ -0,0 +1,156 @@
+import os
+import re
+import html
+from html.parser import HTMLParser
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+# Finds and rewrites asset links in post HTML. Markup is walked with the stdlib HTMLParser so
+# only real attribute values are touched (not text or scripts that happen to contain a URL).
+# A start tag with a rewritten link is rebuilt from its parsed attributes, everything else in
+# the document is kept byte for byte.
+
+BACKEND_BASE = os.environ.get("BACKEND_BASE", "http://localhost:8000").rstrip("/")
+# Froala / cover links as handed out by the assets router: relative, or on BACKEND_BASE.
+# Links to other hosts are not ours, even when their path looks like one
+ASSET_URL_RE = re.compile(rf"(?:(?i:{re.escape(BACKEND_BASE)}))?/api/assets/([0-9a-f]{{32}})(?:\?([^\s\"'<>,]*))?")
+# Attributes holding a single URL, and the ones holding a list of "url descriptor" candidates
+URL_ATTRS = {"src", "href", "poster", "data-src"}
+SRCSET_ATTRS = {"srcset", "data-srcset"}
+
+
+class _TagScanner(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.tags = []
+
+    def handle_starttag(self, tag, attrs):
+        self._record(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self._record(tag, attrs)
+
+    def _record(self, tag, attrs):
+        text = self.get_starttag_text()
+        if text:
+            self.tags.append((self.getpos(), tag, attrs, text))
+
+
+def scan_tags(markup: str) -> list:
+    """[(offset, tag, attrs, raw text)] of every start tag in the markup."""
+    scanner = _TagScanner()
+    scanner.feed(markup)
+    scanner.close()
+
+    line_starts = [0]
+    for match in re.finditer("\n", markup):
+        line_starts.append(match.end())
+    return [(line_starts[line - 1] + col, tag, attrs, text) for (line, col), tag, attrs, text in scanner.tags]
+
+
+def _attr_urls(name: str, value: str) -> list:
+    if name in URL_ATTRS:
+        return [value.strip()]
+    if name in SRCSET_ATTRS:
+        return [part.strip().split()[0] for part in value.split(",") if part.strip()]
+    return []
+
+
+class _AssetIdScanner(HTMLParser):
+    # Keeps only the ids, not the tags, so memory doesn't grow with the document
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.ids = {}
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            for url in _attr_urls(name, value or ""):
+                match = ASSET_URL_RE.fullmatch(url)
+                if match:
+                    self.ids.setdefault(match.group(1))
+
+    handle_startendtag = handle_starttag
+
+
+def asset_ids(markup: str) -> list:
+    """Ids of the assets linked from the markup, in document order."""
+    if not markup or "/api/assets/" not in markup:
+        return []
+    scanner = _AssetIdScanner()
+    scanner.feed(markup)
+    scanner.close()
+    return list(scanner.ids)
+
+
+def _width(query: Optional[str]) -> Optional[int]:
+    try:
+        return int(parse_qs(query or "").get("w", [""])[0]) or None
+    except ValueError:
+        return None
+
+
+def _link_url(link: dict, width: Optional[int]) -> str:
+    # ?w= asks for a width: the smallest variant covering it, as the assets router picks
+    variants = link.get("variants") if width else None
+    if not variants:
+        return link["url"]
+    for variant_width, url in variants:
+        if variant_width >= width:
+            return url
+    return variants[-1][1]
+
+
+def _rewrite_value(name: str, value: str, resolve: Callable[[str], Optional[dict]]):
+    """(new value, the link of a resolved single URL without ?w=) or (None, None) when nothing resolves."""
+    parts = [value] if name in URL_ATTRS else value.split(",")
+    changed, plain_link = False, None
+    for i, part in enumerate(parts):
+        url = part.strip().split()[0] if part.strip() else ""
+        match = ASSET_URL_RE.fullmatch(url)
+        link = resolve(match.group(1)) if match else None
+        if not link:
+            continue
+        width = _width(match.group(2))
+        parts[i] = part.replace(url, _link_url(link, width), 1)
+        changed = True
+        if name in URL_ATTRS and not width:
+            plain_link = link
+    return (",".join(parts), plain_link) if changed else (None, None)
+
+
+def _start_tag(tag: str, attrs: list, self_closing: bool) -> str:
+    rendered = "".join(f" {name}" if value is None else f' {name}="{html.escape(value)}"' for name, value in attrs)
+    return f"<{tag}{rendered}{'/' if self_closing else ''}>"
+
+
+def rewrite_asset_links(markup: str, resolve: Callable[[str], Optional[dict]]) -> str:
+    """
+    Replaces asset links in src / href / srcset attributes with resolve(asset_id)["url"], or with
+    the URL of the variant covering a ?w= width (resolve(...)["variants"], [(width, url)] by
+    width). An <img> without a srcset also gets resolve(...)["srcset"] when there is one and no
+    width was asked for. Links that don't resolve are left as they are.
+    """
+    if not markup or "/api/assets/" not in markup:
+        return markup
+    out, last = [], 0
+    for offset, tag, attrs, text in scan_tags(markup):
+        if "/api/assets/" not in text:
+            continue
+        names = {name for name, _ in attrs}
+        new_attrs, changed, srcset = [], False, None
+        for name, value in attrs:
+            new_value, link = _rewrite_value(name, value, resolve) if value and (name in URL_ATTRS or name in SRCSET_ATTRS) else (None, None)
+            if new_value is not None:
+                value, changed = new_value, True
+                if link and tag == "img" and name == "src" and not names & SRCSET_ATTRS:
+                    srcset = link.get("srcset")
+            new_attrs.append((name, value))
+        if not changed:
+            continue
+        if srcset:
+            new_attrs.append(("srcset", srcset))
+        out.append(markup[last:offset])
+        out.append(_start_tag(tag, new_attrs, text.endswith("/>")))
+        last = offset + len(text)
+    out.append(markup[last:])
+    return "".join(out)
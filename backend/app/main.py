@@ -1,21 +1,62 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import FileResponse
 import os
 import sys
 from routers import posts, public, assetsv2
-from db import init_db
-from init_index import init as init_indexes
+from db import db, close_db, ping_db, pool_metrics
+import objectstore
+import auth
+import migrations
+import signing
+from assetgc import asset_collector
 from api_limiter import limiter
+from deps import require_metrics_access
+from objectcache import object_cache, asset_doc_cache
+from workers import image_pool
+from ingest import BodySizeLimitMiddleware, MAX_REQUEST_BYTES
+from pagination import NEXT_CURSOR_HEADER
+from postcache import post_cache
+from compression import CompressionMiddleware
+from fastjson import FastJSONResponse
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.middleware import SlowAPIMiddleware
 
-app = FastAPI(title="Blog Backend")
+# Clients (Mongo, R2, Clerk) are built on first use, so startup only starts the background
+# workers and checks the schema version, one query once migrations have been applied
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    image_pool.start()
+    auth.start()
+    signing.link_sweeper.start()
+    asset_collector.start()
+    if migrations.MIGRATE_ON_STARTUP:
+        try:
+            await migrations.migrate(db)
+        except Exception as e:
+            print("Schema migration failed:", e)
+
+    yield
+
+    await image_pool.shutdown()
+    await auth.stop()
+    await signing.link_sweeper.stop()
+    await asset_collector.stop()
+    await objectstore.close()
+    await post_cache.close()
+    object_cache.close()
+    close_db()
+
+app = FastAPI(title="Blog Backend", default_response_class=FastJSONResponse, lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 app.add_middleware(SlowAPIMiddleware)
+# Added before CORS so oversized-body rejections still carry CORS headers
+app.add_middleware(BodySizeLimitMiddleware, max_body_bytes=MAX_REQUEST_BYTES)
+app.add_middleware(CompressionMiddleware)
 
 origins = [
     "https://sagnnik.github.io",
@@ -30,27 +71,36 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     allow_credentials=True,
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
-# Initiate DB
-@app.on_event("startup")
-async def startup():
-    await init_db()
-
-    try:
-        await init_indexes()
-    except Exception as e:
-        print("Index init failed:", e)
-
 # Mount static uploads directory
 # UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "./uploads")
 # os.makedirs(UPLOAD_DIR, exist_ok=True)
 # app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 # Mount the static published director
 
+# Readiness: 503 while MongoDB can't be reached, so the load balancer routes around the worker
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    mongo = await ping_db()
+    return FastJSONResponse({"ok": mongo["ok"], "db": mongo}, status_code=200 if mongo["ok"] else 503)
+
+# Internals (cache sizes, pool state, rate limit counts), only for METRICS_TOKEN or an admin
+@app.get("/metrics")
+@limiter.limit("30/minute")
+def metrics(request: Request, access: dict = Depends(require_metrics_access)):
+    return {
+        "object_cache": object_cache.stats(),
+        "asset_doc_cache": asset_doc_cache.stats(),
+        "image_pool": image_pool.stats(),
+        "auth": auth.stats(),
+        "post_cache": post_cache.stats(),
+        "rate_limits": limiter.stats(),
+        "mongo_pool": pool_metrics.stats(),
+        "links": signing.stats(),
+        "asset_gc": asset_collector.stats(),
+    }
 
 app.include_router(public.router, prefix="/api/public")
 app.include_router(posts.router, prefix="/api")
@@ -0,0 +1,138 @@
+import os
+import asyncio
+import socket
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import search
+
+# Versioned schema / index migrations. The applied version is recorded in the
+# `schema_migrations` collection, so a boot with an up to date database costs one find_one
+# instead of re-issuing every create_index. Migrations run once per deployment: the first
+# worker takes a lock document and applies them, the others wait for it to finish.
+#
+# Append new migrations at the end with the next version number, never edit applied ones.
+
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "1") not in ("0", "false", "False")
+MIGRATION_LOCK_TTL = int(os.environ.get("MIGRATION_LOCK_TTL", 300))
+STATE_ID = "state"
+LOCK_ID = "lock"
+
+
+async def _initial_indexes(db):
+    await db.posts.create_index("slug", unique=True)
+    await db.posts.create_index([("status", 1), ("published_at", -1)])
+    await db.posts.create_index([("is_deleted", 1)])
+    await db.assets.create_index([("path", 1)], unique=True)
+    await db.assets.create_index([("used_by_post", 1)])
+    await db.users.create_index("clerk_user_id", unique=True)
+
+
+async def _direct_uploads(db):
+    # Direct upload tickets expire with their presigned URLs
+    await db.uploads.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def _search_terms(db):
+    await db.posts.create_index([("search_terms", 1)])
+    # Posts written before search_terms existed
+    await search.backfill(db)
+
+
+async def _keyset_pagination(db):
+    # Equality fields first, then the (sort field, _id) cursor order
+    await db.posts.create_index([("status", 1), ("is_deleted", 1), ("published_at", -1), ("_id", -1)])
+    await db.posts.create_index([("tags", 1), ("status", 1), ("is_deleted", 1), ("published_at", -1), ("_id", -1)])
+    await db.posts.create_index([("created_at", -1), ("_id", -1)])
+    await db.posts.create_index([("status", 1), ("created_at", -1), ("_id", -1)])
+
+
+async def _upload_retention(db):
+    # Expired upload tickets are kept a week so the asset GC can delete what they left in R2
+    await db.uploads.drop_index("expires_at_1")
+    await db.uploads.create_index("expires_at", expireAfterSeconds=7 * 24 * 3600)
+
+
+async def _search_terms_priority(db):
+    # Posts at the term cap were truncated alphabetically, re-index them title / tags first
+    await search.backfill(db, {f"search_terms.{search.SEARCH_MAX_TERMS - 1}": {"$exists": True}})
+
+
+MIGRATIONS = [
+    (1, "initial indexes", _initial_indexes),
+    (2, "direct upload expiry", _direct_uploads),
+    (3, "search terms", _search_terms),
+    (4, "keyset pagination indexes", _keyset_pagination),
+    (5, "upload ticket retention", _upload_retention),
+    (6, "search terms by priority", _search_terms_priority),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version(db) -> int:
+    state = await db.schema_migrations.find_one({"_id": STATE_ID})
+    return state["version"] if state else 0
+
+
+async def _acquire_lock(db, owner: str) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        # Takes a free or expired lock (a worker that died mid-migration doesn't block forever)
+        lock = await db.schema_migrations.find_one_and_update(
+            {"_id": LOCK_ID, "expires_at": {"$lt": now}},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=MIGRATION_LOCK_TTL)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return lock["owner"] == owner
+    except DuplicateKeyError:
+        # Held by another worker
+        return False
+
+
+async def _release_lock(db, owner: str):
+    await db.schema_migrations.delete_one({"_id": LOCK_ID, "owner": owner})
+
+
+async def migrate(db, wait: float = MIGRATION_LOCK_TTL) -> int:
+    """Applies pending migrations, or waits for the worker applying them. Returns the schema version."""
+    version = await current_version(db)
+    if version >= LATEST_VERSION:
+        return version
+
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    deadline = asyncio.get_running_loop().time() + wait
+    while not await _acquire_lock(db, owner):
+        if asyncio.get_running_loop().time() > deadline:
+            raise RuntimeError("Timed out waiting for another worker's schema migration")
+        await asyncio.sleep(1)
+        version = await current_version(db)
+        if version >= LATEST_VERSION:
+            return version
+
+    try:
+        version = await current_version(db)
+        for number, name, apply in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Applying migration {number}: {name}")
+            await apply(db)
+            await db.schema_migrations.update_one(
+                {"_id": STATE_ID},
+                {
+                    "$set": {"version": number},
+                    "$push": {"applied": {"version": number, "name": name, "at": datetime.now(timezone.utc)}},
+                },
+                upsert=True,
+            )
+            version = number
+    finally:
+        await _release_lock(db, owner)
+    return version
+
+
+if __name__ == "__main__":
+    from db import db
+
+    print(f"Schema at version {asyncio.run(migrate(db))}")
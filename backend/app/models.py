@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime, timezone
 from bson import ObjectId
 
@@ -29,6 +29,35 @@ class PostCreate(BaseModel):
 class PostUpdate(PostCreate):
     pass
 
+# Lean shape returned by the list endpoints, heavy fields are opt in via ?fields=
+class PostSummary(BaseModel):
+    id: str
+    title: Optional[str] = None
+    slug: Optional[str] = None
+    summary: Optional[str] = None
+    tags: Optional[List[str]] = None
+    status: Optional[str] = None
+    author: Optional[dict] = None
+    cover_asset_id: Optional[str] = None
+    cover_image: Optional[dict] = None
+    cover_caption: Optional[str] = None
+    html_asset_id: Optional[str] = None
+    is_deleted: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    published_at: Optional[datetime] = None
+
+POST_SUMMARY_FIELDS = tuple(name for name in PostSummary.model_fields if name != "id")
+POST_EXTRA_FIELDS = {
+    "raw", "body", "meta", "cover_image_key", "html_key",
+    "froala_asset_id_list", "froala_image_key_list", "deleted_at", "deleted_by",
+}
+
+def post_list_projection(fields: Optional[str] = None) -> dict:
+    """PostSummary fields plus any allowlisted extras named in a comma separated `fields`."""
+    extra = {f.strip() for f in (fields or "").split(",")} & POST_EXTRA_FIELDS
+    return {name: 1 for name in (*POST_SUMMARY_FIELDS, *sorted(extra))}
+
 class PostOut(PostCreate):
     id: str
     author: Optional[dict] = None
@@ -36,3 +65,35 @@ class PostOut(PostCreate):
     updated_at: Optional[datetime] = None
     publised_at: Optional[datetime] = Field(default_factory=datetime.now(timezone.utc))
     is_deleted: Optional[bool] = False
+
+# Two phase direct-to-R2 uploads
+class DirectUploadCreate(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    kind: str = "image" # image (cover) or froala
+    post_id: Optional[str] = None
+    alt: Optional[str] = None
+    caption: Optional[str] = None
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class DirectUploadComplete(BaseModel):
+    parts: List[UploadedPart] = Field(default_factory=list)
+
+# Editor autosave deltas. A splice replaces `delete` characters at `start` with `insert`,
+# offsets count Unicode code points and apply to the text left by the previous splice.
+# Offsets past what a 16MB document can hold are rejected, $substrCP only takes int32 arguments
+MAX_SPLICE_OFFSET = 16 * 1024 * 1024
+
+class TextSplice(BaseModel):
+    field: Literal["body", "raw"]
+    start: int = Field(ge=0, le=MAX_SPLICE_OFFSET)
+    delete: int = Field(default=0, ge=0, le=MAX_SPLICE_OFFSET)
+    insert: str = ""
+
+class AutosavePatch(BaseModel):
+    version: int = Field(ge=0) # the version the splices were made against
+    splices: List[TextSplice] = Field(min_length=1, max_length=200)
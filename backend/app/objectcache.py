@@ -0,0 +1,263 @@
+import os
+import mmap
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Tiered byte cache in front of R2: a small in-memory LRU for hot objects which spills
+# evicted entries into a size capped on-disk tier (read back through mmap).
+# Entries are keyed by (path, etag) so an overwritten object can never be served stale
+# once its new etag is known, and writers invalidate every entry for a path.
+
+CACHE_MEMORY_BYTES = int(os.environ.get("OBJECT_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+CACHE_MEMORY_ITEM_BYTES = int(os.environ.get("OBJECT_CACHE_MEMORY_ITEM_BYTES", 1 * 1024 * 1024))
+CACHE_DISK_BYTES = int(os.environ.get("OBJECT_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+CACHE_DISK_DIR = os.environ.get("OBJECT_CACHE_DISK_DIR", os.path.join(tempfile.gettempdir(), "blog-object-cache"))
+CACHE_DISK_POLICY = os.environ.get("OBJECT_CACHE_DISK_POLICY", "lru")  # lru or lfu
+CACHE_MAX_OBJECT_BYTES = int(os.environ.get("OBJECT_CACHE_MAX_OBJECT_BYTES", 8 * 1024 * 1024))
+ASSET_DOC_CACHE_SIZE = int(os.environ.get("ASSET_DOC_CACHE_SIZE", 2048))
+ASSET_DOC_CACHE_TTL = float(os.environ.get("ASSET_DOC_CACHE_TTL", 60))
+
+
+class CachedObject:
+    """A cache hit. `data` is bytes for memory hits and an mmap for disk hits, call close() when done."""
+
+    def __init__(self, data, meta: dict, tier: str):
+        self.data = data
+        self.meta = meta
+        self.tier = tier
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _purge_stale_dirs(disk_dir: str):
+    # Directories of workers that died without shutting down (crash, recycle, kill -9)
+    try:
+        names = os.listdir(disk_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.isdigit() and int(name) != os.getpid() and not _pid_alive(int(name)):
+            shutil.rmtree(os.path.join(disk_dir, name), ignore_errors=True)
+
+
+class ObjectCache:
+    def __init__(
+        self,
+        memory_bytes: int = CACHE_MEMORY_BYTES,
+        memory_item_bytes: int = CACHE_MEMORY_ITEM_BYTES,
+        disk_dir: Optional[str] = CACHE_DISK_DIR,
+        disk_bytes: int = CACHE_DISK_BYTES,
+        disk_policy: str = CACHE_DISK_POLICY,
+    ):
+        self.memory_bytes = memory_bytes
+        self.memory_item_bytes = memory_item_bytes
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self.disk_policy = disk_policy
+        # one directory per worker process so uvicorn workers never share files
+        self.disk_dir = os.path.join(disk_dir, str(os.getpid())) if disk_dir else None
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # (path, etag) -> (bytes, meta)
+        self._memory_used = 0
+        self._disk = OrderedDict()     # (path, etag) -> {"file", "size", "meta", "hits"}
+        self._disk_used = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "invalidations": 0,
+        }
+
+        if self.disk_dir:
+            _purge_stale_dirs(disk_dir)
+            os.makedirs(self.disk_dir, exist_ok=True)
+            for name in os.listdir(self.disk_dir):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
+
+    def get(self, path: str, etag: Optional[str] = None) -> Optional[CachedObject]:
+        key = (path, etag)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                data, meta = self._memory[key]
+                return CachedObject(data, meta, "memory")
+
+            entry = self._disk.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._disk.move_to_end(key)
+            entry["hits"] += 1
+            try:
+                with open(entry["file"], "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self._drop_disk(key)
+                self._counters["misses"] += 1
+                return None
+
+            self._counters["disk_hits"] += 1
+            return CachedObject(data, entry["meta"], "disk")
+
+    def put(self, path: str, etag: Optional[str], data: bytes, meta: dict):
+        size = len(data)
+        if size > CACHE_MAX_OBJECT_BYTES:
+            return
+
+        key = (path, etag)
+        with self._lock:
+            self._drop_memory(key)
+            self._drop_disk(key)
+            if size <= self.memory_item_bytes:
+                self._memory[key] = (bytes(data), meta)
+                self._memory_used += size
+                self._evict_memory()
+            else:
+                self._write_disk(key, data, meta)
+
+    def invalidate(self, path: str):
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == path]:
+                self._drop_memory(key)
+                self._counters["invalidations"] += 1
+            for key in [k for k in self._disk if k[0] == path]:
+                self._drop_disk(key)
+                self._counters["invalidations"] += 1
+
+    def close(self):
+        """Drops every entry and removes this worker's disk directory."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            self._disk.clear()
+            self._disk_used = 0
+            if self.disk_dir:
+                shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_capacity": self.memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_used,
+                "disk_capacity": self.disk_bytes,
+                "disk_policy": self.disk_policy,
+            }
+
+    # Internal helpers, callers must hold self._lock
+    def _drop_memory(self, key):
+        item = self._memory.pop(key, None)
+        if item is not None:
+            self._memory_used -= len(item[0])
+
+    def _drop_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_used -= entry["size"]
+        try:
+            os.remove(entry["file"])
+        except OSError:
+            pass
+
+    def _evict_memory(self):
+        # LRU entries spill to the disk tier instead of being thrown away
+        while self._memory_used > self.memory_bytes and self._memory:
+            key, (data, meta) = self._memory.popitem(last=False)
+            self._memory_used -= len(data)
+            self._counters["memory_evictions"] += 1
+            self._write_disk(key, data, meta)
+
+    def _write_disk(self, key, data, meta: dict):
+        size = len(data)
+        if not self.disk_dir or size > self.disk_bytes:
+            return
+
+        self._evict_disk(size)
+        name = hashlib.sha256(f"{key[0]}\0{key[1]}".encode("utf-8")).hexdigest()
+        file = os.path.join(self.disk_dir, name)
+        try:
+            with open(file, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Object cache disk write failed: {e}")
+            return
+
+        self._disk[key] = {"file": file, "size": size, "meta": meta, "hits": 0}
+        self._disk_used += size
+
+    def _evict_disk(self, incoming: int):
+        while self._disk and self._disk_used + incoming > self.disk_bytes:
+            if self.disk_policy == "lfu":
+                victim = min(self._disk, key=lambda k: self._disk[k]["hits"])
+            else:
+                victim = next(iter(self._disk))
+            self._drop_disk(victim)
+            self._counters["disk_evictions"] += 1
+
+
+class AssetDocCache:
+    """Short TTL LRU of asset docs so hot assets skip the Mongo lookup on every request."""
+
+    def __init__(self, maxsize: int = ASSET_DOC_CACHE_SIZE, ttl: float = ASSET_DOC_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._docs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, asset_id: str) -> Optional[dict]:
+        item = self._docs.get(asset_id)
+        if item is None or item[0] < time.monotonic():
+            self._docs.pop(asset_id, None)
+            self.misses += 1
+            return None
+        self._docs.move_to_end(asset_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, asset_id: str, doc: dict):
+        self._docs[asset_id] = (time.monotonic() + self.ttl, doc)
+        self._docs.move_to_end(asset_id)
+        while len(self._docs) > self.maxsize:
+            self._docs.popitem(last=False)
+
+    def invalidate(self, asset_id: str):
+        self._docs.pop(asset_id, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._docs)}
+
+
+object_cache = ObjectCache()
+asset_doc_cache = AssetDocCache()
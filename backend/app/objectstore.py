@@ -1,9 +1,19 @@
 import os
+import base64
+import hashlib
 import boto3
-from botocore.client import Config
+import httpx
+import random
 import asyncio
-from uuid import uuid4
-from typing import Optional, BinaryIO
+import xml.etree.ElementTree as ET
+from botocore.client import Config
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.exceptions import ClientError
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+from urllib.parse import quote, urlencode
+from typing import Optional, AsyncIterator
 
 # Env Variables
 R2_ENDPOINT= os.environ.get("R2_ENDPOINT")
@@ -12,71 +22,469 @@ R2_SECRET_KEY= os.environ.get("R2_SECRET_ACCESS_KEY")
 R2_REGION= os.environ.get("R2_REGION", "auto")
 R2_BUCKET= os.environ.get("R2_BUCKET")
 
+# Connection pool / timeout / retry tuning for the async client
+R2_MAX_CONNECTIONS = int(os.environ.get("R2_MAX_CONNECTIONS", 64))
+R2_MAX_KEEPALIVE = int(os.environ.get("R2_MAX_KEEPALIVE", 16))
+R2_KEEPALIVE_EXPIRY = float(os.environ.get("R2_KEEPALIVE_EXPIRY", 30))
+R2_CONNECT_TIMEOUT = float(os.environ.get("R2_CONNECT_TIMEOUT", 5))
+R2_TIMEOUT = float(os.environ.get("R2_TIMEOUT", 30))
+R2_MAX_RETRIES = int(os.environ.get("R2_MAX_RETRIES", 3))
+
+# Chunk size used when streaming object bodies to clients
+STREAM_CHUNK_SIZE = int(os.environ.get("R2_STREAM_CHUNK_SIZE", 64 * 1024))
+# Objects larger than one part go through multipart upload (S3 minimum part size is 5MB)
+MULTIPART_PART_SIZE = max(int(os.environ.get("R2_MULTIPART_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+# S3 / R2 limit of keys per DeleteObjects request
+DELETE_OBJECTS_MAX_KEYS = 1000
+
 # FIXME Use logging if all the env variables are not imported properly
 if not all([R2_ENDPOINT, R2_ACCESS_KEY, R2_SECRET_KEY, R2_BUCKET]):
     print("Not all env variables are imported properly")
 
-_session = boto3.Session(
-    aws_access_key_id=R2_ACCESS_KEY,
-    aws_secret_access_key=R2_SECRET_KEY,
-    region_name=R2_REGION,
-)
-
-s3_client = _session.client(
-    "s3",
-    endpoint_url=R2_ENDPOINT,
-    config=Config(signature_version="s3v4"),
-)
-
-# Async Wrappers
-async def upload_object(fileobj, bucket, key, content_type=None, extra_args=None):
-    args={}
-    if content_type:
-        args["ContentType"] = content_type
+_session: Optional[boto3.Session] = None
+_s3_client = None
+
+def _get_session() -> boto3.Session:
+    global _session
+    if _session is None:
+        _session = boto3.Session(
+            aws_access_key_id=R2_ACCESS_KEY,
+            aws_secret_access_key=R2_SECRET_KEY,
+            region_name=R2_REGION,
+        )
+    return _session
+
+# boto3 is only used for presigning, which is local computation and never touches the network.
+# Building the client loads botocore's service model, so it happens on the first presign
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = _get_session().client(
+            "s3",
+            endpoint_url=R2_ENDPOINT,
+            config=Config(signature_version="s3v4"),
+        )
+    return _s3_client
 
-    if extra_args:
-        args.update(extra_args)
+_UNSIGNED_PAYLOAD_CONFIG = Config(s3={"payload_signing_enabled": False})
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_EXTRA_ARG_HEADERS = {
+    "CacheControl": "Cache-Control",
+    "ContentDisposition": "Content-Disposition",
+    "ContentEncoding": "Content-Encoding",
+    "ContentLanguage": "Content-Language",
+}
+
+_http: Optional[httpx.AsyncClient] = None
+
+def _get_http() -> httpx.AsyncClient:
+    # One pooled client per process, connections are kept alive and reused across requests
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=R2_MAX_CONNECTIONS,
+                max_keepalive_connections=R2_MAX_KEEPALIVE,
+                keepalive_expiry=R2_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(R2_TIMEOUT, connect=R2_CONNECT_TIMEOUT),
+            # Bodies are passed through untouched, precompressed objects must not be decoded here
+            headers={"Accept-Encoding": "identity"},
+        )
+    return _http
+
+async def close():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+def _url(bucket, key=None, params=None) -> str:
+    # Path style addressing works for R2 as well as local S3 stand-ins (minio, moto_server)
+    url = f"{R2_ENDPOINT.rstrip('/')}/{bucket}"
+    if key is not None:
+        url += "/" + quote(key, safe="/~")
+    if params:
+        url += "?" + urlencode(params, quote_via=quote, safe="~")
+    return url
+
+def _sign(method: str, url: str, headers: dict, body) -> dict:
+    # Streamed bodies (iterators, or callables making one) are sent with UNSIGNED-PAYLOAD
+    request = AWSRequest(method=method, url=url, headers=headers, data=body if isinstance(body, bytes) else b"")
+    if body is not None and not isinstance(body, bytes):
+        request.context["client_config"] = _UNSIGNED_PAYLOAD_CONFIG
+    S3SigV4Auth(_get_session().get_credentials(), "s3", R2_REGION).add_auth(request)
+    return dict(request.headers.items())
+
+def _client_error(response: httpx.Response, operation: str, body: bytes = b"") -> ClientError:
+    code, message = str(response.status_code), response.reason_phrase
+    if body:
+        try:
+            root = ET.fromstring(body)
+            code = _xml_text(root, "Code") or code
+            message = _xml_text(root, "Message") or message
+        except ET.ParseError:
+            pass
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": response.status_code, "HTTPHeaders": dict(response.headers)},
+        },
+        operation,
+    )
 
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, lambda:s3_client.upload_fileobj(fileobj, bucket, key, ExtraArgs=args))
+def _xml_text(root, name: str) -> Optional[str]:
+    for el in root.iter():
+        if el.tag.rsplit("}", 1)[-1] == name:
+            return el.text
+    return None
 
-async def put_object_from_bytes(data: bytes, bucket, key, content_type=None, extra_args=None):
-    params = {"Bucket":bucket, "Key": key, "Body": data}
+def _extra_headers(content_type=None, extra_args=None) -> dict:
+    headers = {}
     if content_type:
-        params["ContentType"] = content_type 
-    if extra_args:
-        params.update(extra_args)
-
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, lambda: s3_client.put_object(**params))
-
-async def get_object(bucket, key):
-    loop = asyncio.get_running_loop()
-
-    def _get():
-        res = s3_client.get_object(Bucket=bucket, Key=key)
-        data = res["Body"].read()
-        metadata = {
-            "ContentType": res.get("ContentType"),
-            "ContentLength": res.get("ContentLength"),
-            "LastModified": res.get("LastModified"),
-            "ETag": res.get("ETag"),
-        }
-        return data, metadata
-    
-    data, metadata = await loop.run_in_executor(None, _get)
-    return data, metadata
+        headers["Content-Type"] = content_type
+    for arg, value in (extra_args or {}).items():
+        if arg == "ContentType":
+            headers["Content-Type"] = value
+        elif arg == "Metadata":
+            for meta_key, meta_value in value.items():
+                headers[f"x-amz-meta-{meta_key}"] = str(meta_value)
+        elif arg in _EXTRA_ARG_HEADERS:
+            headers[_EXTRA_ARG_HEADERS[arg]] = value
+    return headers
+
+def _metadata(response: httpx.Response) -> dict:
+    last_modified = response.headers.get("last-modified")
+    content_length = response.headers.get("content-length")
+    return {
+        "ContentType": response.headers.get("content-type"),
+        "ContentLength": int(content_length) if content_length is not None else None,
+        "ContentRange": response.headers.get("content-range"),
+        "ContentEncoding": response.headers.get("content-encoding"),
+        "LastModified": parsedate_to_datetime(last_modified) if last_modified else None,
+        "ETag": response.headers.get("etag"),
+        "Metadata": {k[len("x-amz-meta-"):]: v for k, v in response.headers.items() if k.startswith("x-amz-meta-")},
+        "StatusCode": response.status_code,
+    }
+
+async def _request(
+    operation: str,
+    method: str,
+    bucket,
+    key=None,
+    params=None,
+    headers=None,
+    body=None,
+    stream: bool = False,
+    timeout: Optional[float] = None,
+    retries: int = R2_MAX_RETRIES,
+) -> httpx.Response:
+    # Signed request with retries on transport errors and throttling / 5xx responses.
+    # Streamed bodies can't be replayed, so they are only attempted once, unless the body is a
+    # callable returning a fresh iterator (a file read again from the start) per attempt
+    url = _url(bucket, key, params)
+    replayable = body is None or isinstance(body, bytes) or callable(body)
+    attempts = (retries if replayable else 0) + 1
+    client = _get_http()
+
+    for attempt in range(attempts):
+        signed = _sign(method, url, dict(headers or {}), body)
+        request = client.build_request(
+            method,
+            url,
+            headers=signed,
+            content=body() if callable(body) else body,
+            timeout=httpx.Timeout(timeout, connect=R2_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT,
+        )
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError:
+            if attempt + 1 >= attempts:
+                raise
+        else:
+            if response.status_code not in _RETRY_STATUS or attempt + 1 >= attempts:
+                break
+            await response.aclose()
+        await asyncio.sleep(min(0.1 * 2 ** attempt, 2) * (0.5 + random.random()))
+
+    if response.status_code >= 300:
+        error_body = await response.aread() if method != "HEAD" else b""
+        await response.aclose()
+        raise _client_error(response, operation, error_body)
+
+    return response
+
+# Async API
+async def put_object_from_bytes(data: bytes, bucket, key, content_type=None, extra_args=None, timeout: Optional[float] = None):
+    headers = _extra_headers(content_type, extra_args)
+    response = await _request("PutObject", "PUT", bucket, key, headers=headers, body=bytes(data), timeout=timeout)
+    return response.headers.get("etag")
+
+async def put_object_stream(
+    chunks: AsyncIterator[bytes],
+    bucket,
+    key,
+    content_type=None,
+    extra_args=None,
+    part_size: int = MULTIPART_PART_SIZE,
+    timeout: Optional[float] = None,
+):
+    # Buffers at most one part. Small streams become a single PUT, larger ones a multipart upload
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    headers = _extra_headers(content_type, extra_args)
+
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = await _create_multipart_upload(bucket, key, headers, timeout)
+                part = bytes(buffer[:part_size])
+                del buffer[:part_size]
+                parts.append(await _upload_part(bucket, key, upload_id, len(parts) + 1, part, timeout))
+
+        if upload_id is None:
+            return await put_object_from_bytes(bytes(buffer), bucket, key, extra_args=extra_args, content_type=content_type, timeout=timeout)
+
+        if buffer:
+            parts.append(await _upload_part(bucket, key, upload_id, len(parts) + 1, bytes(buffer), timeout))
+        return await _complete_multipart_upload(bucket, key, upload_id, parts, timeout)
+    except BaseException:
+        if upload_id is not None:
+            try:
+                await abort_multipart_upload(bucket, key, upload_id)
+            except Exception as e:
+                print(f"Failed to abort multipart upload {upload_id}: {e}")
+        raise
+
+def _file_body(path: str, offset: int, length: int, chunk_size: int = STREAM_CHUNK_SIZE):
+    # A callable making a fresh async iterator over path[offset:offset + length], so retries can replay it
+    async def _read():
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, offset)
+            remaining = length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"{path} is shorter than expected")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    return _read
+
+async def put_object_file(
+    path: str,
+    size: int,
+    bucket,
+    key,
+    content_type=None,
+    extra_args=None,
+    part_size: int = MULTIPART_PART_SIZE,
+    timeout: Optional[float] = None,
+):
+    """
+    Uploads a local file of known size, read in STREAM_CHUNK_SIZE chunks and sent with its
+    Content-Length and an unsigned payload, so memory stays at one chunk whatever the size.
+    Files up to part_size are one PUT, larger ones a multipart upload with each part streamed.
+    """
+    headers = _extra_headers(content_type, extra_args)
+    if size <= part_size:
+        headers["Content-Length"] = str(size)
+        response = await _request("PutObject", "PUT", bucket, key, headers=headers, body=_file_body(path, 0, size), timeout=timeout)
+        return response.headers.get("etag")
+
+    upload_id = await _create_multipart_upload(bucket, key, headers, timeout)
+    try:
+        parts = []
+        for number, offset in enumerate(range(0, size, part_size), start=1):
+            body = _file_body(path, offset, min(part_size, size - offset))
+            parts.append(await _upload_part(bucket, key, upload_id, number, body, timeout, length=min(part_size, size - offset)))
+        return await _complete_multipart_upload(bucket, key, upload_id, parts, timeout)
+    except BaseException:
+        try:
+            await abort_multipart_upload(bucket, key, upload_id)
+        except Exception as e:
+            print(f"Failed to abort multipart upload {upload_id}: {e}")
+        raise
+
+async def upload_object(fileobj, bucket, key, content_type=None, extra_args=None, timeout: Optional[float] = None):
+    async def _chunks():
+        while True:
+            chunk = await asyncio.to_thread(fileobj.read, STREAM_CHUNK_SIZE * 16)
+            if not chunk:
+                break
+            yield chunk
+
+    return await put_object_stream(_chunks(), bucket, key, content_type=content_type, extra_args=extra_args, timeout=timeout)
+
+async def get_object(bucket, key, timeout: Optional[float] = None):
+    response = await _request("GetObject", "GET", bucket, key, stream=True, timeout=timeout)
+    try:
+        data = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await response.aclose()
+    return data, _metadata(response)
+
+# Streams the body in fixed size chunks so memory stays bounded regardless of object size.
+# Range and conditional headers are forwarded to R2, so a 304 never transfers the body.
+async def get_object_stream(
+    bucket,
+    key,
+    range_header: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since=None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    timeout: Optional[float] = None,
+):
+    headers = {}
+    if range_header:
+        headers["Range"] = range_header
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    elif if_modified_since:
+        headers["If-Modified-Since"] = format_datetime(if_modified_since.astimezone(timezone.utc), usegmt=True)
+
+    response = await _request("GetObject", "GET", bucket, key, headers=headers, stream=True, timeout=timeout)
+
+    async def _iter_body():
+        try:
+            async for chunk in response.aiter_raw(chunk_size):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    return _iter_body(), _metadata(response)
+
+async def head_object(bucket, key, timeout: Optional[float] = None) -> dict:
+    response = await _request("HeadObject", "HEAD", bucket, key, timeout=timeout)
+    return _metadata(response)
+
+async def delete_object(bucket, key, timeout: Optional[float] = None):
+    await _request("DeleteObject", "DELETE", bucket, key, timeout=timeout)
+
+async def delete_objects(bucket, keys, timeout: Optional[float] = None) -> dict:
+    """
+    Deletes keys with DeleteObjects, DELETE_OBJECTS_MAX_KEYS per request. Returns
+    {"deleted": [keys], "errors": [{"key", "code", "message"}]}, deleting a missing key is not an error.
+    """
+    keys = list(dict.fromkeys(k for k in keys if k))
+    batches = [keys[i:i + DELETE_OBJECTS_MAX_KEYS] for i in range(0, len(keys), DELETE_OBJECTS_MAX_KEYS)]
+    results = await asyncio.gather(*(_delete_batch(bucket, batch, timeout) for batch in batches), return_exceptions=True)
+    deleted, errors = [], []
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            code = result.response["Error"]["Code"] if isinstance(result, ClientError) else type(result).__name__
+            errors.extend({"key": key, "code": code, "message": str(result)} for key in batch)
+            continue
+        failed = {e["key"] for e in result}
+        errors.extend(result)
+        deleted.extend(key for key in batch if key not in failed)
+    return {"deleted": deleted, "errors": errors}
+
+async def _delete_batch(bucket, keys: list, timeout) -> list:
+    # Quiet mode: the response only lists the keys that failed
+    root = ET.Element("Delete")
+    ET.SubElement(root, "Quiet").text = "true"
+    for key in keys:
+        ET.SubElement(ET.SubElement(root, "Object"), "Key").text = key
+    body = ET.tostring(root, encoding="utf-8")
+
+    response = await _request(
+        "DeleteObjects",
+        "POST",
+        bucket,
+        params={"delete": ""},
+        # S3 requires a body checksum on DeleteObjects
+        headers={"Content-Type": "application/xml", "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode()},
+        body=body,
+        timeout=timeout,
+    )
+    errors = []
+    for el in ET.fromstring(response.content).iter():
+        if el.tag.rsplit("}", 1)[-1] == "Error":
+            errors.append({"key": _xml_text(el, "Key"), "code": _xml_text(el, "Code"), "message": _xml_text(el, "Message")})
+    return errors
+
+# Multipart uploads driven by a client through presigned part URLs
+async def create_multipart_upload(bucket, key, content_type=None, timeout: Optional[float] = None) -> str:
+    return await _create_multipart_upload(bucket, key, _extra_headers(content_type), timeout)
+
+async def complete_multipart_upload(bucket, key, upload_id: str, parts: list, timeout: Optional[float] = None):
+    return await _complete_multipart_upload(bucket, key, upload_id, parts, timeout)
+
+async def abort_multipart_upload(bucket, key, upload_id: str, timeout: Optional[float] = None):
+    await _request("AbortMultipartUpload", "DELETE", bucket, key, params={"uploadId": upload_id}, timeout=timeout)
+
+async def _create_multipart_upload(bucket, key, headers, timeout) -> str:
+    response = await _request("CreateMultipartUpload", "POST", bucket, key, params={"uploads": ""}, headers=headers, body=b"", timeout=timeout)
+    return _xml_text(ET.fromstring(response.content), "UploadId")
+
+async def _upload_part(bucket, key, upload_id, part_number, data, timeout, length: Optional[int] = None) -> dict:
+    # data is bytes, or a streamed body (see _file_body) of the given length
+    response = await _request(
+        "UploadPart",
+        "PUT",
+        bucket,
+        key,
+        params={"partNumber": part_number, "uploadId": upload_id},
+        headers={"Content-Length": str(length)} if length is not None else None,
+        body=data,
+        timeout=timeout,
+    )
+    return {"PartNumber": part_number, "ETag": response.headers.get("etag")}
+
+async def _complete_multipart_upload(bucket, key, upload_id, parts, timeout):
+    root = ET.Element("CompleteMultipartUpload")
+    for part in parts:
+        el = ET.SubElement(root, "Part")
+        ET.SubElement(el, "PartNumber").text = str(part["PartNumber"])
+        ET.SubElement(el, "ETag").text = part["ETag"]
+
+    response = await _request(
+        "CompleteMultipartUpload",
+        "POST",
+        bucket,
+        key,
+        params={"uploadId": upload_id},
+        headers={"Content-Type": "application/xml"},
+        body=ET.tostring(root),
+        timeout=timeout,
+    )
+    body = response.content
+    # CompleteMultipartUpload can fail with a 200 status and an error document
+    root = ET.fromstring(body)
+    if root.tag.rsplit("}", 1)[-1] == "Error":
+        raise _client_error(response, "CompleteMultipartUpload", body)
+    return _xml_text(root, "ETag")
 
 def generate_presigned_get_url(key:str, expires_in: int = 3600) -> str:
-    return s3_client.generate_presigned_url(
+    return get_s3_client().generate_presigned_url(
         "get_object",
         Params={"Bucket": R2_BUCKET, "Key":key},
         ExpiresIn=expires_in
     )
 
-def generate_presigned_put_url(key:str, expires_in: int=3600) -> str:
-    return s3_client.generate_presigned_url(
+# content_type / content_length are signed into the URL, so the client has to send exactly those headers
+def generate_presigned_put_url(key:str, expires_in: int=3600, content_type: Optional[str]=None, content_length: Optional[int]=None) -> str:
+    params = {"Bucket": R2_BUCKET, "Key":key}
+    if content_type:
+        params["ContentType"] = content_type
+    if content_length is not None:
+        params["ContentLength"] = content_length
+    return get_s3_client().generate_presigned_url(
         "put_object",
-        Params={"Bucket": R2_BUCKET, "Key":key},
+        Params=params,
+        ExpiresIn=expires_in
+    )
+
+def generate_presigned_part_url(key:str, upload_id: str, part_number: int, expires_in: int=3600) -> str:
+    return get_s3_client().generate_presigned_url(
+        "upload_part",
+        Params={"Bucket": R2_BUCKET, "Key":key, "UploadId": upload_id, "PartNumber": part_number},
         ExpiresIn=expires_in
     )
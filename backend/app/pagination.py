@@ -0,0 +1,57 @@
+import json
+import base64
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException
+
+# Keyset pagination over (sort field desc, _id desc). The cursor is the position of the last
+# returned document, so every page is an index seek from that point instead of skipping over
+# all the previous pages, and posts published mid-scroll don't shift later pages.
+# Cursors are opaque base64 JSON, returned in the X-Next-Cursor response header.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(doc: dict, field: str) -> str:
+    value = doc.get(field)
+    payload = {
+        "f": field,
+        "v": value.isoformat() if isinstance(value, datetime) else None,
+        "id": str(doc["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, field: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["f"] != field:
+            raise ValueError("cursor belongs to another listing")
+        value = datetime.fromisoformat(payload["v"]) if payload["v"] is not None else None
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: str) -> dict:
+    """Documents strictly after the cursor in (field desc, _id desc) order. Missing values sort last."""
+    value, oid = decode_cursor(cursor, field)
+    if value is None:
+        return {field: None, "_id": {"$lt": oid}}
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": oid}},
+        {field: None},
+    ]}
+
+
+def sort_spec(field: str) -> list:
+    return [(field, -1), ("_id", -1)]
+
+
+def next_cursor(docs: list, limit: int, field: str) -> Optional[str]:
+    # A short page is the last one
+    if not docs or len(docs) < limit:
+        return None
+    return encode_cursor(docs[-1], field)
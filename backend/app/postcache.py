@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+
+from db import MONGO_PUBLIC_MAX_STALENESS
+
+# Read-through cache for the public post endpoints. Values are the JSON-ready response
+# bodies. Single posts are cached under their slug and id and deleted by the admin mutations
+# that touch them. Every list key embeds a generation number which any post mutation bumps,
+# so all cached listings (tag, search, cursor pages...) are dropped at once without having to
+# know which of them contained the post. Concurrent misses for one key share a single load.
+#
+# POST_CACHE_URL=redis://... switches to a Redis compatible server (Redis, Valkey, KeyDB...)
+# shared by all workers, otherwise each process keeps an in-memory LRU. An invalidation only
+# reaches the process that ran it, so with more than one worker POST_CACHE_URL is required
+# for edits to show up before POST_CACHE_TTL runs out.
+
+POST_CACHE_URL = os.environ.get("POST_CACHE_URL")
+POST_CACHE_TTL = float(os.environ.get("POST_CACHE_TTL", 300))
+POST_CACHE_SIZE = int(os.environ.get("POST_CACHE_SIZE", 1024))
+POST_CACHE_PREFIX = os.environ.get("POST_CACHE_PREFIX", "blog:")
+# How long a Redis loader holds the key's lock, other workers wait on the cache meanwhile
+POST_CACHE_LOCK_TTL = float(os.environ.get("POST_CACHE_LOCK_TTL", 5))
+# After an invalidation, refills read the primary for this long: a secondary may lag by up to
+# the max staleness (plus a heartbeat) and would put the pre-edit post back for a whole TTL
+POST_CACHE_PRIMARY_WINDOW = float(os.environ.get("POST_CACHE_PRIMARY_WINDOW", MONGO_PUBLIC_MAX_STALENESS + 10))
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_entries: int = POST_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def acquire_lock(self, key: str, ttl: float) -> bool:
+        # Loads are already coalesced in process, there is nobody else to lock out
+        return True
+
+    async def release_lock(self, key: str):
+        pass
+
+    async def close(self):
+        pass
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str):
+        raw = await self._redis.get(key)
+        return _MISSING if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value, ttl: float):
+        await self._redis.set(key, json.dumps(value, separators=(",", ":")), px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def counter(self, key: str) -> int:
+        return int(await self._redis.get(key) or 0)
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+    async def acquire_lock(self, key: str, ttl: float) -> bool:
+        return bool(await self._redis.set(f"{key}:lock", b"1", nx=True, px=int(ttl * 1000)))
+
+    async def release_lock(self, key: str):
+        await self._redis.delete(f"{key}:lock")
+
+    async def close(self):
+        await self._redis.aclose()
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def _worker_count() -> int:
+    # uvicorn and gunicorn both read WEB_CONCURRENCY as their worker count
+    try:
+        return int(os.environ.get("WEB_CONCURRENCY") or 1)
+    except ValueError:
+        return 1
+
+
+def make_backend():
+    if POST_CACHE_URL:
+        try:
+            return RedisBackend(POST_CACHE_URL)
+        except ImportError:
+            print("POST_CACHE_URL is set but the redis package is not installed (uv sync --extra redis), using the in-memory post cache")
+    if _worker_count() > 1:
+        # Invalidation only reaches the worker that handled the admin edit
+        print(f"Post cache is per worker with {_worker_count()} workers, other workers may serve edited posts "
+              f"for up to POST_CACHE_TTL ({POST_CACHE_TTL:g}s). Set POST_CACHE_URL to share one cache")
+    return MemoryBackend()
+
+
+class PostCache:
+    def __init__(
+        self,
+        backend,
+        ttl: float = POST_CACHE_TTL,
+        prefix: str = POST_CACHE_PREFIX,
+        primary_window: float = POST_CACHE_PRIMARY_WINDOW,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.primary_window = primary_window
+        self._inflight = {}
+        self._epoch = 0
+        self._invalidated_at = None
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0, "errors": 0}
+
+    def slug_key(self, slug: str) -> str:
+        return f"{self.prefix}post:slug:{slug}"
+
+    def id_key(self, post_id: str) -> str:
+        return f"{self.prefix}post:id:{post_id}"
+
+    async def list_key(self, params: dict) -> str:
+        generation = await self.backend.counter(f"{self.prefix}posts:gen")
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{self.prefix}posts:{generation}:{digest}"
+
+    async def get_or_load(self, key: str, loader, ttl: Optional[float] = None):
+        """Cached value for key, or loader()'s result which is stored unless it is None."""
+        value = await self._get(key)
+        if value is not _MISSING:
+            self._counters["hits"] += 1
+            return value
+
+        # Singleflight: the first miss loads, concurrent misses for the key await its result
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._counters["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        self._counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, loader, ttl or self.ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters get it, avoid "never retrieved" when there are none
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load(self, key: str, loader, ttl: float):
+        # Across processes (Redis) one worker loads while the others poll the cache briefly
+        locked = await self._acquire(key)
+        if not locked:
+            deadline = time.monotonic() + POST_CACHE_LOCK_TTL
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                value = await self._get(key)
+                if value is not _MISSING:
+                    return value
+        try:
+            epoch = self._epoch
+            value = jsonable_encoder(await loader())
+            # Not stored if an invalidation ran while loading, the value may predate it
+            if value is not None and epoch == self._epoch:
+                await self._set(key, value, ttl)
+            return value
+        finally:
+            if locked:
+                await self._release(key)
+
+    async def invalidate_post(self, post: Optional[dict], *slugs: str):
+        """Drops a post's slug / id entries (plus any extra, e.g. previous, slugs) and every listing."""
+        self._epoch += 1
+        keys = [self.slug_key(s) for s in slugs if s]
+        if post:
+            if post.get("slug"):
+                keys.append(self.slug_key(post["slug"]))
+            if post.get("_id") is not None:
+                keys.append(self.id_key(str(post["_id"])))
+        self._invalidated_at = time.monotonic()
+        try:
+            await self.backend.delete(*keys)
+            await self.backend.incr(f"{self.prefix}posts:gen")
+            if self.backend.shared:
+                await self.backend.set(f"{self.prefix}posts:invalidated", 1, self.primary_window)
+        except Exception as e:
+            # A failed invalidation leaves stale entries for at most one TTL
+            self._counters["errors"] += 1
+            print(f"Post cache invalidation failed: {e}")
+        self._counters["invalidations"] += 1
+
+    async def recently_invalidated(self) -> bool:
+        """True for primary_window seconds after an invalidation, by this or (shared backend) any worker."""
+        if self._invalidated_at is not None and time.monotonic() - self._invalidated_at < self.primary_window:
+            return True
+        if not self.backend.shared:
+            return False
+        return await self._get(f"{self.prefix}posts:invalidated") is not _MISSING
+
+    # Cache backend errors degrade to a miss rather than failing the request
+    async def _get(self, key: str):
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            self._counters["errors"] += 1
+            print(f"Post cache get failed: {e}")
+            return _MISSING
+
+    async def _set(self, key: str, value, ttl: float):
+        try:
+            await self.backend.set(key, value, ttl)
+        except Exception as e:
+            self._counters["errors"] += 1
+            print(f"Post cache set failed: {e}")
+
+    async def _acquire(self, key: str) -> bool:
+        try:
+            return await self.backend.acquire_lock(key, POST_CACHE_LOCK_TTL)
+        except Exception:
+            return True
+
+    async def _release(self, key: str):
+        try:
+            await self.backend.release_lock(key)
+        except Exception:
+            pass
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "inflight": len(self._inflight),
+        }
+
+
+post_cache = PostCache(make_backend())
@@ -0,0 +1,307 @@
+import os
+import gzip
+import html
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from urllib.parse import quote
+from uuid import uuid4
+import brotli
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+import links
+from db import db
+from blobs import keys_still_used
+from objectstore import R2_BUCKET, get_object, put_object_from_bytes, delete_objects
+from objectcache import object_cache, asset_doc_cache
+from postcache import post_cache
+from signing import link_signer
+from references import reconcile_post_assets
+
+# Publish pipeline: when a post is published its page is rendered once (the uploaded HTML
+# when there is one, else the post body in a minimal page) and stored in R2 as-is plus
+# gzip / brotli encoded, under published/{post_id}.html[.gz|.br]. The post's HTML asset
+# records them in `encodings` and get_asset serves the one matching Accept-Encoding, so
+# pages are never compressed per request.
+#
+# Asset links (/api/assets/{id}, how Froala images are inserted) are rewritten at publish time
+# to point straight at the object store, so readers load images without going through the API:
+# R2_PUBLIC_BASE (custom domain or r2.dev URL of the bucket) when set, else presigned URLs,
+# which are re-signed by republishing the post before they expire.
+
+PUBLISHED_PREFIX = "published"
+PUBLISH_GZIP_LEVEL = int(os.environ.get("PUBLISH_GZIP_LEVEL", 9))
+PUBLISH_BROTLI_QUALITY = int(os.environ.get("PUBLISH_BROTLI_QUALITY", 11))
+HTML_MIME = "text/html"
+# Preferred first. Identity is always stored and is the fallback
+ENCODING_PREFERENCE = ("br", "gzip")
+ENCODING_SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+R2_PUBLIC_BASE = os.environ.get("R2_PUBLIC_BASE", "").rstrip("/")
+# 7 days is the longest a SigV4 presigned URL can live
+PUBLISH_SIGNED_LINK_TTL = int(os.environ.get("PUBLISH_SIGNED_LINK_TTL", 7 * 24 * 3600))
+PUBLISH_LINK_REFRESH = int(os.environ.get("PUBLISH_LINK_REFRESH", 24 * 3600))
+# How long a worker's claim on refreshing a post holds off the others, a failed refresh is retried after it
+PUBLISH_REFRESH_CLAIM = int(os.environ.get("PUBLISH_REFRESH_CLAIM", 300))
+# Variants listed in an <img srcset>, first format present wins (no <picture> to negotiate with)
+SRCSET_MIME_PREFERENCE = ("image/webp", "image/jpeg")
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<meta name="description" content="{summary}">
+</head>
+<body>
+<article>
+<h1>{title}</h1>
+{body}
+</article>
+</body>
+</html>
+"""
+
+
+def object_link(key: str) -> tuple:
+    """(URL readers fetch an object from without the backend in between, its expiry or None)."""
+    if R2_PUBLIC_BASE:
+        return f"{R2_PUBLIC_BASE}/{quote(key)}", None
+    # Reused signatures keep enough time that the page isn't due for a refresh right away
+    return link_signer.link(key, PUBLISH_SIGNED_LINK_TTL, min_remaining=2 * PUBLISH_LINK_REFRESH)
+
+
+def _asset_link(asset: dict) -> dict:
+    url, expires_at = object_link(asset.get("blob_key") or asset["path"])
+    link = {"url": url, "expires_at": expires_at}
+    for mime in SRCSET_MIME_PREFERENCE:
+        variants = sorted((v for v in asset.get("variants") or [] if v.get("mime") == mime), key=lambda v: v["width"])
+        if variants:
+            sized = []
+            for variant in variants:
+                url, variant_expires_at = object_link(variant["key"])
+                sized.append((variant["width"], url))
+                if variant_expires_at and variant_expires_at < expires_at:
+                    expires_at = variant_expires_at
+            link.update(srcset=", ".join(f"{url} {width}w" for width, url in sized), variants=sized, expires_at=expires_at)
+            break
+    return link
+
+
+async def resolve_asset_links(*markups: str) -> dict:
+    """{asset_id: {"url", "srcset", "variants", "expires_at"}} for the assets linked from the markups."""
+    ids = set().union(*(links.asset_ids(m) for m in markups if m))
+    if not ids:
+        return {}
+    # Direct uploads still being processed move to another key, they keep the API link
+    # until processing republishes the post
+    cursor = db.assets.find(
+        {"asset_id": {"$in": list(ids)}, "processing": {"$ne": "pending"}},
+        {"_id": 0, "asset_id": 1, "path": 1, "blob_key": 1, "variants": 1},
+    )
+    return {asset["asset_id"]: _asset_link(asset) async for asset in cursor}
+
+
+def links_need_refresh(doc: Optional[dict]) -> bool:
+    """Whether a published page's signed links expire soon and it should be republished."""
+    expires_at = (doc or {}).get("links_expire_at")
+    if not expires_at:
+        return False
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at - datetime.now(timezone.utc) < timedelta(seconds=PUBLISH_LINK_REFRESH)
+
+
+_refreshing = set()
+
+
+async def claim_refresh(post_id: str) -> Optional[dict]:
+    """
+    The published post, claimed for PUBLISH_REFRESH_CLAIM seconds, unless another worker
+    claimed it within that time (then None). The claim isn't released, fresh links don't
+    need refreshing again that soon.
+    """
+    now = datetime.now(timezone.utc)
+    return await db.posts.find_one_and_update(
+        {"_id": ObjectId(post_id), "status": "published", "refresh_claimed_until": {"$not": {"$gt": now}}},
+        {"$set": {"refresh_claimed_until": now + timedelta(seconds=PUBLISH_REFRESH_CLAIM)}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def schedule_refresh(post_id: str):
+    """Republishes the post in the background, once per process at a time and once across workers."""
+    if post_id in _refreshing:
+        return
+    _refreshing.add(post_id)
+
+    async def _refresh():
+        try:
+            post = await claim_refresh(post_id)
+            if post and await publish_post(post) is not None:
+                await post_cache.invalidate_post(post)
+        except Exception as e:
+            print(f"Refreshing links of post {post_id} failed: {str(e)}")
+        finally:
+            _refreshing.discard(post_id)
+
+    asyncio.get_running_loop().create_task(_refresh())
+
+
+def render_page(post: dict, source: Optional[bytes] = None) -> bytes:
+    """The final page HTML: the uploaded page when given, else the post body in PAGE_TEMPLATE."""
+    if source is not None:
+        return source
+    return PAGE_TEMPLATE.format(
+        title=html.escape(post.get("title") or ""),
+        summary=html.escape(post.get("summary") or ""),
+        body=post.get("body") or "",
+    ).encode("utf-8")
+
+
+def encode_page(data: bytes) -> dict:
+    """{encoding: bytes} for the page, encodings that don't make it smaller are left out."""
+    out = {"identity": data}
+    candidates = {
+        "gzip": lambda: gzip.compress(data, compresslevel=PUBLISH_GZIP_LEVEL, mtime=0),
+        "br": lambda: brotli.compress(data, mode=brotli.MODE_TEXT, quality=PUBLISH_BROTLI_QUALITY),
+    }
+    for name, compress in candidates.items():
+        encoded = compress()
+        if len(encoded) < len(data):
+            out[name] = encoded
+    return out
+
+
+def pick_encoding(accept_encoding: Optional[str], available) -> str:
+    """Best stored encoding the client accepts (q > 0), identity otherwise."""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted["gzip" if name == "x-gzip" else name] = q
+
+    for name in ENCODING_PREFERENCE:
+        if name in available and accepted.get(name, accepted.get("*", 0.0)) > 0:
+            return name
+    return "identity"
+
+
+def page_key(post_id: str, encoding: str = "identity") -> str:
+    return f"{PUBLISHED_PREFIX}/{post_id}.html{ENCODING_SUFFIXES[encoding]}"
+
+
+async def _source_html(asset: Optional[dict]) -> Optional[bytes]:
+    # Uploaded HTML assets are rendered from their original object
+    if not asset or asset["path"].startswith(f"{PUBLISHED_PREFIX}/"):
+        return None
+    data, _ = await get_object(R2_BUCKET, asset["path"])
+    return data
+
+
+async def publish_post(post: dict) -> Optional[dict]:
+    """
+    Reconciles the post's image references, then renders and stores its page with its
+    encodings and records them on the post's HTML asset (created when the post has none).
+    Best effort: on failure the page keeps being served from what is stored, and None is returned.
+    """
+    post_id = str(post["_id"])
+    try:
+        await reconcile_post_assets(post)
+    except Exception as e:
+        print(f"Reconciling assets of post {post_id} failed: {str(e)}")
+    try:
+        asset = await db.assets.find_one({"asset_id": post["html_asset_id"]}) if post.get("html_asset_id") else None
+        source = await _source_html(asset)
+        try:
+            source_text = source.decode("utf-8") if source is not None else None
+        except UnicodeDecodeError:
+            source_text = None
+        resolved = await resolve_asset_links(post.get("body"), source_text)
+        body = links.rewrite_asset_links(post.get("body") or "", resolved.get)
+        if source_text is not None:
+            source = links.rewrite_asset_links(source_text, resolved.get).encode("utf-8")
+        page = render_page({**post, "body": body}, source)
+        encoded = await asyncio.to_thread(encode_page, page)
+
+        async def _store(encoding: str, data: bytes) -> dict:
+            key = page_key(post_id, encoding)
+            etag = await put_object_from_bytes(data, R2_BUCKET, key, content_type=HTML_MIME)
+            object_cache.invalidate(key)
+            return {"key": key, "size": len(data), "etag": etag}
+
+        stored = await asyncio.gather(*(_store(name, data) for name, data in encoded.items()))
+        encodings = dict(zip(encoded, stored))
+    except Exception as e:
+        print(f"Publishing post {post_id} failed: {str(e)}")
+        return None
+
+    now = datetime.now(timezone.utc)
+    links_expire_at = min((link["expires_at"] for link in resolved.values() if link["expires_at"]), default=None)
+    # The public API serves the rewritten body too, the editor keeps working on `body`
+    await db.posts.update_one({"_id": post["_id"]}, {"$set": {"published_body": body, "links_expire_at": links_expire_at}})
+    if asset:
+        update = {"encodings": encodings, "links_expire_at": links_expire_at, "updated_at": now}
+        if asset["path"] == encodings["identity"]["key"]:
+            update.update(size=encodings["identity"]["size"], etag=encodings["identity"]["etag"])
+        await db.assets.update_one({"asset_id": asset["asset_id"]}, {"$set": update})
+    else:
+        # Posts without uploaded HTML get an asset for the rendered page
+        identity = encodings["identity"]
+        await db.assets.update_one({"path": identity["key"]}, {
+            "$set": {
+                "filename": f"{post.get('slug') or post_id}.html",
+                "mime": HTML_MIME,
+                "size": identity["size"],
+                "etag": identity["etag"],
+                "post_id": post_id,
+                "used_by_post": True,
+                "variants": [],
+                "encodings": encodings,
+                "links_expire_at": links_expire_at,
+                "updated_at": now,
+            },
+            "$setOnInsert": {"asset_id": uuid4().hex, "path": identity["key"], "created_at": now},
+        }, upsert=True)
+        asset = await db.assets.find_one({"path": identity["key"]})
+        await db.posts.update_one({"_id": post["_id"]}, {"$set": {"html_asset_id": asset["asset_id"], "html_key": identity["key"]}})
+
+    asset_doc_cache.invalidate(asset["asset_id"])
+    try:
+        await _retire_page_assets(asset["asset_id"], encodings)
+    except Exception as e:
+        print(f"Retiring old page assets of post {post_id} failed: {str(e)}")
+    return encodings
+
+
+async def _retire_page_assets(asset_id: str, encodings: dict):
+    # Earlier HTML assets of the post (the page rendered from the body before HTML was uploaded,
+    # an upload under a previous slug) point at the same page objects. They are dropped with
+    # their own uploaded source rather than left for the asset GC to find
+    page_keys = [stored["key"] for stored in encodings.values()]
+    old = await db.assets.find(
+        {"$or": [{"path": {"$in": page_keys}}, {"encodings.identity.key": encodings["identity"]["key"]}], "asset_id": {"$ne": asset_id}},
+        {"_id": 0, "asset_id": 1, "path": 1},
+    ).to_list(length=None)
+    if not old:
+        return
+    await db.assets.delete_many({"asset_id": {"$in": [a["asset_id"] for a in old]}})
+    for retired in old:
+        asset_doc_cache.invalidate(retired["asset_id"])
+    sources = [a["path"] for a in old if a["path"] not in page_keys]
+    in_use = await keys_still_used(sources)
+    sources = [key for key in sources if key not in in_use]
+    if sources:
+        result = await delete_objects(R2_BUCKET, sources)
+        for key in result["deleted"]:
+            object_cache.invalidate(key)
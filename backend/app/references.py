@@ -0,0 +1,69 @@
+from pymongo import UpdateMany
+
+import links
+from db import db
+
+# Keeps a post's Froala image lists in step with its body. Uploads only ever append to
+# froala_asset_id_list / froala_image_key_list, so on save and publish the lists are rebuilt
+# from the /api/assets/{id} links the body actually contains, and assets.used_by_post is
+# updated for the images that came and went. Keys in the list that belong to no asset
+# (posts from before asset docs) are kept, permanent delete still needs them.
+
+
+def _asset_key(asset: dict) -> str:
+    return asset.get("blob_key") or asset["path"]
+
+
+async def reconcile_post_assets(post: dict) -> dict:
+    """
+    Rewrites the post's froala lists to the assets linked from its body. Returns
+    {"added": [ids], "removed": [ids]}, nothing is written when the lists are already right.
+    """
+    body_ids = links.asset_ids(post.get("body") or "")
+    stored_ids = post.get("froala_asset_id_list") or []
+    stored_keys = post.get("froala_image_key_list") or []
+    if not isinstance(stored_keys, list):
+        stored_keys = [stored_keys]
+
+    assets = {}
+    query = {"$or": [
+        {"asset_id": {"$in": list({*body_ids, *stored_ids})}},
+        {"path": {"$in": stored_keys}},
+        {"blob_key": {"$in": stored_keys}},
+    ]}
+    async for asset in db.assets.find(query, {"_id": 0, "asset_id": 1, "path": 1, "blob_key": 1}):
+        assets[asset["asset_id"]] = asset
+
+    ids = [i for i in body_ids if i in assets]
+    owned = {key for asset in assets.values() for key in (asset["path"], asset.get("blob_key")) if key}
+    keys = list(dict.fromkeys([*(_asset_key(assets[i]) for i in ids), *(k for k in stored_keys if k not in owned)]))
+    if ids == stored_ids and keys == stored_keys:
+        return {"added": [], "removed": []}
+
+    stored, current = set(stored_ids), set(ids)
+    added = [i for i in ids if i not in stored]
+    removed = [i for i in dict.fromkeys(stored_ids) if i not in current]
+    await db.posts.update_one(
+        {"_id": post["_id"]},
+        {"$set": {"froala_asset_id_list": ids, "froala_image_key_list": keys}},
+    )
+
+    # Removed images stay in use while another post, or this post's cover / page, refers to them
+    if removed:
+        still_used = set(await db.posts.distinct(
+            "froala_asset_id_list", {"froala_asset_id_list": {"$in": removed}, "_id": {"$ne": post["_id"]}},
+        ))
+        still_used.update([post.get("cover_asset_id"), post.get("html_asset_id")])
+        unused = [i for i in removed if i not in still_used]
+    else:
+        unused = []
+    ops = []
+    if added:
+        ops.append(UpdateMany({"asset_id": {"$in": added}}, {"$set": {"used_by_post": True}}))
+    if unused:
+        ops.append(UpdateMany({"asset_id": {"$in": unused}}, {"$set": {"used_by_post": False}}))
+    if ops:
+        await db.assets.bulk_write(ops, ordered=False)
+
+    post["froala_asset_id_list"], post["froala_image_key_list"] = ids, keys
+    return {"added": added, "removed": removed}
@@ -12,19 +12,17 @@ import httpx
 from typing import Optional
 from pymongo import ReturnDocument
 import asyncio
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from concurrent.futures import ProcessPoolExecutor
 
+from api_limiter import limiter
 from deps import require_admin
 from db import db, doc_fix_ids
 from utils import compress_image
-from objectstore import R2_BUCKET, upload_fileobj, generate_presigned_get_url, put_object_from_bytes, s3_client
+from workers import image_pool
+from signing import link_signer
+from objectstore import R2_BUCKET, put_object_from_bytes, get_object, delete_object
 
 router = APIRouter()
 
-limiter = Limiter(key_func=get_remote_address)
-
 UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "./uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 HTML_UPLOAD_SUBDIR = "html"
@@ -33,7 +31,6 @@ ALLOWED_CONTENT_TYPES = {"image/png", "image/jpeg", "image/jpg", "image/gif", "i
 MAX_UPLOAD_FILE_SIZE = 10*1024*1024
 MAX_SAVE_FILE_SIZE = 1*1024*1024
 NPX_SERVER_URL = "http://127.0.0.1:8001"
-PROCESS_POOL = ProcessPoolExecutor(max_workers=2)
 
 
 @router.post("/assets")
@@ -67,8 +64,7 @@ async def upload_assets(
 
     try:
         if orig_size > MAX_SAVE_FILE_SIZE:
-            loop = asyncio.get_running_loop()
-            compressed = await loop.run_in_executor(PROCESS_POOL, compress_image, contents, MAX_SAVE_FILE_SIZE)
+            compressed, _ = await image_pool.run(compress_image, contents, MAX_SAVE_FILE_SIZE)
             final_bytes = compressed
             final_mime = "image/jpeg"
             ext = ".jpg"
@@ -94,7 +90,7 @@ async def upload_assets(
     except Exception as e:
         raise HTTPException(status_code=500, detail="Upload Failed") from e
     
-    public_url = generate_presigned_get_url(key=stored_path)
+    public_url = link_signer.url(stored_path, 3600)
 
     #Insert Metadata into DB
     now = datetime.now(timezone.utc)
@@ -115,8 +111,7 @@ async def upload_assets(
         result = await db.assets.insert_one(doc)
 
     except Exception:
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda: s3_client.delete_object(R2_BUCKET, Key=stored_path))
+        await delete_object(R2_BUCKET, stored_path)
         raise HTTPException(status_code=500, detail="Failed to save Metadata")
 
     asset_id_str = str(result.inserted_id)
@@ -181,20 +176,20 @@ async def upload_assets(
 
 @router.get("/assets/html/{slug}")
 @limiter.limit("10/minute")
-async def serve_html(slug : str):
+async def serve_html(request: Request, slug : str):
 
     filename = f"{slug}-post.html"
     key = f"html/{filename}"
     # Searching in db is not needed in most cases
 
     try:
-        loop = asyncio.get_running_loop()
-        response = await loop.run_in_executor(None, lambda: s3_client.get_object(R2_BUCKET, key))
-        html_bytes = response["Body"].read()
+        html_bytes, _ = await get_object(R2_BUCKET, key)
         html_content = html_bytes.decode("utf-8")
 
-    except s3_client.exceptions.NoSuchKey:
-        raise HTTPException(status_code=404, detail="HTML file not found in storage")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            raise HTTPException(status_code=404, detail="HTML file not found in storage")
+        raise HTTPException(status_code=502, detail=f"Error fetching HTML from storage: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error fetching HTML from storage: {str(e)}")
 
@@ -246,7 +241,7 @@ async def upload_html_asset(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload Failed: {str(e)}") from e
     
-    public_url = generate_presigned_get_url(key=stored_path)
+    public_url = link_signer.url(stored_path, 3600)
 
     now = datetime.now(timezone.utc)
     doc = {
@@ -297,8 +292,7 @@ async def upload_html_asset(
         
     except Exception as e:
         try:
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, lambda: s3_client.delete_object(R2_BUCKET, stored_path))
+            await delete_object(R2_BUCKET, stored_path)
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=f"Failed to save metadata: {str(e)}") from e
@@ -343,8 +337,7 @@ async def delete_asset(asset_id: str, admin=Depends(require_admin)):
         raise HTTPException(status_code=404, detail="Asset not found")
 
     key = asset["path"]
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, lambda:s3_client.delete_object(R2_BUCKET, key))
+    await delete_object(R2_BUCKET, key)
     now = datetime.now(timezone.utc)
 
     await db.assets.delete_one({"asset_id": asset_id})
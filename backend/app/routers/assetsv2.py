@@ -1,14 +1,15 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Form, Response, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Form, Response, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from botocore.exceptions import ClientError
 from uuid import uuid4
 from pymongo.errors import DuplicateKeyError
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from pathlib import Path
+from email.utils import format_datetime, parsedate_to_datetime
 import asyncio
+import math
 import os
 from bson import ObjectId
-from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 
 from api_limiter import limiter
@@ -16,26 +17,50 @@ from deps import require_admin
 from db import db
 from objectstore import (
     put_object_from_bytes,
-    generate_presigned_get_url,
-    s3_client,
+    put_object_file,
+    generate_presigned_put_url,
+    generate_presigned_part_url,
+    create_multipart_upload,
+    complete_multipart_upload,
+    get_object,
+    get_object_stream,
+    head_object,
+    delete_object,
+    delete_objects,
+    STREAM_CHUNK_SIZE,
+    MULTIPART_PART_SIZE,
 )
-from utils import compress_image
+from objectcache import object_cache, asset_doc_cache, CachedObject, CACHE_MAX_OBJECT_BYTES
+from utils import compress_image, make_variants
+from workers import image_pool, PoolSaturated
+from postcache import post_cache
+from signing import link_signer
+from assetgc import asset_collector, GC_GRACE_PERIOD
+from publish import publish_post, pick_encoding, links_need_refresh, schedule_refresh
+from links import BACKEND_BASE
+from blobs import acquire_blob, register_blob, release_asset
+from models import DirectUploadCreate, DirectUploadComplete
+from ingest import ingest_upload, ingest_stream, make_scratch_dir, remove_scratch_dir, UploadTooLarge
 
 R2_BUCKET= os.environ.get("R2_BUCKET")
 if not R2_BUCKET:
     raise RuntimeError("R2_BUCKET environment variable not set")
 
 router = APIRouter()
-#PROCESS_POOL = ProcessPoolExecutor(max_workers=2)
 
 IMAGE_PREFIX = "images"
 FROALA_PREFIX = "froala"
 HTML_PREFIX = "html"
 MAX_UPLOAD_BYTES = 10 * 1024 * 1024
 MAX_SAVE_BYTES = 1 * 1024 * 1024
+MAX_HTML_BYTES = int(os.environ.get("MAX_HTML_BYTES", 2 * 1024 * 1024))
 ALLOWED_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/gif"}
 ALLOWED_HTML_TYPES = {"text/html", "application/xhtml+xml"}
-BACKEND_BASE = os.environ.get("BACKEND_BASE", "http://localhost:8000")
+VARIANT_MIME_PREFERENCE = ("image/avif", "image/webp", "image/jpeg")
+DIRECT_UPLOAD_PREFIXES = {"image": IMAGE_PREFIX, "froala": FROALA_PREFIX}
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get("DIRECT_UPLOAD_MAX_BYTES", 100 * 1024 * 1024))
+DIRECT_UPLOAD_URL_TTL = int(os.environ.get("DIRECT_UPLOAD_URL_TTL", 3600))
+DIRECT_PROCESS_RETRIES = 5
 
 def _now():
     return datetime.now(timezone.utc)
@@ -56,6 +81,14 @@ async def save_asset_doc(doc: dict, uid=None):
             "post_id": doc.get("post_id"),
             "used_by_post": doc.get("used_by_post", False),
             "public_link": doc.get("public_link"),
+            "etag": doc.get("etag"),
+            "sha256": doc.get("sha256"),
+            "blob_id": doc.get("blob_id"),
+            "blob_key": doc.get("blob_key"),
+            "processing": doc.get("processing"),
+            "compression": doc.get("compression"),
+            "variants": doc.get("variants", []),
+            "encodings": doc.get("encodings"),
             "updated_at": now,
         },
         "$setOnInsert": {
@@ -72,8 +105,167 @@ async def save_asset_doc(doc: dict, uid=None):
         raise RuntimeError("Upsert succeeded but document could not be fetched")
 
     return saved
+
+# Encodes width/format variants on the worker pool and stores them under derived keys.
+# Variants are best effort, the original is always kept and served as a fallback.
+# The worker reads the ingested file and writes variants to a scratch dir, so no image
+# bytes cross the process boundary
+async def store_variants(src_path: str, prefix: str, uid: str) -> list:
+    scratch = make_scratch_dir()
+    try:
+        return await _store_variants(src_path, prefix, uid, scratch)
+    finally:
+        await remove_scratch_dir(scratch)
+
+async def _store_variants(src_path: str, prefix: str, uid: str, scratch: str) -> list:
+    try:
+        variants = await image_pool.run(make_variants, src_path, out_dir=scratch)
+    except PoolSaturated:
+        print("Image worker pool is saturated, storing the original without variants")
+        return []
+    except Exception as e:
+        print(f"Failed to build image variants: {str(e)}")
+        return []
+
+    async def _put(variant):
+        key = f"{prefix}/variants/{uid}-w{variant['width']}.{variant['ext']}"
+        etag = await put_object_file(variant["path"], variant["size"], R2_BUCKET, key, content_type=variant["mime"])
+        return {
+            "key": key,
+            "width": variant["width"],
+            "height": variant["height"],
+            "mime": variant["mime"],
+            "size": variant["size"],
+            "etag": etag,
+        }
+
+    results = await asyncio.gather(*(_put(v) for v in variants), return_exceptions=True)
+    stored = []
+    for res in results:
+        if isinstance(res, Exception):
+            print(f"Failed to upload image variant: {str(res)}")
+        else:
+            stored.append(res)
+    return stored
     
 
+async def _ingest(file: UploadFile, max_bytes: int):
+    try:
+        return await ingest_upload(file, max_bytes)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File is too large")
+
+# Compresses (cover images only), builds variants and stores a new upload under a fresh key.
+# `stored` is the {"key", "etag"} of an original already in R2 (direct uploads), kept unless recompressed
+async def _store_image(upload, prefix: str, uid: str, compress: bool, stored: Optional[dict] = None) -> dict:
+    ext = Path(upload.filename or "").suffix or ".jpg"
+    final_mime = upload.content_type
+    final_bytes = None
+    compression = None
+
+    if compress and upload.size > MAX_SAVE_BYTES:
+        try:
+            final_bytes, compression = await image_pool.run(compress_image, upload.path, MAX_SAVE_BYTES)
+            final_mime = "image/jpeg"
+            ext = ".jpg"
+        except PoolSaturated:
+            raise HTTPException(status_code=503, detail="Image processing is busy, retry shortly", headers={"Retry-After": "5"})
+        except Exception as e:
+            print(f"Failed to compress image: {str(e)}")
+
+    key = f"{prefix}/{uid}{ext}"
+    variants = await store_variants(upload.path, prefix, uid)
+
+    #Upload to R2, the original is streamed from the ingest file when it wasn't recompressed
+    try:
+        if final_bytes is None and stored:
+            key, etag = stored["key"], stored["etag"]
+        elif final_bytes is not None:
+            etag = await put_object_from_bytes(final_bytes, R2_BUCKET, key, content_type=final_mime)
+        else:
+            etag = await put_object_file(upload.path, upload.size, R2_BUCKET, key, content_type=final_mime)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload Failed: {str(e)}")
+
+    return {
+        "key": key,
+        "mime": final_mime,
+        "size": len(final_bytes) if final_bytes is not None else upload.size,
+        "etag": etag,
+        "compression": compression,
+        "variants": variants,
+    }
+
+# Reuses the stored blob when identical content was uploaded before, otherwise stores it
+async def _ingest_image(file: UploadFile, prefix: str, uid: str, compress: bool) -> tuple:
+    upload = await _ingest(file, MAX_UPLOAD_BYTES)
+    try:
+        blob = await acquire_blob(prefix, upload.sha256)
+        if blob is None:
+            blob = await _store_image(upload, prefix, uid, compress)
+            blob = await register_blob(prefix, upload.sha256, blob)
+    finally:
+        await upload.cleanup()
+    return upload, blob
+
+async def _release_blob(blob: dict):
+    # Gives back the reference _ingest_image took when no asset ended up holding it
+    try:
+        keys = await release_asset({"blob_id": blob["_id"]})
+        if keys:
+            await delete_objects(R2_BUCKET, keys)
+    except Exception as e:
+        print(f"Failed to release blob {blob['_id']}: {str(e)}")
+
+async def _save_blob_asset(doc: dict, uid: str, blob: dict) -> dict:
+    try:
+        return await save_asset_doc(doc, uid)
+    except BaseException:
+        await _release_blob(blob)
+        raise
+
+def _blob_fields(blob: dict) -> dict:
+    return {
+        "blob_id": blob["_id"],
+        "blob_key": blob["key"],
+        "sha256": blob["sha256"],
+        "mime": blob["mime"],
+        "size": blob["size"],
+        "etag": blob["etag"],
+        "compression": blob.get("compression"),
+        "variants": blob.get("variants") or [],
+    }
+
+async def _attach_cover(post_id: str, asset_id: str, key: str, caption: Optional[str], now):
+    try:
+        oid = ObjectId(post_id)
+        await db.posts.update_one({"_id": oid}, {
+            "$set": {
+                "cover_asset_id": asset_id,
+                "updated_at": now,
+                "cover_image_key": key,
+                "cover_caption": caption}
+        }, upsert=False)
+        await post_cache.invalidate_post(await db.posts.find_one({"_id": oid}, {"slug": 1}))
+    except Exception:
+        pass
+
+async def _attach_froala(post_id: str, asset_id: str, key: str, now):
+    try:
+        oid = ObjectId(post_id)
+        await db.posts.update_one(
+            {"_id": oid},
+            {
+                "$set": {"updated_at": now},
+                "$push": {
+                    "froala_asset_id_list": asset_id,
+                    "froala_image_key_list": key,
+                },
+            }, upsert=False)
+        await post_cache.invalidate_post(await db.posts.find_one({"_id": oid}, {"slug": 1}))
+    except Exception:
+        pass
+
 # For cover images
 @router.post("/upload-image")
 async def upload_image(
@@ -85,70 +277,32 @@ async def upload_image(
 ):
     if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported Image Type")
-    
-    contents = await file.read()
-    orig_size = len(contents)
-
-    if orig_size > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code=400, detail="File is too large")
-    
-    final_bytes = contents
-    ext = Path(file.filename).suffix or ".jpg"
-    final_mime = file.content_type
-
-    if orig_size > MAX_SAVE_BYTES:
-        loop = asyncio.get_running_loop()
-        try: 
-            with ProcessPoolExecutor(max_workers=2) as exe:
-                final_bytes = await loop.run_in_executor(exe, compress_image, contents, MAX_SAVE_BYTES)
-            
-            final_mime = "image/jpeg"
-            ext = ".jpg"
-        except Exception as e:
-            print(f"Failed to compress image: {str(e)}")
-            final_bytes = contents
 
     uid = uuid4().hex
-    filename = f"{uid}{ext}"
-    key = f"{IMAGE_PREFIX}/{filename}"
+    upload, blob = await _ingest_image(file, IMAGE_PREFIX, uid, compress=True)
+    key = blob["key"]
+    # Each asset keeps its own path as identity, duplicates share the stored blob_key
+    filename = f"{uid}{Path(key).suffix}"
 
-    #Upload to R2
-    try:
-        await put_object_from_bytes(final_bytes, R2_BUCKET, key, content_type=final_mime)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Upload Failed: {str(e)}")
-    
-    public_link = generate_presigned_get_url(key, expires_in=3600*24*7)
     now = _now()
     doc = {
-        "path":key,
+        "path": f"{IMAGE_PREFIX}/{filename}",
         "filename": filename,
-        "mime": final_mime,
-        "size": len(final_bytes),
+        **_blob_fields(blob),
         "uploaded_by": admin.get("clerk_user_id"),
         "post_id": post_id,
         "used_by_post": bool(post_id),
         "alt": alt,
         "caption": caption,
-        "public_link": public_link,
         "created_at": now
     }
 
-    saved = await save_asset_doc(doc, uid)
+    saved = await _save_blob_asset(doc, uid, blob)
     if post_id:
-        try:
-            oid = ObjectId(post_id)
-            await db.posts.update_one({"_id": oid}, {
-                "$set": {
-                    "cover_asset_id": saved["asset_id"], 
-                    "updated_at": now,
-                    "cover_image_key": key,
-                    "cover_caption": caption}
-            }, upsert=False)
-        except Exception:
-            pass
+        await _attach_cover(post_id, saved["asset_id"], key, caption, now)
 
-    return JSONResponse({"asset_id": saved["asset_id"], "link": public_link})
+    # Signed links aren't stored, GET /api/assets/{asset_id}/link hands out a current one
+    return JSONResponse({"asset_id": saved["asset_id"], "link": link_signer.url(key)})
 
 # Upload from froala -> returns asset get endpoint as link for <img src="..." />
 # Also removed security 
@@ -158,55 +312,215 @@ async def upload_froala_image(request: Request, post_id: str, file: UploadFile =
 
     if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported Image Type")
-    
-    contents = await file.read()
-
-    # Won't be using image compression 
-    final_bytes = contents
-    ext = Path(file.filename).suffix or ".jpg"
-    final_mime = file.content_type
 
+    # Won't be using image compression
     uid = uuid4().hex
-    filename = f"{uid}{ext}"
-    key = f"{FROALA_PREFIX}/{filename}"
+    upload, blob = await _ingest_image(file, FROALA_PREFIX, uid, compress=False)
+    key = blob["key"]
+    filename = f"{uid}{Path(key).suffix}"
 
-    #Upload to R2
-    try:
-        await put_object_from_bytes(final_bytes, R2_BUCKET, key, content_type=final_mime)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Upload Failed: {str(e)}")
-    
     public_link = f"{BACKEND_BASE}/api/assets/{uid}"
     now = _now()
     doc = {
-        "path":key,
+        "path": f"{FROALA_PREFIX}/{filename}",
         "filename": filename,
-        "mime": final_mime,
-        "size": len(final_bytes),
+        **_blob_fields(blob),
         "post_id": post_id,
         "used_by_post": bool(post_id),
         "public_link": public_link,
         "created_at": now
     }
-    saved = await save_asset_doc(doc, uid)
+    saved = await _save_blob_asset(doc, uid, blob)
 
     if post_id:
-        try:
-            oid = ObjectId(post_id)
-            await db.posts.update_one(
-                {"_id": oid},
-                {
-                    "$set": {"updated_at": now},
-                    "$push": {
-                        "froala_asset_id_list": saved["asset_id"],
-                        "froala_image_key_list": key,
-                    },
-                }, upsert=False)
-        except Exception:
-            pass
+        await _attach_froala(post_id, saved["asset_id"], key, now)
 
     return {"link":public_link}
 
+# Direct uploads: the browser PUTs the bytes to R2 with presigned URLs (multipart for large
+# files) and then calls /complete. The object is checked with a HEAD and recorded right away,
+# compression / variants / dedup run afterwards in the background off the request path
+@router.post("/uploads")
+async def create_direct_upload(body: DirectUploadCreate, admin: dict = Depends(require_admin)):
+    if body.content_type not in ALLOWED_IMAGE_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported Image Type")
+    if body.kind not in DIRECT_UPLOAD_PREFIXES:
+        raise HTTPException(status_code=400, detail="Unsupported upload kind")
+    if body.size <= 0 or body.size > DIRECT_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+
+    uid = uuid4().hex
+    key = f"{DIRECT_UPLOAD_PREFIXES[body.kind]}/{uid}{Path(body.filename).suffix or '.jpg'}"
+    now = _now()
+    pending = {
+        "_id": uid,
+        "key": key,
+        "kind": body.kind,
+        "filename": body.filename,
+        "content_type": body.content_type,
+        "size": body.size,
+        "post_id": body.post_id,
+        "alt": body.alt,
+        "caption": body.caption,
+        "uploaded_by": admin.get("clerk_user_id"),
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=DIRECT_UPLOAD_URL_TTL),
+    }
+    response = {"upload_id": uid, "key": key, "expires_in": DIRECT_UPLOAD_URL_TTL}
+
+    if body.size > MULTIPART_PART_SIZE:
+        try:
+            multipart_id = await create_multipart_upload(R2_BUCKET, key, content_type=body.content_type)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Could not start upload: {str(e)}")
+        pending["multipart_upload_id"] = multipart_id
+        response["part_size"] = MULTIPART_PART_SIZE
+        response["parts"] = [
+            {"part_number": n, "url": generate_presigned_part_url(key, multipart_id, n, expires_in=DIRECT_UPLOAD_URL_TTL)}
+            for n in range(1, math.ceil(body.size / MULTIPART_PART_SIZE) + 1)
+        ]
+    else:
+        response["url"] = generate_presigned_put_url(key, expires_in=DIRECT_UPLOAD_URL_TTL, content_type=body.content_type, content_length=body.size)
+        response["headers"] = {"Content-Type": body.content_type}
+
+    await db.uploads.insert_one(pending)
+    return response
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_direct_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    body: Optional[DirectUploadComplete] = None,
+    admin: dict = Depends(require_admin),
+):
+    # Claiming the upload first makes a repeated /complete a 409 instead of a second asset
+    pending = await db.uploads.find_one_and_update(
+        {"_id": upload_id, "status": "pending"},
+        {"$set": {"status": "finalizing"}},
+    )
+    if not pending:
+        raise HTTPException(status_code=404, detail="Upload not found or already completed")
+    key = pending["key"]
+
+    async def _fail(status_code: int, detail: str):
+        await db.uploads.update_one({"_id": upload_id}, {"$set": {"status": "failed", "error": detail}})
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    # Transient errors (timeouts, dropped connections, Mongo) hand the ticket back so /complete can be retried
+    try:
+        if pending.get("multipart_upload_id") and not pending.get("multipart_completed"):
+            parts = [{"PartNumber": p.part_number, "ETag": p.etag} for p in sorted(body.parts if body else [], key=lambda p: p.part_number)]
+            if not parts:
+                await _fail(400, "Uploaded parts are required")
+            try:
+                await complete_multipart_upload(R2_BUCKET, key, pending["multipart_upload_id"], parts)
+            except ClientError as ce:
+                await _fail(400, f"Could not complete multipart upload: {ce.response.get('Error', {}).get('Code')}")
+            # A retry after a later transient error must not complete it twice
+            await db.uploads.update_one({"_id": upload_id}, {"$set": {"multipart_completed": True}})
+
+        try:
+            meta = await head_object(R2_BUCKET, key)
+        except ClientError:
+            await _fail(400, "Object was not uploaded")
+
+        # The presigned URL pins type and length, this catches anything that bypassed it
+        if meta.get("ContentLength") != pending["size"] or (meta.get("ContentType") or "").split(";")[0] != pending["content_type"]:
+            await delete_object(R2_BUCKET, key)
+            await _fail(400, "Uploaded object does not match the declared size or type")
+
+        uid = pending["_id"]
+        now = _now()
+        public_link = f"{BACKEND_BASE}/api/assets/{uid}"
+        doc = {
+            "path": key,
+            "filename": Path(key).name,
+            "mime": pending["content_type"],
+            "size": meta["ContentLength"],
+            "etag": meta.get("ETag"),
+            "uploaded_by": pending.get("uploaded_by"),
+            "post_id": pending.get("post_id"),
+            "used_by_post": bool(pending.get("post_id")),
+            "alt": pending.get("alt"),
+            "caption": pending.get("caption"),
+            "public_link": public_link,
+            "processing": "pending",
+            "created_at": now,
+        }
+        saved = await save_asset_doc(doc, uid)
+        await db.uploads.update_one({"_id": upload_id}, {"$set": {"status": "done", "asset_id": saved["asset_id"]}})
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.uploads.update_one({"_id": upload_id, "status": "finalizing"}, {"$set": {"status": "pending"}})
+        raise HTTPException(status_code=502, detail=f"Could not finalize upload, retry: {str(e)}")
+
+    if pending.get("post_id"):
+        if pending["kind"] == "froala":
+            await _attach_froala(pending["post_id"], saved["asset_id"], key, now)
+        else:
+            await _attach_cover(pending["post_id"], saved["asset_id"], key, pending.get("caption"), now)
+
+    background_tasks.add_task(process_direct_upload, pending, saved["asset_id"], meta.get("ETag"))
+    return JSONResponse({"asset_id": saved["asset_id"], "link": public_link, "processing": "pending"})
+
+async def process_direct_upload(pending: dict, asset_id: str, etag: Optional[str]):
+    key = pending["key"]
+    prefix = DIRECT_UPLOAD_PREFIXES[pending["kind"]]
+    blob = None
+    upload = None
+    try:
+        stream, _ = await get_object_stream(R2_BUCKET, key)
+        upload = await ingest_stream(stream, None, pending["content_type"], pending["filename"])
+        blob = await acquire_blob(prefix, upload.sha256)
+        if blob is None:
+            for attempt in range(DIRECT_PROCESS_RETRIES):
+                try:
+                    blob = await _store_image(upload, prefix, asset_id, compress=pending["kind"] == "image", stored={"key": key, "etag": etag})
+                    break
+                except HTTPException as e:
+                    # Pool saturated: wait for it to drain rather than dropping the job
+                    if e.status_code != 503 or attempt == DIRECT_PROCESS_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+            blob = await register_blob(prefix, upload.sha256, blob)
+    except Exception as e:
+        print(f"Failed to process direct upload {asset_id}: {str(e)}")
+        await db.assets.update_one({"asset_id": asset_id}, {"$set": {"processing": "failed"}})
+        return
+    finally:
+        if upload is not None:
+            await upload.cleanup()
+
+    try:
+        res = await db.assets.update_one({"asset_id": asset_id}, {"$set": {**_blob_fields(blob), "processing": "done"}})
+    except BaseException:
+        await _release_blob(blob)
+        raise
+    if not res.matched_count:
+        # The asset was deleted while it was being processed
+        await _release_blob(blob)
+        return
+    asset_doc_cache.invalidate(asset_id)
+
+    # Recompressed or deduplicated: posts move to the stored key and the uploaded original goes
+    if blob["key"] != key:
+        await db.posts.update_many({"cover_image_key": key}, {"$set": {"cover_image_key": blob["key"]}})
+        await db.posts.update_many({"froala_image_key_list": key}, {"$set": {"froala_image_key_list.$": blob["key"]}})
+        async for post in db.posts.find({"$or": [{"cover_image_key": blob["key"]}, {"froala_image_key_list": blob["key"]}]}, {"slug": 1}):
+            await post_cache.invalidate_post(post)
+        try:
+            await delete_object(R2_BUCKET, key)
+        except Exception as e:
+            print(f"Failed to delete original {key}: {str(e)}")
+        object_cache.invalidate(key)
+
+    # Published pages linked the image through the API while it was pending
+    async for post in db.posts.find({"froala_image_key_list": blob["key"], "status": "published", "is_deleted": {"$ne": True}}):
+        if await publish_post(post) is not None:
+            await post_cache.invalidate_post(post)
+
 
 @router.post("/html")
 async def upload_html(
@@ -218,29 +532,32 @@ async def upload_html(
     if file.content_type not in ALLOWED_HTML_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported File Type")
     
-    contents = await file.read()
     name = f"{slug or Path(file.filename).stem}-post.html"
     key = f"{HTML_PREFIX}/{name}"
-
+    upload = await _ingest(file, MAX_HTML_BYTES)
     try:
-        await put_object_from_bytes(contents, R2_BUCKET, key, content_type=file.content_type)
+        etag = await put_object_file(upload.path, upload.size, R2_BUCKET, key, content_type=file.content_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Upload failed")
-    
-    public_link = generate_presigned_get_url(key, expires_in=3600*24*30)
+    finally:
+        await upload.cleanup()
+
     now = _now()
     doc = {
         "path": key,
         "filename": name,
         "mime": file.content_type,
-        "size": len(contents),
+        "size": upload.size,
+        "sha256": upload.sha256,
         "uploaded_by": admin.get("clerk_user_id"),
         "post_id": post_id,
         "used_by_post": True,
-        "public_link": public_link,
+        "etag": etag,
         "created_at": now,
     }
     saved = await save_asset_doc(doc)
+    object_cache.invalidate(key)
+    asset_doc_cache.invalidate(saved["asset_id"])
     if post_id:
         try:
             oid = ObjectId(post_id)
@@ -252,68 +569,277 @@ async def upload_html(
                     "status": "published"
                 }
             }, upsert=False)
-        except Exception:
-            pass
+            post = await db.posts.find_one({"_id": oid})
+            if post:
+                await publish_post(post)
+            await post_cache.invalidate_post(post)
+        except Exception as e:
+            print(f"Publishing post {post_id} after HTML upload failed: {str(e)}")
 
-    return JSONResponse({"asset_id": saved["asset_id"], "link":public_link})
+    return JSONResponse({"asset_id": saved["asset_id"], "link": link_signer.url(key)})
     
 
+def _parse_http_date(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # asctime dates carry no zone, HTTP dates are always GMT
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _single_byte_range(value: Optional[str]) -> Optional[str]:
+    # Only single ranges are forwarded; multipart/byteranges is not worth supporting here
+    if value and value.startswith("bytes=") and "," not in value:
+        return value
+    return None
+
+def _parse_byte_range(value: str, total: int):
+    # Returns (start, end) inclusive, None if unsatisfiable. Raises ValueError on bad syntax
+    first, _, last = value[len("bytes="):].strip().partition("-")
+    if first == "":
+        length = int(last)
+        if length <= 0:
+            return None
+        return max(total - length, 0), total - 1
+    start = int(first)
+    end = int(last) if last else total - 1
+    if start >= total or start > end:
+        return None
+    return start, min(end, total - 1)
+
+def _media_type(key: str, content_type: Optional[str]) -> str:
+    content_type = content_type or "application/octet-stream"
+    if content_type in ALLOWED_HTML_TYPES or key.endswith(".html"):
+        return "text/html"
+    return content_type
+
+def _validator_headers(headers: dict, meta: dict):
+    if meta.get("ETag"):
+        headers["ETag"] = meta["ETag"]
+    if meta.get("LastModified"):
+        headers["Last-Modified"] = format_datetime(meta["LastModified"].astimezone(timezone.utc), usegmt=True)
+
+def _not_modified(request: Request, meta: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = (meta.get("ETag") or "").removeprefix("W/")
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or (bool(etag) and etag in tags)
+
+    since = _parse_http_date(request.headers.get("if-modified-since"))
+    modified = meta.get("LastModified")
+    return bool(since and modified and modified.replace(microsecond=0) <= since)
+
+async def _load_asset(asset_id: str) -> Optional[dict]:
+    asset = asset_doc_cache.get(asset_id)
+    if asset is None:
+        asset = await db.assets.find_one(
+            {"asset_id": asset_id},
+            {"_id": 0, "asset_id": 1, "path": 1, "blob_key": 1, "mime": 1, "size": 1, "etag": 1, "variants": 1, "encodings": 1, "post_id": 1, "links_expire_at": 1},
+        )
+        if asset:
+            asset_doc_cache.put(asset_id, asset)
+    return asset
+
+def _accepted_types(accept: Optional[str]) -> dict:
+    # media type -> q, as pick_encoding does for Accept-Encoding
+    accepted = {}
+    for part in (accept or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip()] = q
+    return accepted
+
+def _pick_variant(variants: Optional[list], accept: Optional[str], width: Optional[int]) -> Optional[dict]:
+    # Best format the client accepts, then the smallest width covering the requested one.
+    # Without a width the original is kept unless a better format than JPEG is accepted
+    if not variants:
+        return None
+    accepted = _accepted_types(accept)
+    for mime in VARIANT_MIME_PREFERENCE:
+        # Wildcards don't count, browsers send */* whatever formats they decode
+        if mime != "image/jpeg" and accepted.get(mime, 0.0) <= 0:
+            continue
+        candidates = sorted((v for v in variants if v.get("mime") == mime), key=lambda v: v["width"])
+        if candidates:
+            break
+    else:
+        return None
+
+    if not width:
+        return candidates[-1] if mime != "image/jpeg" else None
+    for variant in candidates:
+        if variant["width"] >= width:
+            return variant
+    return candidates[-1]
+
+def _raise_for_client_error(ce: ClientError):
+    code = str(ce.response.get("Error", {}).get("Code"))
+    if code in ("NoSuchKey", "404"):
+        raise HTTPException(status_code=404, detail="Object Not Found")
+    if code in ("InvalidRange", "416"):
+        raise HTTPException(status_code=416, detail="Requested Range Not Satisfiable")
+    raise HTTPException(status_code=502, detail=f"Error Fetching Object from Bucket: {str(ce)}")
+
+async def _iter_mapped(cached: CachedObject, start: int, end: int):
+    try:
+        for offset in range(start, end, STREAM_CHUNK_SIZE):
+            yield cached.data[offset:min(offset + STREAM_CHUNK_SIZE, end)]
+    finally:
+        cached.close()
+
+def _cached_response(request: Request, key: str, cached: CachedObject, headers: dict):
+    _validator_headers(headers, cached.meta)
+    if _not_modified(request, cached.meta):
+        cached.close()
+        return Response(status_code=304, headers=headers)
+
+    total = len(cached)
+    start, end, status_code = 0, total, 200
+    range_header = _single_byte_range(request.headers.get("range"))
+    if range_header:
+        try:
+            parsed = _parse_byte_range(range_header, total)
+        except ValueError:
+            parsed = (0, total - 1)
+        if parsed is None:
+            cached.close()
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+        start, end = parsed[0], parsed[1] + 1
+        if (start, end) != (0, total):
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{total}"
+
+    headers["X-Cache"] = cached.tier
+    media_type = _media_type(key, cached.meta.get("ContentType"))
+    if cached.tier == "disk":
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(_iter_mapped(cached, start, end), status_code=status_code, media_type=media_type, headers=headers)
+
+    return Response(content=cached.data[start:end], status_code=status_code, media_type=media_type, headers=headers)
+
 # This get asset endpoint can fetch both html and cover-images and Froala images but rate limited
+# Small objects are served from the tiered object cache (filled on miss), large ones are streamed
+# from R2 in chunks. Supports Range (206) and ETag / Last-Modified validators (304)
 @router.get("/{asset_id}")
 @limiter.limit("50/minute")
-async def get_asset(request: Request, asset_id: str):
-    asset = await db.assets.find_one({"asset_id": asset_id})
+async def get_asset(request: Request, asset_id: str, w: Optional[int] = None):
+    asset = await _load_asset(asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset Not Found")
     
-    headers = {"Cache-Control": "public, max-age=3600"}
-    key = asset.get("path")
-    #print(key)
-    loop = asyncio.get_running_loop()
+    headers = {"Cache-Control": "public, max-age=3600", "Accept-Ranges": "bytes"}
+    key, etag, size = asset.get("blob_key") or asset.get("path"), asset.get("etag"), asset.get("size")
+    if asset.get("variants"):
+        headers["Vary"] = "Accept"
+        variant = _pick_variant(asset["variants"], request.headers.get("accept"), w)
+        if variant:
+            key, etag, size = variant["key"], variant.get("etag"), variant.get("size")
+    if asset.get("encodings"):
+        # Published pages are stored precompressed, served as-is with their Content-Encoding
+        headers["Vary"] = ", ".join(filter(None, [headers.get("Vary"), "Accept-Encoding"]))
+        encoding = pick_encoding(request.headers.get("accept-encoding"), asset["encodings"])
+        stored = asset["encodings"][encoding]
+        key, etag, size = stored["key"], stored.get("etag"), stored.get("size")
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if asset.get("post_id") and links_need_refresh(asset):
+            schedule_refresh(asset["post_id"])
+
+    cached = object_cache.get(key, etag)
+    if cached is None and size is not None and size <= CACHE_MAX_OBJECT_BYTES:
+        try:
+            data, meta = await get_object(R2_BUCKET, key)
+        except ClientError as ce:
+            _raise_for_client_error(ce)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error Fetching Object: {str(e)}")
+
+        await asyncio.to_thread(object_cache.put, key, etag, data, meta)
+        cached = CachedObject(data, meta, "miss")
+
+    if cached is not None:
+        return _cached_response(request, key, cached, headers)
+
+    # The stored ETag answers If-None-Match without R2, which doesn't do the weak comparison
+    if etag and request.headers.get("if-none-match") and _not_modified(request, {"ETag": etag}):
+        headers["ETag"] = etag
+        return Response(status_code=304, headers=headers)
+
+    if_none_match = request.headers.get("if-none-match")
     try:
-        res = await loop.run_in_executor(None, lambda: s3_client.get_object(Bucket=R2_BUCKET, Key=key))
-        body = res["Body"].read()
-        content_type = res.get("ContentType", "application/octet-stream")
-        #print(f"R2 response of type: {content_type}")
-        if content_type in ALLOWED_HTML_TYPES or key.endswith(".html"):
-            html_content = body.decode("utf-8")
-            return HTMLResponse(
-                content=html_content, 
-                headers=headers, 
-                media_type="text/html"
-            )
-        elif content_type in ALLOWED_IMAGE_TYPES or content_type.startswith("image/"):
-            return Response(
-                content=body,
-                media_type=content_type,
-                headers=headers
-            )
-        else:
-            return Response(
-                content=body, 
-                media_type=content_type, 
-                headers=headers
-            )
-        
-    except s3_client.exceptions.NoSuchKey:
-        raise HTTPException(status_code=404, detail="Object Not Found")
+        stream, meta = await get_object_stream(
+            R2_BUCKET,
+            key,
+            range_header=_single_byte_range(request.headers.get("range")),
+            if_none_match=if_none_match,
+            if_modified_since=_parse_http_date(request.headers.get("if-modified-since")),
+        )
     except ClientError as ce:
-        raise HTTPException(status_code=502, detail=f"Error Fetching Object from Bucket: {str(ce)}")
+        if str(ce.response.get("Error", {}).get("Code")) in ("304", "NotModified"):
+            if if_none_match:
+                headers["ETag"] = if_none_match
+            return Response(status_code=304, headers=headers)
+        _raise_for_client_error(ce)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error Fetching Object: {str(e)}")
 
+    _validator_headers(headers, meta)
+    if meta.get("ContentLength") is not None:
+        headers["Content-Length"] = str(meta["ContentLength"])
+
+    status_code = 200
+    if meta.get("StatusCode") == 206 and meta.get("ContentRange"):
+        status_code = 206
+        headers["Content-Range"] = meta["ContentRange"]
+
+    return StreamingResponse(stream, status_code=status_code, media_type=_media_type(key, meta.get("ContentType")), headers=headers)
+
+# A presigned link straight to the stored object, signed on demand and reused while it has time left
+@router.get("/{asset_id}/link")
+@limiter.limit("50/minute")
+async def get_asset_link(request: Request, asset_id: str):
+    asset = await _load_asset(asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset Not Found")
+
+    link, expires_at = link_signer.link(asset.get("blob_key") or asset["path"])
+    return JSONResponse(
+        {"asset_id": asset_id, "link": link, "expires_at": expires_at.isoformat()},
+        headers={"Cache-Control": "public, max-age=300"},
+    )
+
 @router.delete("/{asset_id}")
 async def delete_asset(asset_id: str, admin: dict = Depends(require_admin)):
     asset = await db.assets.find_one({"asset_id": asset_id})
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
-    key = asset["path"]
-    loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, lambda: s3_client.delete_object(Bucket=R2_BUCKET, Key=key))
-
+    # Objects shared with other assets (identical uploads) stay until their last reference goes
+    keys = await release_asset(asset)
     await db.assets.delete_one({"asset_id": asset_id})
-    return JSONResponse({"ok": True})
-    
-    
-
+    asset_doc_cache.invalidate(asset_id)
+
+    result = await delete_objects(R2_BUCKET, keys)
+    for key in keys:
+        object_cache.invalidate(key)
+    return JSONResponse({"ok": not result["errors"], "errors": result["errors"]})
+
+# Deletes assets no post references, orphaned blobs and abandoned direct uploads.
+# Dry run by default, the report lists what is (or would be) deleted
+@router.post("/gc")
+async def collect_garbage(dry_run: bool = True, grace_period: Optional[int] = None, admin: dict = Depends(require_admin)):
+    if grace_period is not None and grace_period < 0:
+        raise HTTPException(status_code=400, detail="grace_period must be >= 0")
+    return await asset_collector.run(dry_run=dry_run, grace_period=GC_GRACE_PERIOD if grace_period is None else grace_period)
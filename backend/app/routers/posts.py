@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi import APIRouter, HTTPException, Depends, Body, BackgroundTasks
 from datetime import datetime, timezone
 from bson import ObjectId
-from models import PostCreate, PostUpdate
+from models import PostCreate, PostUpdate, AutosavePatch, post_list_projection
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 from deps import require_admin
 from db import db, doc_fix_ids
-import asyncio
-from objectstore import s3_client, R2_BUCKET
+from objectstore import delete_objects, R2_BUCKET
+from blobs import release_asset, keys_still_used
+from search import search_fields, needs_reindex
+from pagination import keyset_filter, sort_spec, next_cursor, NEXT_CURSOR_HEADER
+from postcache import post_cache
+from fastjson import FastJSONResponse
+from publish import publish_post
+from references import reconcile_post_assets
 from typing import Optional
 from uuid import uuid4
 
@@ -15,6 +23,9 @@ from uuid import uuid4
 
 router = APIRouter()
 
+# Post fields that end up in the published page
+RENDERED_FIELDS = ("title", "summary", "body")
+
 #Admin Endpoints
 @router.get("/posts")
 async def admin_list_posts(
@@ -22,6 +33,8 @@ async def admin_list_posts(
     skip: int=0,
     status: str = None,
     is_deleted: bool = None,
+    cursor: str = None,
+    fields: str = None,
     admin = Depends(require_admin)
 ):
     q = {}
@@ -31,10 +44,17 @@ async def admin_list_posts(
     if is_deleted is not None:
         q["is_deleted"] = is_deleted
 
-    cursor = db.posts.find(q).sort("created_at", -1).skip(skip).limit(limit)
-    docs = await cursor.to_list(length=limit)
+    if cursor:
+        q.update(keyset_filter("created_at", cursor))
+        skip = 0
+
+    docs_cursor = db.posts.find(q, post_list_projection(fields)).sort(sort_spec("created_at")).skip(skip).limit(limit)
+    docs = await docs_cursor.to_list(length=limit)
 
-    return [doc_fix_ids(d) for d in docs]
+    # Returned directly so the documents skip the jsonable_encoder pass
+    next_page = next_cursor(docs, limit, "created_at")
+    headers = {NEXT_CURSOR_HEADER: next_page} if next_page else None
+    return FastJSONResponse([doc_fix_ids(d) for d in docs], headers=headers)
 
 @router.get("/posts/{id}")
 async def admin_get_post(id: str, admin=Depends(require_admin)):
@@ -60,15 +80,16 @@ async def create_post(payload: Optional[PostCreate]=None, admin=Depends(require_
         "author": {"clerk_user_id": admin["clerk_user_id"], "name": admin.get("name")},
         "created_at": now,
         "status":"draft",
-        "is_deleted": False
-
+        "is_deleted": False,
+        "version": 0,
     })
 
     if doc.get("slug") is None:
         doc["slug"] = uuid4().hex
+    doc.update(search_fields(doc))
         
     result = await db.posts.insert_one(doc)         # Returns an insertOneResult Object not the doc
-    return {"id":str(result.inserted_id)}           # Use .inserted_id to fetch the doc id from insertOneResult object
+    return {"id":str(result.inserted_id), "version": 0}           # Use .inserted_id to fetch the doc id from insertOneResult object
 
 @router.patch("/posts/{id}")
 async def update_post(id: str, payload: PostUpdate, admin=Depends(require_admin)):
@@ -90,13 +111,108 @@ async def update_post(id: str, payload: PostUpdate, admin=Depends(require_admin)
             raise HTTPException(status_code=409, detail="slug exists")
         
     data["updated_at"] = datetime.now(timezone.utc)
+    # Autosaves since the last full save left the search terms and image lists behind
+    if needs_reindex(data) or post.get("needs_sync"):
+        data.update(search_fields({**post, **data}))
     if data.get("status") == "published" and not post.get("published_at"):
         data["published_at"] = datetime.now(timezone.utc)
 
-    await db.posts.update_one({"_id": oid}, {"$set": data})
+    update = {"$set": data, "$inc": {"version": 1}}
+    if post.get("needs_sync"):
+        update["$unset"] = {"needs_sync": ""}
+    await db.posts.update_one({"_id": oid}, update)
     new_doc = await db.posts.find_one({"_id": oid})
+    # Re-rendered when the post gets published, or a published post's page content changes
+    if new_doc.get("status") == "published" and (post.get("status") != "published" or any(f in data for f in RENDERED_FIELDS)):
+        # Also reconciles the image lists with the body
+        await publish_post(new_doc)
+        new_doc = await db.posts.find_one({"_id": oid})
+    elif "body" in data or post.get("needs_sync"):
+        await reconcile_post_assets(new_doc)
+    await post_cache.invalidate_post(new_doc, post.get("slug"))
     return doc_fix_ids(new_doc)
 
+# Editor autosave: splices against a base version are applied inside MongoDB, so a save sends
+# only what changed and costs one find_one_and_update. A stale base version gets a 409 with the
+# current version and the editor reloads. Search terms and image lists catch up on the next
+# full save or publish, published posts are re-rendered in the background
+def _splice_stage(field: str, start: int, delete: int, insert: str) -> dict:
+    text = {"$ifNull": [f"${field}", ""]}
+    return {"$set": {field: {"$concat": [
+        {"$substrCP": [text, 0, start]},
+        {"$literal": insert},
+        {"$substrCP": [text, start + delete, {"$strLenCP": text}]},
+    ]}}}
+
+@router.patch("/posts/{id}/autosave")
+async def autosave_post(id: str, payload: AutosavePatch, background_tasks: BackgroundTasks, admin=Depends(require_admin)):
+    try:
+        oid = ObjectId(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid Id")
+
+    pipeline = [_splice_stage(s.field, s.start, s.delete, s.insert) for s in payload.splices]
+    pipeline.append({"$set": {
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+        "updated_at": "$$NOW",
+        "needs_sync": True,
+    }})
+    # Posts saved before versioning have none, which counts as version 0
+    version = payload.version if payload.version else {"$in": [0, None]}
+    try:
+        post = await db.posts.find_one_and_update(
+            {"_id": oid, "version": version},
+            pipeline,
+            projection={"version": 1, "status": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+    except OperationFailure as e:
+        # The splices don't apply to the stored text (e.g. the result outgrows the document)
+        raise HTTPException(status_code=400, detail=f"Could not apply autosave: {e.details.get('errmsg') if e.details else str(e)}")
+    if post is None:
+        current = await db.posts.find_one({"_id": oid}, {"version": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Post Not Found")
+        raise HTTPException(status_code=409, detail={"message": "Version conflict", "version": current.get("version", 0)})
+
+    if post.get("status") == "published":
+        background_tasks.add_task(sync_autosaved, oid)
+    return {"version": post["version"]}
+
+async def _sync_search(post: dict) -> Optional[dict]:
+    # Guarded by version: a newer autosave keeps needs_sync set. Returns the synced post or None
+    update = search_fields(post)
+    res = await db.posts.update_one({"_id": post["_id"], "version": post.get("version")}, {"$set": update, "$unset": {"needs_sync": ""}})
+    if not res.modified_count:
+        return None
+    post = {**post, **update}
+    post.pop("needs_sync", None)
+    return post
+
+_syncing = set()
+
+async def sync_autosaved(oid: ObjectId):
+    """Catches an autosaved published post up: search terms, image lists, page and caches."""
+    if oid in _syncing:
+        return
+    _syncing.add(oid)
+    try:
+        # Autosaves landing meanwhile keep needs_sync set, the loop picks them up
+        while True:
+            post = await db.posts.find_one({"_id": oid, "needs_sync": True})
+            if not post:
+                return
+            if post.get("status") == "published":
+                await publish_post(post)
+            else:
+                await reconcile_post_assets(post)
+            synced = await _sync_search(post)
+            await post_cache.invalidate_post(post)
+            if synced:
+                return
+    finally:
+        _syncing.discard(oid)
+
 @router.patch("/posts/{id}/status")
 async def change_status(id: str, status: str, admin=Depends(require_admin)):
     try:
@@ -110,6 +226,12 @@ async def change_status(id: str, status: str, admin=Depends(require_admin)):
         update["published_at"] = now
 
     await db.posts.update_one({"_id": oid}, {"$set": update})
+    post = await db.posts.find_one({"_id": oid})
+    if post and post.get("needs_sync"):
+        post = await _sync_search(post) or post
+    if post and status == "published":
+        await publish_post(post)
+    await post_cache.invalidate_post(post)
     return {"ok": True, "at": now}
 
 @router.patch("/posts/{id}/delete")
@@ -129,6 +251,7 @@ async def soft_delete(id: str, admin=Depends(require_admin)):
     })
 
     post = await db.posts.find_one({"_id": oid})
+    await post_cache.invalidate_post(post)
     return doc_fix_ids(post)
 
 @router.patch("/posts/{id}/restore")
@@ -145,6 +268,7 @@ async def restore_post(id:str, admin=Depends(require_admin)):
     })
 
     post = await db.posts.find_one({"_id":oid})
+    await post_cache.invalidate_post(post)
     return doc_fix_ids(post)
 
 # Permanent delete (DELETE)
@@ -167,38 +291,53 @@ async def permanent_delete(id: str, admin=Depends(require_admin)):
     if not isinstance(froala_key_list, list):
         froala_key_list = [froala_key_list]
 
-    keys = [k for k in [cover_asset_key, html_asset_key, *froala_key_list] if k]
+    post_keys = [k for k in [cover_asset_key, html_asset_key, *froala_key_list] if k]
+    asset_ids = [a for a in [doc.get("cover_asset_id"), doc.get("html_asset_id"), *(doc.get("froala_asset_id_list") or [])] if a]
+
+    # Assets release their blob reference, objects still shared with other assets are kept.
+    # Keys without an asset doc are deleted directly, unless another asset or blob uses them
+    keys = []
+    owned = set()
+    released_ids = []
+    async for asset in db.assets.find({"$or": [{"asset_id": {"$in": asset_ids}}, {"path": {"$in": post_keys}}]}):
+        owned.update([asset["path"], asset.get("blob_key")])
+        keys.extend(await release_asset(asset))
+        released_ids.append(asset["asset_id"])
+    keys.extend(k for k in post_keys if k not in owned)
+    if released_ids:
+        await db.assets.delete_many({"asset_id": {"$in": released_ids}})
+    in_use = await keys_still_used(keys)
+    keys = [k for k in dict.fromkeys(keys) if k not in in_use]
     status_meta = []
     now = datetime.now(timezone.utc)
 
     if keys:
         try:
-            delete_results = await asyncio.gather(
-                *(asyncio.to_thread(s3_client.delete_object, Bucket=R2_BUCKET, Key=key) for key in keys),
-                return_exceptions=True
-            )
-            
-            for key, res in zip(keys, delete_results):
-                if isinstance(res, Exception):
-                    status_meta.append({
-                        "status": "error",
-                        "message": "Asset delete failed",
-                        "key": key,
-                        "error": str(res),
-                        "deleted_by": admin["clerk_user_id"],
-                        "deleted_at": now
-                    })
-                else:
-                    status_meta.append({
-                        "status": "success",
-                        "message": "Asset deleted",
-                        "key": key,
-                        "deleted_by": admin["clerk_user_id"],
-                        "deleted_at": now
-                    })
+            # One DeleteObjects request per 1000 keys
+            result = await delete_objects(R2_BUCKET, keys)
         except Exception as e:
             raise HTTPException(status_code=502, detail=f"Error in deleting assets: {str(e)}")
 
+        failed = {e["key"]: e for e in result["errors"]}
+        for key in keys:
+            if key in failed:
+                status_meta.append({
+                    "status": "error",
+                    "message": "Asset delete failed",
+                    "key": key,
+                    "error": f"{failed[key]['code']}: {failed[key]['message']}",
+                    "deleted_by": admin["clerk_user_id"],
+                    "deleted_at": now
+                })
+            else:
+                status_meta.append({
+                    "status": "success",
+                    "message": "Asset deleted",
+                    "key": key,
+                    "deleted_by": admin["clerk_user_id"],
+                    "deleted_at": now
+                })
+
 
 
     try:
@@ -213,6 +352,7 @@ async def permanent_delete(id: str, admin=Depends(require_admin)):
             "deleted_at": now
         })
         return status_meta
+    await post_cache.invalidate_post(doc)
     
     status_meta.append({
         "status": "success",
@@ -1,11 +1,33 @@
 from fastapi import APIRouter, HTTPException, Query, Request
-from db import db, doc_fix_ids
+from db import db, public_db, doc_fix_ids
 from bson import ObjectId
 from api_limiter import limiter
+import search
+import httpcache
+import publish
+from models import post_list_projection
+from postcache import post_cache
+from pagination import keyset_filter, sort_spec, next_cursor, NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
 
+def _reader_doc(post: dict) -> dict:
+    # Published posts carry a copy of the body with asset links pointing at the object store
+    if post.get("published_body") and "body" in post:
+        post = {**post, "body": post["published_body"]}
+    return doc_fix_ids(post)
+
+async def _reader():
+    # Cache refills right after an edit read the primary, see POST_CACHE_PRIMARY_WINDOW
+    return db if await post_cache.recently_invalidated() else public_db
+
+def _published_post(post: dict) -> dict:
+    if publish.links_need_refresh(post):
+        publish.schedule_refresh(str(post["_id"]))
+    return httpcache.tagged(_reader_doc(post))
+
+
 @router.get("/posts")
 @limiter.limit("50/minute")
 async def list_posts(
@@ -13,30 +35,79 @@ async def list_posts(
     limit: int=10,
     skip: int=0,
     tag: str=None,
-    q: str=None
+    q: str=None,
+    cursor: str=None,
+    fields: str=None,
 ):
+    params = {"limit": limit, "skip": skip, "tag": tag, "q": q, "cursor": cursor, "fields": fields}
+    page = await post_cache.get_or_load(await post_cache.list_key(params), lambda: _list_page(**params))
+
+    headers = {NEXT_CURSOR_HEADER: page["next_cursor"]} if page["next_cursor"] else None
+    return httpcache.respond(request, page, httpcache.LIST_CACHE_CONTROL, headers)
+
+async def _list_page(limit: int, skip: int, tag: str, q: str, cursor: str, fields: str) -> dict:
     query = {"status": "published", "is_deleted": {"$eq":False}}
     if tag:
         query["tags"] = tag
 
+    # Search results are ranked, so they page by offset only
     if q:
-        # Simple text search on title or summary
-        # Searches based on similar q on title or summary without considering case
-        query["$or"] = [{"title": {"$regex": q, "$options": "i"}}, {"summary": {"$regex":q, "$options":"i"}}]
+        return httpcache.tagged(await _search_posts(query, q, limit, skip, fields), next_cursor=None)
+
+    # Pass the X-Next-Cursor of the previous page as cursor, skip is kept for old clients
+    if cursor:
+        query.update(keyset_filter("published_at", cursor))
+        skip = 0
 
-    cursor = db.posts.find(query).sort("published_at", -1).skip(skip).limit(limit) # Skips the first x query and limits to y number of queries
-    docs = await cursor.to_list(length=limit)
+    projection = post_list_projection(fields)
+    if "body" in projection:
+        projection["published_body"] = 1
+    reader = await _reader()
+    docs_cursor = reader.posts.find(query, projection).sort(sort_spec("published_at")).skip(skip).limit(limit) # Skips the first x query and limits to y number of queries
+    docs = await docs_cursor.to_list(length=limit)
 
-    return [doc_fix_ids(d) for d in docs]
+    return httpcache.tagged([_reader_doc(d) for d in docs], next_cursor=next_cursor(docs, limit, "published_at"))
+
+# Candidates come off the search_terms index, ranked here, then only the page is fetched in full
+async def _search_posts(query: dict, q: str, limit: int, skip: int, fields: str = None):
+    words = search.parse_query(q)
+    if not words:
+        return []
+    query.update(search.match_filter(words))
+
+    reader = await _reader()
+    cursor = reader.posts.find(query, {"title": 1, "summary": 1, "tags": 1, "search_terms": 1, "published_at": 1})
+    candidates = await cursor.sort("published_at", -1).limit(search.SEARCH_MAX_CANDIDATES).to_list(length=None)
+    page = search.rank(candidates, words)[skip:skip + limit]
+
+    # Body text is loaded for the snippet and only returned if asked for
+    projection = post_list_projection(fields)
+    requested = set(projection)
+    projection.update({"body": 1, "raw": 1, "published_body": 1})
+    docs = {d["_id"]: d async for d in reader.posts.find({"_id": {"$in": [post["_id"] for _, post in page]}}, projection)}
+    results = []
+    for score, post in page:
+        doc = docs.get(post["_id"])
+        if doc:
+            out = _reader_doc({k: v for k, v in doc.items() if k in requested or k in ("_id", "published_body")})
+            out["score"] = round(score, 2)
+            out["snippet"] = search.snippet(doc, words)
+            results.append(out)
+    return results
 
 @router.get("/post/{slug}")
 @limiter.limit("50/minute")
 async def get_post_by_slug(request: Request, slug: str):
-    post = await db.posts.find_one({"slug":slug, "status":"published", "is_deleted": {"$eq":False}})
-    if not post:
+    async def _load():
+        reader = await _reader()
+        post = await reader.posts.find_one({"slug":slug, "status":"published", "is_deleted": {"$eq":False}})
+        return _published_post(post) if post else None
+
+    entry = await post_cache.get_or_load(post_cache.slug_key(slug), _load)
+    if not entry:
         raise HTTPException(status_code=400, detail="Post Not Found")
     
-    return doc_fix_ids(post)
+    return httpcache.respond(request, entry, httpcache.POST_CACHE_CONTROL)
 
 # searching by id creates issues in crawling. Bad for SEO
 @router.get("/post-id/{id}")
@@ -47,11 +118,16 @@ async def get_post_by_id(request: Request, id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid Id")
     
-    post = await db.posts.find_one({"_id":oid, "status": "published", "is_deleted": {"$ne": True}})
-    if not post:
+    async def _load():
+        reader = await _reader()
+        post = await reader.posts.find_one({"_id":oid, "status": "published", "is_deleted": {"$ne": True}})
+        return _published_post(post) if post else None
+
+    entry = await post_cache.get_or_load(post_cache.id_key(str(oid)), _load)
+    if not entry:
         raise HTTPException(status_code=404, detail="Post Not Found")
     
-    return doc_fix_ids(post)
+    return httpcache.respond(request, entry, httpcache.POST_CACHE_CONTROL)
 
 
 
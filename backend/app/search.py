@@ -0,0 +1,143 @@
+import os
+import re
+import html
+from datetime import datetime, timezone
+from typing import Optional
+
+# Post search: every post carries `search_terms`, the unique lowercased words of its title,
+# summary, tags and body, under a multikey index. A query matches posts containing every
+# word, the last one as a prefix for type-ahead, via exact / anchored-regex lookups that
+# are index range scans. Only the newest SEARCH_MAX_CANDIDATES matches are ranked, in Python,
+# by which fields the words hit, and only the returned page is fetched in full for snippets.
+# Older matches past that cap are never returned, however well they would rank.
+
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 500))
+SEARCH_MAX_TERMS = 5000
+SEARCH_MAX_QUERY_WORDS = 8
+SNIPPET_CHARS = 160
+FIELD_WEIGHTS = (("title", 8.0), ("tags", 5.0), ("summary", 3.0))
+BODY_WEIGHT = 1.0
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT = re.compile(r" (?=[.,;:!?)])")
+# Fields whose change requires recomputing search_terms
+SOURCE_FIELDS = ("title", "summary", "tags", "body", "raw")
+
+
+def tokenize(text: Optional[str]) -> list:
+    return [w.lower() for w in _WORD.findall(text or "")]
+
+
+def plain_text(markup: Optional[str]) -> str:
+    # Post bodies are editor HTML, strip tags for indexing and snippets
+    text = _SPACE.sub(" ", html.unescape(_TAG.sub(" ", markup or ""))).strip()
+    return _SPACE_BEFORE_PUNCT.sub("", text)
+
+
+def _body(post: dict) -> str:
+    return plain_text(post.get("body") or post.get("raw"))
+
+
+def search_fields(post: dict) -> dict:
+    """The search_terms update for a post, computed from its source fields."""
+    # Past SEARCH_MAX_TERMS the title, tags and summary words are kept first, then body
+    # words in document order, so a long body only loses its late (rarely searched) words
+    terms = {}
+    for text in (post.get("title"), " ".join(post.get("tags") or []), post.get("summary"), _body(post)):
+        for word in tokenize(text):
+            terms.setdefault(word)
+            if len(terms) >= SEARCH_MAX_TERMS:
+                return {"search_terms": sorted(terms)}
+    return {"search_terms": sorted(terms)}
+
+
+def needs_reindex(update: dict) -> bool:
+    return any(field in update for field in SOURCE_FIELDS)
+
+
+def parse_query(q: Optional[str]) -> list:
+    return tokenize(q)[:SEARCH_MAX_QUERY_WORDS]
+
+
+def match_filter(words: list) -> dict:
+    # Complete words match exactly, the last (possibly partial) word by anchored prefix
+    *complete, last = words
+    clauses = [{"search_terms": w} for w in complete]
+    clauses.append({"search_terms": {"$regex": f"^{re.escape(last)}"}})
+    return {"$and": clauses}
+
+
+def _matches(word: str, tokens, prefix: bool) -> bool:
+    return any(t.startswith(word) for t in tokens) if prefix else word in tokens
+
+
+def score(post: dict, words: list) -> float:
+    total = 0.0
+    field_tokens = [
+        (set(tokenize(" ".join(post.get("tags") or []) if field == "tags" else post.get(field))), weight)
+        for field, weight in FIELD_WEIGHTS
+    ]
+    terms = post.get("search_terms") or []
+    for i, word in enumerate(words):
+        prefix = i == len(words) - 1
+        hit = False
+        for tokens, weight in field_tokens:
+            if _matches(word, tokens, prefix):
+                # A whole word match ranks above a prefix match of a longer word
+                total += weight if word in tokens else weight * 0.6
+                hit = True
+        if not hit and _matches(word, terms, prefix):
+            total += BODY_WEIGHT
+    return total
+
+
+def rank(candidates: list, words: list) -> list:
+    epoch = datetime.min.replace(tzinfo=timezone.utc)
+
+    def _published(post):
+        published = post.get("published_at") or epoch
+        return published if published.tzinfo else published.replace(tzinfo=timezone.utc)
+
+    scored = [(score(post, words), _published(post), post) for post in candidates]
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [(s, post) for s, _, post in scored]
+
+
+def snippet(post: dict, words: list, length: int = SNIPPET_CHARS) -> Optional[str]:
+    """An HTML escaped excerpt around the first query hit, with matches wrapped in <mark>."""
+    text = _body(post) or post.get("summary") or ""
+    if not text or not words:
+        return None
+
+    pattern = re.compile(
+        r"\b(" + "|".join(re.escape(w) + (r"\w*" if i == len(words) - 1 else r"\b") for i, w in enumerate(words)) + ")",
+        re.IGNORECASE | re.UNICODE,
+    )
+    first = pattern.search(text)
+    start = max(0, (first.start() if first else 0) - length // 4)
+    if start:
+        # Don't cut the leading word in half
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < start + 20 else start
+    excerpt = text[start:start + length]
+
+    out, pos = [], 0
+    for m in pattern.finditer(excerpt):
+        out.append(html.escape(excerpt[pos:m.start()]))
+        out.append(f"<mark>{html.escape(m.group(0))}</mark>")
+        pos = m.end()
+    out.append(html.escape(excerpt[pos:]))
+    return ("…" if start else "") + "".join(out) + ("…" if start + length < len(text) else "")
+
+
+async def backfill(db, query: Optional[dict] = None):
+    """Adds search_terms to posts written before search existed (or to the posts matching query)."""
+    count = 0
+    query = query if query is not None else {"search_terms": {"$exists": False}}
+    async for post in db.posts.find(query, {name: 1 for name in SOURCE_FIELDS}):
+        await db.posts.update_one({"_id": post["_id"]}, {"$set": search_fields(post)})
+        count += 1
+    if count:
+        print(f"Indexed {count} posts for search")
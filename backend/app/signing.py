@@ -0,0 +1,217 @@
+import os
+import time
+import socket
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import db
+from objectstore import generate_presigned_get_url
+
+# Presigned GET links to R2 objects. A signature is cached per (key, ttl) and handed out again
+# until it gets within LINK_MIN_REMAINING of its expiry, so the same cover image or page is
+# signed once per worker instead of on every request. Signed links are resolved at read time,
+# not stored; the sweeper re-signs the ones still stored on referenced assets by older code,
+# and republishes posts whose pages carry links about to expire. Every worker runs the
+# sweeper loop, but a run only happens under a lease document in `leases`, so one worker
+# sweeps per interval.
+
+LINK_TTL = int(os.environ.get("LINK_TTL", 7 * 24 * 3600))  # SigV4 maximum
+LINK_MIN_REMAINING = int(os.environ.get("LINK_MIN_REMAINING", 3600))
+LINK_CACHE_SIZE = int(os.environ.get("LINK_CACHE_SIZE", 10000))
+LINK_SWEEP_INTERVAL = float(os.environ.get("LINK_SWEEP_INTERVAL", 3600))
+LINK_SWEEP_BATCH = int(os.environ.get("LINK_SWEEP_BATCH", 500))
+# Stored links with less than this left are re-signed by the sweeper
+LINK_RESIGN_BEFORE = int(os.environ.get("LINK_RESIGN_BEFORE", 24 * 3600))
+SWEEP_LEASE_ID = "link_sweeper"
+
+
+def link_expiry(url: Optional[str]) -> Optional[datetime]:
+    """Expiry of a SigV4 presigned URL, None for anything else."""
+    if not url or "X-Amz-Expires=" not in url:
+        return None
+    query = parse_qs(urlsplit(url).query)
+    try:
+        signed_at = datetime.strptime(query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        return signed_at + timedelta(seconds=int(query["X-Amz-Expires"][0]))
+    except (KeyError, ValueError):
+        return None
+
+
+class LinkSigner:
+    def __init__(self, size: int = LINK_CACHE_SIZE, min_remaining: int = LINK_MIN_REMAINING):
+        self.size = size
+        self.min_remaining = min_remaining
+        self._lock = threading.Lock()
+        self._links = OrderedDict()   # (key, ttl) -> (url, expiry in epoch seconds)
+        self.hits = 0
+        self.signs = 0
+        self.sign_seconds = 0.0
+        self.sign_seconds_max = 0.0
+
+    def url(self, key: str, ttl: int = LINK_TTL) -> str:
+        return self.link(key, ttl)[0]
+
+    def link(self, key: str, ttl: int = LINK_TTL, min_remaining: Optional[float] = None) -> tuple:
+        """
+        (url, expires_at) of a presigned GET for the key. A cached signature is reused while it
+        has at least min_remaining seconds left (LINK_MIN_REMAINING, at most half the ttl).
+        """
+        cache_key = (key, ttl)
+        now = time.time()
+        if min_remaining is None:
+            min_remaining = min(self.min_remaining, ttl / 2)
+        with self._lock:
+            entry = self._links.get(cache_key)
+            if entry and entry[1] - now >= min_remaining:
+                self._links.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0], datetime.fromtimestamp(entry[1], timezone.utc)
+
+        start = time.perf_counter()
+        url = generate_presigned_get_url(key, expires_in=ttl)
+        elapsed = time.perf_counter() - start
+        expires_at = now + ttl
+        with self._lock:
+            self._links[cache_key] = (url, expires_at)
+            self._links.move_to_end(cache_key)
+            while len(self._links) > self.size:
+                self._links.popitem(last=False)
+            self.signs += 1
+            self.sign_seconds += elapsed
+            self.sign_seconds_max = max(self.sign_seconds_max, elapsed)
+        return url, datetime.fromtimestamp(expires_at, timezone.utc)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached": len(self._links),
+                "hits": self.hits,
+                "signs": self.signs,
+                "sign_ms_avg": round(self.sign_seconds / self.signs * 1000, 3) if self.signs else None,
+                "sign_ms_max": round(self.sign_seconds_max * 1000, 3),
+            }
+
+
+link_signer = LinkSigner()
+
+
+class LinkSweeper:
+    def __init__(self, interval: float = LINK_SWEEP_INTERVAL):
+        self.interval = interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_run = None
+        self.resigned = 0
+        # Stored links found already expired, i.e. links that were broken for readers
+        self.expired_found = 0
+        self.posts_refreshed = 0
+
+    async def sweep(self) -> dict:
+        """Re-signs expiring links stored on referenced assets and refreshes expiring published pages."""
+        # publish imports this module
+        import publish
+
+        now = datetime.now(timezone.utc)
+        resign_before = now + timedelta(seconds=LINK_RESIGN_BEFORE)
+        resigned = expired = 0
+        ops = []
+        cursor = db.assets.find(
+            {"used_by_post": True, "public_link": {"$regex": "X-Amz-Expires="}},
+            {"_id": 1, "path": 1, "blob_key": 1, "public_link": 1},
+        )
+        async for asset in cursor:
+            expires_at = link_expiry(asset["public_link"])
+            if expires_at is None or expires_at > resign_before:
+                continue
+            if expires_at <= now:
+                expired += 1
+            url = link_signer.url(asset.get("blob_key") or asset["path"])
+            ops.append(UpdateOne({"_id": asset["_id"]}, {"$set": {"public_link": url}}))
+            if len(ops) >= LINK_SWEEP_BATCH:
+                await db.assets.bulk_write(ops, ordered=False)
+                resigned += len(ops)
+                ops = []
+        if ops:
+            await db.assets.bulk_write(ops, ordered=False)
+            resigned += len(ops)
+
+        refresh_before = now + timedelta(seconds=publish.PUBLISH_LINK_REFRESH)
+        posts = 0
+        async for post in db.posts.find({"status": "published", "links_expire_at": {"$lt": refresh_before}}, {"_id": 1}):
+            publish.schedule_refresh(str(post["_id"]))
+            posts += 1
+
+        self.runs += 1
+        self.last_run = now
+        self.resigned += resigned
+        self.expired_found += expired
+        self.posts_refreshed += posts
+        return {"resigned": resigned, "expired": expired, "posts_refreshed": posts}
+
+    async def acquire_lease(self) -> bool:
+        """Takes (or renews) the sweep lease for one interval, False while another worker holds it."""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await db.leases.find_one_and_update(
+                {"_id": SWEEP_LEASE_ID, "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+                # A little short of the interval, so the holder's next tick finds it expired or its own
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.interval * 0.9)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return lease["owner"] == self.owner
+        except DuplicateKeyError:
+            # Held by another worker
+            return False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                if await self.acquire_lease():
+                    await self.sweep()
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"Link sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "resigned": self.resigned,
+            "expired_found": self.expired_found,
+            "posts_refreshed": self.posts_refreshed,
+        }
+
+
+link_sweeper = LinkSweeper()
+
+
+def stats() -> dict:
+    return {**link_signer.stats(), "sweeper": link_sweeper.stats()}
@@ -1,41 +1,182 @@
-from PIL import Image
+from PIL import Image, features
+import math
 import time
 import os
 import io
 
-def compress_image(in_img: bytes, max_size: int=1000000, min_quality=5, max_quality=95) -> bytes:
-    start = time.time()
-    img = Image.open(io.BytesIO(in_img))
+# Longest edge kept when compressing, larger images are downscaled before encoding
+MAX_IMAGE_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", 2560))
+# Pixel budget of the downsampled trial image used to predict the output size
+TRIAL_PIXELS = 250_000
+TRIAL_QUALITIES = (5, 20, 40, 60, 70, 78, 85, 90, 95)
+MAX_FULL_ENCODES = 3
+
+# Responsive variants generated at upload, the original width is always included
+VARIANT_WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",") if w.strip())
+VARIANT_FORMATS = tuple(f.strip().lower() for f in os.environ.get("IMAGE_VARIANT_FORMATS", "webp,jpeg").split(",") if f.strip())
+VARIANT_ENCODERS = {
+    # format: (PIL format, PIL feature, mime, extension, save params)
+    "avif": ("AVIF", "avif", "image/avif", "avif", {"quality": 60}),
+    "webp": ("WEBP", "webp", "image/webp", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", "image/jpeg", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+def _open(src) -> Image.Image:
+    # Workers get a file path for streamed uploads, raw bytes are still accepted
+    if isinstance(src, (bytes, bytearray)):
+        return Image.open(io.BytesIO(src))
+    return Image.open(src)
+
+def _to_rgb(img: Image.Image) -> Image.Image:
     if img.mode in ("RGBA", "LA", "P"):
+        if img.mode == "P":
+            img = img.convert("RGBA")
         background = Image.new("RGB", img.size, (255, 255, 255))
-        background.paste(img, mask=img.split()[-1] if img.mode in ("RGBA", "LA") else None)
-        img = background
-    else:
-        img = img.convert("RGB")
-
-    #Binary search for best quality
-    low, high = min_quality, max_quality
-    best_quality = low
-    best_out = None
-
-    while low<=high:
-        mid = (low+high) // 2
-        buffer = io.BytesIO()
-        img.save(buffer, "JPEG", quality=mid, optimize=True)
-        size = buffer.tell() # gives the last cursor position in the stream = size in bytes
-
-        if size<=max_size:
-            best_quality = mid
-            best_out = buffer.getvalue()
-            low = mid+1
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode == "RGB":
+        img.load()
+        return img
+    return img.convert("RGB")
+
+def _encode(img: Image.Image, quality: int, optimize: bool = True) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality, optimize=optimize)
+    return buffer.getvalue()
+
+def compress_image(
+    in_img: bytes,
+    max_size: int=1000000,
+    min_quality=5,
+    max_quality=95,
+    max_dimension: int=MAX_IMAGE_DIMENSION,
+):
+    """
+    Re-encode an image as JPEG under max_size bytes.
+    Returns (jpeg_bytes, info) where info reports the chosen quality, dimensions and encode time.
+    """
+    start = time.perf_counter()
+    img = _open(in_img)
+    ratio = max_dimension / max(img.size)
+    if ratio < 1:
+        # JPEG sources can be decoded directly at a reduced scale
+        img.draft("RGB", (int(img.width * ratio), int(img.height * ratio)))
+    img = _to_rgb(img)
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    # Size model: the shape of bytes(quality) is sampled with cheap encodes of a downsampled
+    # copy, then scaled to full resolution by a ratio corrected after every full encode
+    pixels = img.width * img.height
+    scale = min(1.0, math.sqrt(TRIAL_PIXELS / pixels))
+    trial = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BILINEAR) if scale < 1 else img
+    curve = [(q, math.log(len(_encode(trial, q, optimize=False)))) for q in TRIAL_QUALITIES]
+
+    def trial_log_size(quality):
+        for (q0, s0), (q1, s1) in zip(curve, curve[1:]):
+            if quality <= q1:
+                return s0 + (s1 - s0) * (quality - q0) / (q1 - q0)
+        return curve[-1][1]
+
+    log_ratio = math.log(pixels / (trial.width * trial.height))
+    log_target = math.log(max_size * 0.97)
 
+    def predict():
+        for quality in range(max_quality, min_quality - 1, -1):
+            if trial_log_size(quality) + log_ratio <= log_target:
+                return quality
+        return min_quality
+
+    best_quality, best_out = None, None
+    fits_at, fails_at = min_quality - 1, max_quality + 1
+    quality = predict()
+    encodes = 0
+
+    while encodes < MAX_FULL_ENCODES:
+        out = _encode(img, quality)
+        encodes += 1
+        if len(out) <= max_size:
+            best_quality, best_out = quality, out
+            fits_at = quality
         else:
-            high = mid-1
+            fails_at = quality
+
+        log_ratio = math.log(len(out)) - trial_log_size(quality)
+        quality = min(max(predict(), fits_at + 1), fails_at - 1)
+        if quality <= fits_at or quality >= fails_at:
+            break
+
+    # Nothing fitted at the allowed qualities: keep shrinking the image at min quality
+    while best_out is None:
+        out = _encode(img, min_quality)
+        encodes += 1
+        if len(out) <= max_size:
+            best_quality, best_out = min_quality, out
+            break
+        if max(img.size) <= 16:
+            raise ValueError("Could'nt compress below target size")
+        factor = max(math.sqrt(max_size / len(out)) * 0.9, 0.1)
+        img = img.resize((max(1, int(img.width * factor)), max(1, int(img.height * factor))), Image.LANCZOS)
+
+    info = {
+        "quality": best_quality,
+        "width": img.width,
+        "height": img.height,
+        "size": len(best_out),
+        "encodes": encodes,
+        "encode_seconds": round(time.perf_counter() - start, 3),
+    }
+    print(f"Compressed in {info['encode_seconds']:.2f}s (q={best_quality}, {img.width}x{img.height}, {encodes} encodes)")
+    return best_out, info
+
+def make_variants(in_img, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS, max_dimension: int=MAX_IMAGE_DIMENSION, out_dir: str=None) -> list:
+    """
+    Encode width variants of an image (bytes or file path) in each format.
+    Returns a list of {"width", "height", "format", "mime", "ext", "size"} plus "data", or "path"
+    when out_dir is given so the encoded bytes never travel back to the caller. Largest first.
+    Animated images get no variants since re-encoding would drop the animation.
+    """
+    img = _open(in_img)
+    if getattr(img, "is_animated", False):
+        return []
+
+    ratio = max_dimension / max(img.size)
+    if ratio < 1:
+        img.draft("RGB", (int(img.width * ratio), int(img.height * ratio)))
+    img = _to_rgb(img)
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
 
-    if best_out:
-        end = time.time()
-        print(f"Compressed in {end - start:.2f}s")
-        return best_out
+    encoders = []
+    for fmt in formats:
+        if fmt not in VARIANT_ENCODERS or not features.check(VARIANT_ENCODERS[fmt][1]):
+            print(f"Skipping unsupported variant format: {fmt}")
+            continue
+        pil_format, _, mime, ext, params = VARIANT_ENCODERS[fmt]
+        encoders.append((fmt, pil_format, mime, ext, params))
 
-    else:
-        raise ValueError("Could'nt compress below target size")
\ No newline at end of file
+    variants = []
+    # Each width is resized from the previous (larger) one which is much cheaper than from the original
+    source = img
+    for width in sorted({w for w in widths if w < img.width} | {img.width}, reverse=True):
+        if width != source.width:
+            source = source.resize((width, max(1, round(source.height * width / source.width))), Image.LANCZOS)
+        for fmt, pil_format, mime, ext, params in encoders:
+            variant = {
+                "width": source.width,
+                "height": source.height,
+                "format": fmt,
+                "mime": mime,
+                "ext": ext,
+            }
+            if out_dir:
+                variant["path"] = os.path.join(out_dir, f"w{source.width}.{ext}")
+                source.save(variant["path"], pil_format, **params)
+                variant["size"] = os.path.getsize(variant["path"])
+            else:
+                buffer = io.BytesIO()
+                source.save(buffer, pil_format, **params)
+                variant["data"] = buffer.getvalue()
+                variant["size"] = len(variant["data"])
+            variants.append(variant)
+    return variants
@@ -0,0 +1,205 @@
+import os
+import time
+import queue
+import signal
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# App lifetime process pool for CPU bound image work (compression, resizing, ...).
+# Workers are spawned once on startup with PIL already imported, and the number of
+# jobs admitted at once is bounded so a burst of uploads gets a 503 instead of
+# piling up unbounded work behind the pool. A job that outlives its timeout keeps its
+# worker busy (a process can't be interrupted), so once IMAGE_RECYCLE_AFTER of them are
+# stuck the pool is replaced and the old one's workers are killed.
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_QUEUE_SIZE = int(os.environ.get("IMAGE_QUEUE_SIZE", 8))
+IMAGE_JOB_TIMEOUT = float(os.environ.get("IMAGE_JOB_TIMEOUT", 30))
+IMAGE_RECYCLE_AFTER = int(os.environ.get("IMAGE_RECYCLE_AFTER", 1))
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def _init_worker(pid_reports):
+    # Pay for the PIL import once per worker instead of once per job
+    from PIL import Image
+    Image.init()
+    pid_reports.put(os.getpid())
+
+
+def _timed(fn, args, kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class _ImageExecutor(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor whose workers report their pid on startup. It has no public way to stop
+    a running job (terminate_workers is 3.14+), so hung workers are killed by pid, and the
+    executor fails whatever they were running with BrokenProcessPool.
+    """
+
+    def __init__(self, max_workers: int):
+        self.pid_reports = multiprocessing.Queue()
+        self.worker_pids = set()
+        super().__init__(max_workers=max_workers, initializer=_init_worker, initargs=(self.pid_reports,))
+
+    def kill_workers(self):
+        while True:
+            try:
+                self.worker_pids.add(self.pid_reports.get_nowait())
+            except (queue.Empty, OSError, ValueError):
+                break
+        # Only ever called while the executor is alive or just retired, before its pids can be reused
+        for pid in self.worker_pids:
+            try:
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+
+
+class ImageWorkerPool:
+    def __init__(
+        self,
+        workers: int = IMAGE_WORKERS,
+        queue_size: int = IMAGE_QUEUE_SIZE,
+        job_timeout: float = IMAGE_JOB_TIMEOUT,
+        recycle_after: int = IMAGE_RECYCLE_AFTER,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.recycle_after = max(recycle_after, 1)
+        self._executor: Optional[_ImageExecutor] = None
+        self._pending = 0
+        self._hung = set()       # futures of timed out jobs still running on the current executor
+        self._retiring = {}      # replaced executor -> task killing its workers
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "recycles": 0,
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._wait_total = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def start(self):
+        if self._executor is None:
+            self._executor = _ImageExecutor(self.workers)
+            # Spawn the workers now rather than on the first upload
+            for _ in range(self.workers):
+                self._executor.submit(time.sleep, 0)
+
+    async def shutdown(self):
+        for executor, task in list(self._retiring.items()):
+            task.cancel()
+            executor.kill_workers()
+        self._retiring.clear()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            if self._hung:
+                executor.kill_workers()
+            self._hung = set()
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    async def run(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        if self._executor is None:
+            self.start()
+
+        # A timed out job keeps its slot until the worker actually finishes it or is killed,
+        # so the admitted count always reflects real pool usage
+        if self._pending >= self.capacity:
+            self._counters["rejected"] += 1
+            raise PoolSaturated("Image worker pool is saturated")
+
+        self._pending += 1
+        self._counters["submitted"] += 1
+        submitted_at = time.perf_counter()
+        executor = self._executor
+        future = executor.submit(_timed, fn, args, kwargs)
+        wrapped = asyncio.wrap_future(future)
+        wrapped.add_done_callback(self._release)
+
+        try:
+            # shield: a timeout must not mark the job done while a worker is still running it
+            result, run_seconds = await asyncio.wait_for(asyncio.shield(wrapped), timeout or self.job_timeout)
+        except asyncio.TimeoutError:
+            # cancel only succeeds if the job never left the queue
+            if not future.cancel() and not future.done():
+                self._job_hung(executor, future)
+            self._counters["timeouts"] += 1
+            raise JobTimeout(f"Image job exceeded {timeout or self.job_timeout}s")
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+
+        latency = time.perf_counter() - submitted_at
+        self._counters["completed"] += 1
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+        self._wait_total += max(latency - run_seconds, 0)
+        return result
+
+    def _job_hung(self, executor, future):
+        if executor is not self._executor:
+            return  # already being retired
+        self._hung.add(future)
+        future.add_done_callback(self._hung.discard)
+        if len(self._hung) >= self.recycle_after:
+            self._recycle()
+
+    def _recycle(self):
+        old, self._executor = self._executor, None
+        self._hung = set()
+        self._counters["recycles"] += 1
+        print(f"Image worker pool recycled, {self.recycle_after} job(s) stuck past their timeout")
+        self.start()
+        self._retiring[old] = asyncio.create_task(self._retire(old))
+
+    async def _retire(self, executor):
+        # Jobs still running on the old pool get one more timeout to finish, whatever is
+        # left after that (the hung jobs) fails with BrokenProcessPool and frees its slot
+        try:
+            await asyncio.sleep(self.job_timeout)
+            executor.kill_workers()
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        finally:
+            self._retiring.pop(executor, None)
+
+    def _release(self, wrapped):
+        self._pending -= 1
+        if not wrapped.cancelled():
+            wrapped.exception()  # mark retrieved for jobs nobody awaits anymore
+
+    def stats(self) -> dict:
+        completed = self._counters["completed"]
+        return {
+            **self._counters,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self._pending,
+            "hung": len(self._hung),
+            "queue_depth": max(self._pending - self.workers, 0),
+            "avg_latency_ms": round(self._latency_total / completed * 1000, 2) if completed else 0.0,
+            "max_latency_ms": round(self._latency_max * 1000, 2),
+            "avg_queue_wait_ms": round(self._wait_total / completed * 1000, 2) if completed else 0.0,
+        }
+
+
+image_pool = ImageWorkerPool()
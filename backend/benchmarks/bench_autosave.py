@@ -0,0 +1,71 @@
+"""
+Request size of editor autosaves: the full PATCH /api/posts/{id} payload (title, summary,
+tags, raw and body) against PATCH /api/posts/{id}/autosave splices, over a simulated typing
+session on a long post. No database needed. A full save also costs 4 MongoDB round trips
+(find, slug check, update, re-find), an autosave 1 (find_one_and_update).
+
+    python benchmarks/bench_autosave.py
+    python benchmarks/bench_autosave.py --body-kb 120 --saves 200 --chars-per-save 40
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_list_posts import make_post, WORDS  # noqa: E402
+
+FULL_SAVE_FIELDS = ("title", "summary", "tags", "slug", "raw", "body")
+
+
+def splice(old: str, new: str, field: str) -> dict:
+    # What an editor sends for one edit: common prefix and suffix kept, the middle replaced
+    start = 0
+    while start < min(len(old), len(new)) and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < min(len(old), len(new)) - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    return {"field": field, "start": start, "delete": len(old) - start - end, "insert": new[start:len(new) - end]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--body-kb", type=int, default=60)
+    parser.add_argument("--saves", type=int, default=100)
+    parser.add_argument("--chars-per-save", type=int, default=30, help="text typed between two autosaves")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    post = make_post(0, args.body_kb * 1024, rng)
+    version = 0
+    full_sizes, delta_sizes = [], []
+    for _ in range(args.saves):
+        # Type a few words somewhere in the body, mirrored in raw
+        words = ""
+        while len(words) < args.chars_per_save:
+            words += rng.choice(WORDS) + " "
+        at = rng.randrange(len(post["raw"]))
+        new_raw = post["raw"][:at] + words + post["raw"][at:]
+        at_body = post["body"].find(post["raw"][at:at + 20]) if post["raw"][at:at + 20] else -1
+        at_body = at_body if at_body >= 0 else len(post["body"]) - 4
+        new_body = post["body"][:at_body] + words + post["body"][at_body:]
+
+        delta = {"version": version, "splices": [splice(post["body"], new_body, "body"), splice(post["raw"], new_raw, "raw")]}
+        post["raw"], post["body"] = new_raw, new_body
+        version += 1
+        full_sizes.append(len(json.dumps({k: post[k] for k in FULL_SAVE_FIELDS})))
+        delta_sizes.append(len(json.dumps(delta)))
+
+    full, delta = statistics.median(full_sizes), statistics.median(delta_sizes)
+    print(f"{args.saves} autosaves on a ~{args.body_kb}KB post, {args.chars_per_save} chars typed per save\n")
+    print(f"{'':10} {'median bytes':>13} {'total KB':>9} {'db round trips':>15}")
+    print(f"{'full save':10} {full:>13.0f} {sum(full_sizes) / 1024:>9.1f} {4 * args.saves:>15}")
+    print(f"{'autosave':10} {delta:>13.0f} {sum(delta_sizes) / 1024:>9.1f} {args.saves:>15}")
+    print(f"\npayload {full / delta:.0f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Cold start of a worker: time to import the app, run its lifespan startup, and serve the first
+requests, each measured in a fresh interpreter the way a new container / uvicorn worker starts.
+
+    python benchmarks/bench_cold_start.py                  # MONGO_URI or localhost
+    python benchmarks/bench_cold_start.py --runs 10 --importtime
+
+The first run against an empty database applies the migrations, later runs only check the
+schema version. /api/public/posts needs MongoDB, it is reported as failed without one.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app"))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+out = {"import": t1 - t0}
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    out["startup"] = t2 - t1
+    for name, path in (("first /health", "/health"), ("first /api/public/posts", "/api/public/posts")):
+        start = time.perf_counter()
+        try:
+            ok = client.get(path).status_code < 500
+        except Exception:
+            ok = False
+        out[name] = time.perf_counter() - start if ok else None
+print("RESULT " + json.dumps(out))
+"""
+
+
+def run_child(env: dict) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD], cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=120)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"child failed:\n{proc.stderr[-2000:]}")
+
+
+def import_profile(env: dict, top: int):
+    # -X importtime writes "import time: self | cumulative | package" lines to stderr
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=APP_DIR, env=env, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = [p.strip() for p in line.removeprefix("import time:").split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            rows.append((int(parts[1]), parts[2]))
+    top_level = [(us, name) for us, name in rows if not name.startswith(" ")]
+    print(f"\nslowest top-level imports (cumulative):")
+    for us, name in sorted(top_level, reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017/blogdb"))
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    args = parser.parse_args()
+
+    env = {**os.environ, "MONGO_URI": args.mongo_uri}
+    env.setdefault("CLERK_SECRET_KEY", "bench")
+    env.setdefault("R2_BUCKET", "bench")
+    env.setdefault("R2_ENDPOINT", "http://127.0.0.1:9")
+
+    results = [run_child(env) for _ in range(args.runs)]
+    print(f"{args.runs} fresh worker starts, median (min / max) in ms\n")
+    for phase in results[0]:
+        values = [r[phase] for r in results if r[phase] is not None]
+        if not values:
+            print(f"{phase:26} failed")
+            continue
+        print(f"{phase:26} {statistics.median(values) * 1000:8.1f}  ({min(values) * 1000:.1f} / {max(values) * 1000:.1f})")
+
+    if args.importtime:
+        import_profile(env, 12)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Wall time comparison of utils.compress_image against the previous full binary search.
+
+    python benchmarks/bench_compress.py                 # synthetic corpus
+    python benchmarks/bench_compress.py --corpus DIR    # every image file in DIR
+"""
+import os
+import io
+import sys
+import time
+import random
+import argparse
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+from utils import compress_image  # noqa: E402
+
+MAX_SAVE_BYTES = 1 * 1024 * 1024
+
+
+def legacy_compress_image(in_img: bytes, max_size: int = 1000000, min_quality=5, max_quality=95) -> bytes:
+    # The implementation compress_image replaced, kept here as the baseline
+    img = Image.open(io.BytesIO(in_img))
+    if img.mode in ("RGBA", "LA", "P"):
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1] if img.mode in ("RGBA", "LA") else None)
+        img = background
+    else:
+        img = img.convert("RGB")
+
+    low, high = min_quality, max_quality
+    best_out = None
+    while low <= high:
+        mid = (low + high) // 2
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=mid, optimize=True)
+        if buffer.tell() <= max_size:
+            best_out = buffer.getvalue()
+            low = mid + 1
+        else:
+            high = mid - 1
+
+    if best_out is None:
+        raise ValueError("Could'nt compress below target size")
+    return best_out
+
+
+def _photo_like(width, height, seed):
+    rng = random.Random(seed)
+    noise = Image.frombytes("RGB", (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+    img = noise.resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(3))
+    grain = Image.frombytes("L", (width, height), rng.randbytes(width * height)).convert("RGB")
+    return Image.blend(img, grain, 0.08)
+
+
+def _screenshot_like(width, height, seed):
+    rng = random.Random(seed)
+    img = Image.new("RGBA", (width, height), (250, 250, 250, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(400):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+        draw.rectangle([x, y, x + rng.randrange(20, 300), y + rng.randrange(8, 40)], fill=color)
+        draw.text((x + 4, y + 2), "lorem ipsum dolor sit amet", fill=(0, 0, 0, 255))
+    return img
+
+
+def synthetic_corpus():
+    for name, img, fmt in [
+        ("photo-6000x4000.jpg", _photo_like(6000, 4000, 6), "JPEG"),
+        ("photo-4000x3000.png", _photo_like(4000, 3000, 1), "PNG"),
+        ("photo-3000x2000.jpg", _photo_like(3000, 2000, 2), "JPEG"),
+        ("photo-2048x1536.png", _photo_like(2048, 1536, 3), "PNG"),
+        ("screenshot-2880x1800.png", _screenshot_like(2880, 1800, 4), "PNG"),
+        ("screenshot-1920x1080.png", _screenshot_like(1920, 1080, 5), "PNG"),
+    ]:
+        buffer = io.BytesIO()
+        img.save(buffer, fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+        yield name, buffer.getvalue()
+
+
+def file_corpus(directory):
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                yield name, f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="directory of sample images, defaults to a synthetic corpus")
+    parser.add_argument("--max-size", type=int, default=MAX_SAVE_BYTES)
+    args = parser.parse_args()
+
+    corpus = file_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    total_legacy = total_new = 0.0
+    print(f"{'image':28} {'input':>9} {'legacy s':>9} {'legacy B':>9} {'new s':>7} {'new B':>9} {'q':>3} {'dims':>11} {'speedup':>8}")
+    for name, data in corpus:
+        start = time.perf_counter()
+        legacy = legacy_compress_image(data, args.max_size)
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        out, info = compress_image(data, args.max_size)
+        new_s = time.perf_counter() - start
+
+        assert len(out) <= args.max_size, f"{name}: {len(out)} > {args.max_size}"
+        total_legacy += legacy_s
+        total_new += new_s
+        dims = f"{info['width']}x{info['height']}"
+        print(f"{name:28} {len(data):>9} {legacy_s:>9.2f} {len(legacy):>9} {new_s:>7.2f} {len(out):>9} {info['quality']:>3} {dims:>11} {legacy_s / new_s:>7.1f}x")
+
+    print(f"\ntotal: legacy {total_legacy:.2f}s, new {total_new:.2f}s, speedup {total_legacy / total_new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
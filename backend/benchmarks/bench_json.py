@@ -0,0 +1,81 @@
+"""
+Serialization and compression cost of the post list and detail responses: FastAPI's default
+path (jsonable_encoder + JSONResponse) against fastjson, and the wire size / time of the
+CompressionMiddleware encoders. No database needed, documents are generated in memory.
+
+    python benchmarks/bench_json.py
+    python benchmarks/bench_json.py --limit 50 --body-kb 80 --rounds 500
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import argparse
+import statistics
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("CLERK_SECRET_KEY", "bench")
+import fastjson  # noqa: E402
+from db import doc_fix_ids  # noqa: E402
+from models import POST_SUMMARY_FIELDS  # noqa: E402
+from compression import COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY, brotli  # noqa: E402
+from bench_list_posts import make_post  # noqa: E402
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=20, help="posts per list page")
+    parser.add_argument("--body-kb", type=int, default=40, help="approximate HTML body size of the detail post")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    docs = []
+    for i in range(args.limit):
+        doc = make_post(i, args.body_kb * 1024, rng)
+        doc["_id"] = ObjectId()
+        docs.append(doc)
+    payloads = {
+        "list": [doc_fix_ids({k: v for k, v in d.items() if k in POST_SUMMARY_FIELDS or k == "_id"}) for d in docs],
+        "detail": doc_fix_ids(docs[0]),
+    }
+
+    print(f"list: {args.limit} PostSummary docs, detail: one post with a ~{args.body_kb}KB body, median of {args.rounds}\n")
+    print(f"{'endpoint':8} {'default ms':>11} {'fastjson ms':>12} {'speedup':>8}")
+    bodies = {}
+    for name, payload in payloads.items():
+        default = timed(lambda: JSONResponse(jsonable_encoder(payload)).body, args.rounds)
+        fast = timed(lambda: fastjson.FastJSONResponse(payload).body, args.rounds)
+        bodies[name] = fastjson.dumps(payload)
+        print(f"{name:8} {default:>11.3f} {fast:>12.3f} {default / fast:>7.1f}x")
+
+    encoders = {"gzip": lambda b: zlib.compress(b, COMPRESS_GZIP_LEVEL, wbits=31)}
+    if brotli is not None:
+        encoders["br"] = lambda b: brotli.compress(b, mode=brotli.MODE_TEXT, quality=COMPRESS_BROTLI_QUALITY)
+    print(f"\n{'endpoint':8} {'encoding':8} {'bytes':>9} {'ratio':>6} {'ms':>8}")
+    for name, body in bodies.items():
+        print(f"{name:8} {'identity':8} {len(body):>9} {1:>6.2f} {0:>8.3f}")
+        for encoding, compress in encoders.items():
+            size = len(compress(body))
+            ms = timed(lambda: compress(body), max(args.rounds // 4, 1))
+            print(f"{name:8} {encoding:8} {size:>9} {size / len(body):>6.2f} {ms:>8.3f}")
+    if brotli is None:
+        print("\n(brotli not installed, br skipped)")
+
+
+if __name__ == "__main__":
+    main()
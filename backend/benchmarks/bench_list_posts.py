@@ -0,0 +1,116 @@
+"""
+Response size and latency of the post listing with full documents (the previous behaviour)
+against the PostSummary projection, on a seeded corpus of long posts.
+
+    python benchmarks/bench_list_posts.py                       # MONGO_URI or localhost
+    python benchmarks/bench_list_posts.py --posts 500 --body-kb 80
+
+Seeds a separate `blogdb_bench` database (dropped afterwards unless --keep).
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("CLERK_SECRET_KEY", "bench")
+from db import doc_fix_ids  # noqa: E402
+from models import post_list_projection  # noqa: E402
+
+WORDS = "async python mongo index cursor projection latency payload editor froala image cache render publish".split()
+QUERY = {"status": "published", "is_deleted": False}
+SORT = [("published_at", -1), ("_id", -1)]
+
+
+def _paragraphs(rng, size):
+    out, total = [], 0
+    while total < size:
+        p = "<p>" + " ".join(rng.choice(WORDS) for _ in range(60)) + "</p>"
+        out.append(p)
+        total += len(p)
+    return "".join(out)
+
+
+def make_post(i, body_bytes, rng):
+    now = datetime.now(timezone.utc) - timedelta(hours=i)
+    body = _paragraphs(rng, body_bytes)
+    return {
+        "title": f"Post {i}: " + " ".join(rng.choice(WORDS) for _ in range(6)),
+        "slug": f"bench-post-{i}",
+        "summary": " ".join(rng.choice(WORDS) for _ in range(30)),
+        "tags": rng.sample(WORDS, 3),
+        "raw": body.replace("<p>", "").replace("</p>", "\n\n"),
+        "body": body,
+        "meta": {"reading_time": rng.randrange(2, 30), "toc": [f"Section {n}" for n in range(12)]},
+        "status": "published",
+        "is_deleted": False,
+        "author": {"clerk_user_id": "user_bench", "name": None},
+        "cover_asset_id": os.urandom(16).hex(),
+        "cover_image_key": f"images/{os.urandom(16).hex()}.jpg",
+        "froala_asset_id_list": [os.urandom(16).hex() for _ in range(15)],
+        "froala_image_key_list": [f"froala/{os.urandom(16).hex()}.png" for _ in range(15)],
+        "created_at": now,
+        "updated_at": now,
+        "published_at": now,
+    }
+
+
+async def measure(coll, projection, limit, rounds):
+    latencies, size = [], 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        docs = await coll.find(QUERY, projection).sort(SORT).limit(limit).to_list(length=limit)
+        body = JSONResponse(jsonable_encoder([doc_fix_ids(d) for d in docs])).body
+        latencies.append(time.perf_counter() - start)
+        size = len(body)
+    latencies.sort()
+    return {
+        "bytes": size,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--body-kb", type=int, default=40, help="approximate HTML body size per post")
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(args.mongo_uri)
+    bench_db = client["blogdb_bench"]
+    coll = bench_db.posts
+    rng = random.Random(13)
+    await coll.drop()
+    await coll.insert_many([make_post(i, args.body_kb * 1024, rng) for i in range(args.posts)])
+    await coll.create_index([("status", 1), ("is_deleted", 1), ("published_at", -1), ("_id", -1)])
+
+    try:
+        # Warm the connection pool and the working set before timing
+        await measure(coll, None, args.limit, 3)
+        full = await measure(coll, None, args.limit, args.rounds)
+        lean = await measure(coll, post_list_projection(), args.limit, args.rounds)
+    finally:
+        if not args.keep:
+            await client.drop_database("blogdb_bench")
+
+    print(f"{args.posts} posts, ~{args.body_kb}KB body each, page of {args.limit}, {args.rounds} rounds\n")
+    print(f"{'listing':18} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, res in (("full documents", full), ("PostSummary", lean)):
+        print(f"{name:18} {res['bytes']:>10} {res['p50_ms']:>8.2f} {res['p95_ms']:>8.2f}")
+    print(f"\npayload {full['bytes'] / lean['bytes']:.0f}x smaller, p50 {full['p50_ms'] / lean['p50_ms']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""
+Cost of handing out presigned GET links: signing every time (what handlers used to do) against
+the LinkSigner cache, for a working set of keys requested with a skewed popularity. Signing is
+local, no R2 or MongoDB needed.
+
+    python benchmarks/bench_signing.py
+    python benchmarks/bench_signing.py --keys 2000 --requests 50000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("CLERK_SECRET_KEY", "bench")
+os.environ.setdefault("R2_BUCKET", "bench")
+os.environ.setdefault("R2_ENDPOINT", "http://127.0.0.1:9")
+os.environ.setdefault("R2_ACCESS_KEY_ID", "bench")
+os.environ.setdefault("R2_SECRET_ACCESS_KEY", "bench")
+from objectstore import generate_presigned_get_url  # noqa: E402
+from signing import LinkSigner, LINK_TTL  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    keys = [f"images/{i:032x}.jpg" for i in range(args.keys)]
+    # A few popular posts get most of the traffic
+    requests = rng.choices(keys, weights=[1 / (i + 1) for i in range(args.keys)], k=args.requests)
+
+    generate_presigned_get_url(keys[0], LINK_TTL)  # builds the client, not part of the timing
+    start = time.perf_counter()
+    for key in requests:
+        generate_presigned_get_url(key, LINK_TTL)
+    uncached = time.perf_counter() - start
+
+    signer = LinkSigner(size=args.keys)
+    start = time.perf_counter()
+    for key in requests:
+        signer.url(key)
+    cached = time.perf_counter() - start
+
+    stats = signer.stats()
+    print(f"{args.requests} link requests over {args.keys} keys\n")
+    print(f"{'':12} {'total ms':>10} {'us/link':>9}")
+    print(f"{'sign always':12} {uncached * 1000:>10.1f} {uncached / args.requests * 1e6:>9.1f}")
+    print(f"{'LinkSigner':12} {cached * 1000:>10.1f} {cached / args.requests * 1e6:>9.1f}")
+    print(f"\nspeedup {uncached / cached:.1f}x, {stats['signs']} signatures, {stats['hits']} cache hits")
+
+
+if __name__ == "__main__":
+    main()
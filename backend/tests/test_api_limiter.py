@@ -0,0 +1,50 @@
+import pytest
+
+from api_limiter import BoundedMemoryStorage, limiter
+
+
+def test_counters_are_bounded():
+    storage = BoundedMemoryStorage(max_keys=3)
+    for i in range(10):
+        storage.incr(f"client-{i}", 60)
+
+    assert storage.key_count() == 3
+    assert storage.evictions == 7
+    # The newest windows survive, an evicted client starts over
+    assert storage.get("client-9") == 1
+    assert storage.get("client-0") == 0
+
+
+def test_existing_key_is_not_evicted():
+    storage = BoundedMemoryStorage(max_keys=2)
+    storage.incr("a", 60)
+    storage.incr("a", 60)
+    storage.incr("a", 60)
+
+    assert storage.get("a") == 3
+    assert storage.evictions == 0
+
+
+def test_moving_window_entries_are_bounded():
+    storage = BoundedMemoryStorage(max_keys=2)
+    for i in range(5):
+        assert storage.acquire_entry(f"client-{i}", limit=2, expiry=60)
+
+    assert len(storage.events) == 2
+    assert storage.evictions == 3
+    assert storage.acquire_entry("client-4", limit=2, expiry=60)
+    assert not storage.acquire_entry("client-4", limit=2, expiry=60)
+
+
+@pytest.mark.anyio
+async def test_route_limits_are_enforced_and_counted(api, mongo):
+    route = "routers.public.get_post_by_slug"
+    before = limiter.stats()["routes"].get(route, {"allowed": 0, "limited": 0})
+    # get_post_by_slug allows 50/minute
+    statuses = [(await api.get("/api/public/post/missing")).status_code for _ in range(51)]
+
+    assert statuses == [400] * 50 + [429]
+    stats = limiter.stats()
+    assert stats["routes"][route] == {"allowed": before["allowed"] + 50, "limited": before["limited"] + 1}
+    assert stats["storage"] == "BoundedMemoryStorage"
+    assert stats["keys"] >= 1
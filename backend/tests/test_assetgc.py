@@ -0,0 +1,107 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import assetgc
+from objectstore import R2_BUCKET
+
+pytestmark = pytest.mark.anyio
+
+OLD = datetime.now(timezone.utc) - timedelta(days=3)
+NEW = datetime.now(timezone.utc)
+REFERENCED, LINKED, LEGACY, SHARED, YOUNG, OLD_PAGE, PAGE = (f"{i:x}" * 32 for i in range(1, 8))
+PAGE_ENCODINGS = {
+    "identity": {"key": "pages/p1.html"},
+    "gzip": {"key": "pages/p1.html.gz"},
+    "br": {"key": "pages/p1.html.br"},
+}
+
+
+@pytest.fixture
+async def store(mongo, bucket):
+    def put(key):
+        bucket.put_object(Bucket=R2_BUCKET, Key=key, Body=b"x")
+
+    await mongo.posts.insert_one({
+        "_id": "p1",
+        "froala_asset_id_list": [REFERENCED],
+        "html_asset_id": PAGE,
+        "body": f'<img src="/api/assets/{LINKED}">',
+    })
+    assets = [
+        {"asset_id": REFERENCED, "path": "froala/ref.png", "created_at": OLD},
+        {"asset_id": LINKED, "path": "froala/linked.png", "created_at": OLD},
+        {"asset_id": LEGACY, "path": "froala/legacy.png", "size": 10, "created_at": OLD},
+        {"asset_id": SHARED, "path": "images/shared.jpg", "blob_id": "images:s", "blob_key": "blobs/s.jpg", "size": 5, "created_at": OLD},
+        {"asset_id": YOUNG, "path": "froala/young.png", "created_at": NEW},
+        # A page replaced by a later publish still names the page objects the current one uses
+        {"asset_id": OLD_PAGE, "path": "html/old.html", "encodings": PAGE_ENCODINGS, "created_at": OLD},
+        {"asset_id": PAGE, "path": "html/new.html", "encodings": PAGE_ENCODINGS, "created_at": OLD},
+    ]
+    await mongo.assets.insert_many(assets)
+    await mongo.blobs.insert_many([
+        {"_id": "images:s", "key": "blobs/s.jpg", "refs": 1, "variants": [{"key": "blobs/s.webp"}], "created_at": OLD},
+        {"_id": "images:orphan", "key": "blobs/orphan.jpg", "refs": 0, "created_at": OLD},
+    ])
+    await mongo.uploads.insert_one({"_id": "u1", "key": "uploads/u1.bin", "status": "pending", "expires_at": OLD})
+    # Blob backed assets keep their path as identity only, the object is the blob's
+    for asset in assets:
+        if not asset.get("blob_id"):
+            put(asset["path"])
+    for key in ["blobs/s.jpg", "blobs/s.webp", "blobs/orphan.jpg", *(e["key"] for e in PAGE_ENCODINGS.values())]:
+        put(key)
+    return bucket
+
+
+def _stored_keys(bucket) -> set:
+    return {o["Key"] for o in bucket.list_objects_v2(Bucket=R2_BUCKET).get("Contents", [])}
+
+
+GOING_KEYS = {
+    "froala/legacy.png", "blobs/s.jpg", "blobs/s.webp",
+    "blobs/orphan.jpg", "uploads/u1.bin", "html/old.html",
+}
+
+
+async def test_dry_run_changes_nothing(mongo, store):
+    before = _stored_keys(store)
+
+    report = await assetgc.collect(dry_run=True)
+
+    assert sorted(report["assets"]["ids"]) == sorted([LEGACY, SHARED, OLD_PAGE])
+    assert report["assets"]["bytes"] == 15
+    assert report["blobs"]["ids"] == ["images:orphan"]
+    assert report["uploads"]["ids"] == ["u1"]
+    # uploads/u1.bin was never stored, it's still listed for deletion
+    assert set(report["keys"]) == GOING_KEYS
+    assert set(report["kept_in_use"]) == {e["key"] for e in PAGE_ENCODINGS.values()}
+    assert report["deleted"] == 0
+    assert _stored_keys(store) == before
+    assert await mongo.assets.count_documents({}) == 7
+    assert await mongo.blobs.count_documents({}) == 2
+    assert await mongo.uploads.count_documents({}) == 1
+
+
+async def test_delete(mongo, store):
+    before = _stored_keys(store)
+
+    report = await assetgc.collect(dry_run=False)
+
+    assert sorted(report["assets"]["ids"]) == sorted([LEGACY, SHARED, OLD_PAGE])
+    assert set(report["keys"]) == GOING_KEYS
+    assert report["errors"] == []
+    assert _stored_keys(store) == before - GOING_KEYS
+    assert {a["asset_id"] async for a in mongo.assets.find({})} == {REFERENCED, LINKED, YOUNG, PAGE}
+    assert await mongo.blobs.count_documents({}) == 0
+    assert await mongo.uploads.count_documents({}) == 0
+
+    # Nothing left to collect
+    again = await assetgc.collect(dry_run=False)
+    assert again["keys"] == [] and again["deleted"] == 0
+
+
+async def test_grace_period(mongo, store):
+    report = await assetgc.collect(dry_run=True, grace_period=10 * 24 * 3600)
+
+    assert report["assets"]["count"] == 0
+    assert report["keys"] == []
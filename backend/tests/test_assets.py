@@ -0,0 +1,141 @@
+import pytest
+
+import routers.assetsv2 as assetsv2
+from objectstore import R2_BUCKET
+
+pytestmark = pytest.mark.anyio
+
+ASSET_ID = "a" * 32
+DATA = bytes(range(256)) * 64
+
+
+@pytest.fixture
+async def asset(api, mongo, bucket):
+    stored = bucket.put_object(Bucket=R2_BUCKET, Key="froala/a.png", Body=DATA, ContentType="image/png")
+    doc = {"asset_id": ASSET_ID, "path": "froala/a.png", "mime": "image/png", "size": len(DATA), "etag": stored["ETag"]}
+    await mongo.assets.insert_one(dict(doc))
+    return doc
+
+
+@pytest.fixture(params=["cached", "streamed"])
+def serving(request, monkeypatch):
+    # Small objects go through the object cache, larger ones are streamed from R2
+    if request.param == "streamed":
+        monkeypatch.setattr(assetsv2, "CACHE_MAX_OBJECT_BYTES", 0)
+    return request.param
+
+
+async def test_full_get(api, asset, serving):
+    res = await api.get(f"/api/assets/{ASSET_ID}")
+
+    assert res.status_code == 200
+    assert res.content == DATA
+    assert res.headers["content-type"] == "image/png"
+    assert res.headers["etag"] == asset["etag"]
+    assert res.headers["accept-ranges"] == "bytes"
+    assert "last-modified" in res.headers
+    if serving == "cached":
+        assert res.headers["x-cache"] == "miss"
+        again = await api.get(f"/api/assets/{ASSET_ID}")
+        assert again.headers["x-cache"] == "memory"
+        assert again.content == DATA
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=16000-", 16000, len(DATA) - 1),
+    ("bytes=-6", len(DATA) - 6, len(DATA) - 1),
+])
+async def test_range(api, asset, serving, range_header, start, end):
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"Range": range_header})
+
+    assert res.status_code == 206
+    assert res.content == DATA[start:end + 1]
+    assert res.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+
+
+async def test_unsatisfiable_range(api, asset, serving):
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"Range": f"bytes={len(DATA)}-"})
+
+    assert res.status_code == 416
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", "*"])
+async def test_if_none_match(api, asset, serving, if_none_match):
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-None-Match": if_none_match.format(etag=asset["etag"])})
+
+    assert res.status_code == 304
+    assert res.content == b""
+
+
+async def test_changed_etag_gets_the_object(api, asset, serving):
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-None-Match": '"stale"'})
+
+    assert res.status_code == 200
+    assert res.content == DATA
+
+
+async def test_if_modified_since(api, asset, serving):
+    last_modified = (await api.get(f"/api/assets/{ASSET_ID}")).headers["last-modified"]
+
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-Modified-Since": last_modified})
+    assert res.status_code == 304
+
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+    assert res.status_code == 200
+
+
+async def test_missing(api, mongo, bucket):
+    assert (await api.get(f"/api/assets/{'f' * 32}")).status_code == 404
+
+    await mongo.assets.insert_one({"asset_id": ASSET_ID, "path": "froala/gone.png", "size": 10})
+    assert (await api.get(f"/api/assets/{ASSET_ID}")).status_code == 404
+
+
+async def test_asctime_if_modified_since(api, asset, serving):
+    # Dates without a zone are GMT, as HTTP dates always are
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-Modified-Since": "Fri Dec 31 23:59:59 2100"})
+    assert res.status_code == 304
+
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"If-Modified-Since": "Mon Jan  1 00:00:00 2001"})
+    assert res.status_code == 200
+
+
+VARIANTS = [
+    {"key": f"froala/variants/{ASSET_ID}-w{w}.{ext}", "width": w, "mime": mime, "size": 4, "etag": f'"{ext}{w}"'}
+    for w in (320, 640, 1280) for ext, mime in (("webp", "image/webp"), ("jpg", "image/jpeg"))
+]
+
+
+@pytest.mark.parametrize("accept, width, expected", [
+    # Without a width the original stays unless a better format than JPEG is accepted
+    ("image/jpeg,*/*", None, None),
+    ("image/webp,*/*", None, "froala/variants/{id}-w1280.webp"),
+    # Smallest variant covering the requested width
+    ("image/webp,*/*", 500, "froala/variants/{id}-w640.webp"),
+    ("image/webp,*/*", 640, "froala/variants/{id}-w640.webp"),
+    ("image/webp,*/*", 4000, "froala/variants/{id}-w1280.webp"),
+    ("*/*", 300, "froala/variants/{id}-w320.jpg"),
+    # Wildcards and q=0 don't make a format acceptable
+    ("image/*", 300, "froala/variants/{id}-w320.jpg"),
+    ("image/webp;q=0, image/jpeg", 300, "froala/variants/{id}-w320.jpg"),
+    ("image/avif,image/webp;q=0.5", 300, "froala/variants/{id}-w320.webp"),
+])
+def test_pick_variant(accept, width, expected):
+    variant = assetsv2._pick_variant(VARIANTS, accept, width)
+
+    assert (variant["key"] if variant else None) == (expected.format(id=ASSET_ID) if expected else None)
+
+
+async def test_variant_served_by_accept_and_width(api, mongo, bucket):
+    for variant in VARIANTS:
+        bucket.put_object(Bucket=R2_BUCKET, Key=variant["key"], Body=variant["key"].encode())
+    bucket.put_object(Bucket=R2_BUCKET, Key="froala/a.png", Body=b"original")
+    await mongo.assets.insert_one({"asset_id": ASSET_ID, "path": "froala/a.png", "size": 8, "variants": VARIANTS})
+
+    res = await api.get(f"/api/assets/{ASSET_ID}?w=600", headers={"Accept": "image/webp,*/*"})
+    assert res.content == f"froala/variants/{ASSET_ID}-w640.webp".encode()
+    assert "Accept" in res.headers["vary"]
+
+    res = await api.get(f"/api/assets/{ASSET_ID}", headers={"Accept": "image/jpeg"})
+    assert res.content == b"original"
@@ -0,0 +1,165 @@
+import json
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+import auth
+import deps
+from deps import require_admin
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+def _key_pair(kid: str):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_pem = private.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private_pem, {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid, "use": "sig"}
+
+
+SIGNING_KEY, PUBLIC_JWK = _key_pair("k1")
+OTHER_KEY, _ = _key_pair("k1")
+
+
+class Clock:
+    # Starts at the real time, jose checks exp against the system clock
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    """Serves PUBLIC_JWK as Clerk's JWKS endpoint and counts the fetches."""
+    served = {"keys": [PUBLIC_JWK], "fetches": 0, "fail": False}
+    client = httpx.AsyncClient
+
+    def handler(request):
+        served["fetches"] += 1
+        if served["fail"]:
+            return httpx.Response(500)
+        return httpx.Response(200, content=json.dumps({"keys": served["keys"]}))
+
+    monkeypatch.setattr(auth.httpx, "AsyncClient", lambda **kwargs: client(transport=httpx.MockTransport(handler), **kwargs))
+    monkeypatch.setattr(auth, "jwks_cache", auth.JWKSCache(url="https://clerk.test/v1/jwks"))
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache())
+    return served
+
+
+def _token(key=SIGNING_KEY, kid="k1", **claims) -> str:
+    return jwt.encode({"sub": "user_1", **claims}, key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_token_cache_entries_end_at_ttl(clock):
+    cache = auth.TokenCache(ttl=60)
+    cache.put("t", {"sub": "user_1"})
+
+    clock.now += 59
+    assert cache.get("t") == {"sub": "user_1"}
+    clock.now += 1
+    assert cache.get("t") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_token_cache_entries_never_outlive_exp(clock):
+    cache = auth.TokenCache(ttl=60)
+    cache.put("soon", {"sub": "user_1", "exp": clock.now + 10})
+    cache.put("expired", {"sub": "user_1", "exp": clock.now - 1})
+
+    assert cache.get("expired") is None
+    clock.now += 10
+    assert cache.get("soon") is None
+
+
+def test_token_cache_evicts_least_recently_used(clock):
+    cache = auth.TokenCache(max_entries=2)
+    cache.put("a", {"sub": "a"})
+    cache.put("b", {"sub": "b"})
+    cache.get("a")
+    cache.put("c", {"sub": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"sub": "a"}
+    assert cache.get("c") == {"sub": "c"}
+
+
+async def test_unknown_kid_refreshes_once_per_interval(jwks, clock):
+    cache = auth.jwks_cache
+
+    assert (await cache.get_key("k1"))["kid"] == "k1"
+    assert jwks["fetches"] == 1
+    # Known kids come from memory, unknown ones don't refetch inside the floor
+    await cache.get_key("k1")
+    for _ in range(3):
+        with pytest.raises(auth.KeyUnavailable):
+            await cache.get_key("rotated")
+    assert jwks["fetches"] == 1
+
+    jwks["keys"] = [PUBLIC_JWK, {**PUBLIC_JWK, "kid": "rotated"}]
+    clock.now += cache.min_refresh_interval
+    assert (await cache.get_key("rotated"))["kid"] == "rotated"
+    assert jwks["fetches"] == 2
+
+
+async def test_failed_refresh_keeps_keys(jwks, clock):
+    cache = auth.jwks_cache
+    await cache.refresh(force=True)
+    jwks["fail"] = True
+
+    assert await cache.refresh(force=True) is False
+    assert (await cache.get_key("k1"))["kid"] == "k1"
+    assert cache.stats()["refresh_failures"] == 1
+
+
+@pytest.fixture
+async def anonymous(api, jwks):
+    app.dependency_overrides.pop(require_admin)
+    return api
+
+
+async def test_admin_verified_locally_then_cached(anonymous, jwks, clock):
+    token = _token(exp=clock.now + 300)
+
+    for _ in range(3):
+        res = await anonymous.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        assert res.status_code == 200
+    assert auth.stats()["token_cache"]["hits"] == 2
+    assert jwks["fetches"] == 1
+
+
+async def test_bad_signature_and_expired_tokens_rejected(anonymous, jwks, clock):
+    forged = _token(key=OTHER_KEY, exp=clock.now + 300)
+    res = await anonymous.get("/metrics", headers={"Authorization": f"Bearer {forged}"})
+    assert res.status_code == 401
+
+    expired = _token(exp=clock.now - 3600)
+    res = await anonymous.get("/metrics", headers={"Authorization": f"Bearer {expired}"})
+    assert res.status_code == 401
+    assert auth.token_cache.stats()["entries"] == 0
+
+
+async def test_only_the_admin_user_gets_in(anonymous, jwks, clock, monkeypatch):
+    monkeypatch.setattr(deps, "ADMIN_CLERK_ID", "user_admin")
+
+    res = await anonymous.get("/metrics", headers={"Authorization": f"Bearer {_token(exp=clock.now + 300)}"})
+    assert res.status_code == 403
+
+    res = await anonymous.get("/metrics", headers={"Authorization": f"Bearer {_token(sub='user_admin', exp=clock.now + 300)}"})
+    assert res.status_code == 200
@@ -0,0 +1,115 @@
+import httpx
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from pymongo.errors import OperationFailure
+
+from conftest import MONGO_TEST_URI
+from deps import require_admin
+from models import MAX_SPLICE_OFFSET
+from routers import posts
+
+pytestmark = pytest.mark.anyio
+
+
+def _mongomock_splice_stage(field: str, start: int, delete: int, insert: str) -> dict:
+    # mongomock has no $substrCP / $strLenCP, its $substr slices code points like $substrCP does
+    text = {"$ifNull": [f"${field}", ""]}
+    return {"$set": {field: {"$concat": [
+        {"$substr": [text, 0, start]},
+        {"$literal": insert},
+        {"$substr": [text, start + delete, MAX_SPLICE_OFFSET]},
+    ]}}}
+
+
+@pytest.fixture
+async def client(mongo, monkeypatch):
+    # Against a real server (MONGO_TEST_URI) the pipeline runs as shipped
+    if not MONGO_TEST_URI:
+        monkeypatch.setattr(posts, "_splice_stage", _mongomock_splice_stage)
+    app = FastAPI()
+    app.include_router(posts.router, prefix="/api")
+    app.dependency_overrides[require_admin] = lambda: {"clerk_user_id": "admin"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def _draft(mongo, **fields) -> str:
+    doc = {"_id": ObjectId(), "title": "T", "status": "draft", "body": "<p>héllo world</p>", "raw": "héllo world", **fields}
+    await mongo.posts.insert_one(doc)
+    return str(doc["_id"])
+
+
+def _patch(version: int, *splices) -> dict:
+    return {"version": version, "splices": [dict(zip(("field", "start", "delete", "insert"), s)) for s in splices]}
+
+
+async def test_stale_version_conflicts(client, mongo):
+    post_id = await _draft(mongo, version=3)
+
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(2, ("raw", 0, 0, "x")))
+
+    assert res.status_code == 409
+    assert res.json()["detail"] == {"message": "Version conflict", "version": 3}
+    assert (await mongo.posts.find_one({"_id": ObjectId(post_id)}))["raw"] == "héllo world"
+
+
+async def test_missing_post(client, mongo):
+    res = await client.patch(f"/api/posts/{ObjectId()}/autosave", json=_patch(0, ("raw", 0, 0, "x")))
+    assert res.status_code == 404
+
+    res = await client.patch("/api/posts/not-an-id/autosave", json=_patch(0, ("raw", 0, 0, "x")))
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("splice", [
+    ("raw", -1, 0, "x"),
+    ("raw", MAX_SPLICE_OFFSET + 1, 0, "x"),
+    ("raw", 0, 2 ** 31, ""),
+    ("title", 0, 0, "x"),
+])
+async def test_invalid_splices_rejected(client, mongo, splice):
+    post_id = await _draft(mongo)
+
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(0, splice))
+
+    assert res.status_code == 422
+
+
+async def test_splices_applied_in_order(client, mongo):
+    # Posts from before versioning count as version 0
+    post_id = await _draft(mongo)
+
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(
+        0,
+        ("raw", 0, 5, "hi"),
+        ("raw", 2, 0, " there,"),
+        ("body", 3, 5, "hey"),
+        ("raw", 15, 0, "!"),
+    ))
+
+    assert res.status_code == 200
+    assert res.json() == {"version": 1}
+    post = await mongo.posts.find_one({"_id": ObjectId(post_id)})
+    assert post["raw"] == "hi there, world!"
+    assert post["body"] == "<p>hey world</p>"
+    assert post["needs_sync"] is True
+
+    # The old base version now conflicts, the new one applies
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(0, ("raw", 0, 0, "x")))
+    assert res.status_code == 409
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(1, ("raw", 0, 0, "x")))
+    assert res.json() == {"version": 2}
+
+
+async def test_failed_pipeline_is_a_bad_request(client, mongo, monkeypatch):
+    post_id = await _draft(mongo)
+
+    async def fail(self, *args, **kwargs):
+        raise OperationFailure("too large", code=10334, details={"errmsg": "BSONObj size: 17000000 is invalid"})
+
+    monkeypatch.setattr(type(mongo.posts), "find_one_and_update", fail)
+    res = await client.patch(f"/api/posts/{post_id}/autosave", json=_patch(0, ("raw", 0, 0, "x")))
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Could not apply autosave: BSONObj size: 17000000 is invalid"
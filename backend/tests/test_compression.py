@@ -0,0 +1,99 @@
+import gzip
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+from bson import ObjectId
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+import fastjson
+from compression import CompressionMiddleware
+
+pytestmark = pytest.mark.anyio
+
+DOC = {"items": [{"title": f"post {i}", "summary": "words " * 20} for i in range(50)]}
+
+
+async def _json(request):
+    return fastjson.FastJSONResponse(DOC, headers={"ETag": '"v1"'})
+
+
+async def _small(request):
+    return fastjson.FastJSONResponse({"ok": True})
+
+
+async def _precompressed(request):
+    return Response(gzip.compress(b"<p>page</p>" * 200), media_type="text/html", headers={"Content-Encoding": "gzip"})
+
+
+async def _partial(request):
+    return Response(b"x" * 4096, status_code=206, media_type="text/plain")
+
+
+async def _image(request):
+    return Response(b"x" * 4096, media_type="image/png")
+
+
+async def _stream(request):
+    async def chunks():
+        for i in range(3):
+            yield b"line %d " % i * 500
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+app = CompressionMiddleware(Starlette(routes=[
+    Route("/json", _json), Route("/small", _small), Route("/precompressed", _precompressed),
+    Route("/partial", _partial), Route("/image", _image), Route("/stream", _stream),
+]))
+
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [("gzip, br", "br"), ("gzip", "gzip"), ("br;q=0, gzip", "gzip"), ("*", "br"), ("identity", None)])
+async def test_json_compressed_in_the_accepted_encoding(client, accept_encoding, expected):
+    res = await client.get("/json", headers={"Accept-Encoding": accept_encoding})
+
+    assert res.headers.get("content-encoding") == expected
+    assert res.json() == DOC
+    if expected:
+        assert int(res.headers["content-length"]) < len(fastjson.dumps(DOC))
+        assert res.headers["etag"] == 'W/"v1"'
+        assert "Accept-Encoding" in res.headers["vary"]
+    else:
+        assert res.headers["etag"] == '"v1"'
+
+
+@pytest.mark.parametrize("path", ["/small", "/precompressed", "/partial", "/image"])
+async def test_passthrough(client, path):
+    res = await client.get(path, headers={"Accept-Encoding": "br, gzip"})
+
+    assert res.headers.get("content-encoding") == ("gzip" if path == "/precompressed" else None)
+    assert "vary" not in res.headers
+    if path == "/precompressed":
+        # Encoded once by the handler, not twice
+        assert res.content == b"<p>page</p>" * 200
+
+
+async def test_streamed_responses_compressed_per_chunk(client):
+    res = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert res.headers["content-encoding"] == "gzip"
+    assert "content-length" not in res.headers
+    assert res.text == "".join("line %d " % i * 500 for i in range(3))
+
+
+def test_fastjson_serializes_mongo_documents():
+    oid = ObjectId()
+    doc = {"_id": oid, "at": datetime(2025, 1, 2, 3, 4, 5), "tags": {"a"}, 1: "int key", "title": "héllo"}
+
+    assert json.loads(fastjson.dumps(doc)) == {
+        "_id": str(oid), "at": "2025-01-02T03:04:05", "tags": ["a"], "1": "int key", "title": "héllo",
+    }
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import db
+from postcache import post_cache
+from routers import public
+
+pytestmark = pytest.mark.anyio
+
+
+def test_missing_compressors_are_skipped_with_a_warning(monkeypatch, capsys):
+    monkeypatch.setattr(db, "MONGO_COMPRESSORS", "zstd, snappy,lz4,zlib")
+    monkeypatch.setattr(db.importlib.util, "find_spec", lambda name: name != "snappy")
+
+    assert db._compressors() == ["zstd", "zlib"]
+    assert "skipping snappy, lz4" in capsys.readouterr().out
+
+
+def test_default_compressors_are_installed(capsys):
+    assert db._compressors() == ["zstd", "zlib"]
+    assert capsys.readouterr().out == ""
+
+
+async def test_health(api, mongo):
+    res = await api.get("/health")
+
+    assert res.status_code == 200
+    assert res.json()["ok"] is True
+
+
+async def test_health_is_503_without_mongo(api, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    client = SimpleNamespace(admin=SimpleNamespace(command=unreachable))
+    monkeypatch.setattr(db, "get_client", lambda: client)
+    # The timeout default is bound when ping_db is defined
+    monkeypatch.setattr(db.ping_db, "__defaults__", (0.01,))
+
+    res = await api.get("/health")
+
+    assert res.status_code == 503
+    assert res.json()["db"]["ok"] is False
+
+
+async def test_public_reads_use_the_primary_right_after_an_edit(api, monkeypatch):
+    assert await public._reader() is db.public_db
+
+    await post_cache.invalidate_post({"_id": "p1"})
+    assert await public._reader() is db.db
+
+    monkeypatch.setattr(post_cache, "primary_window", 0)
+    assert await public._reader() is db.public_db
+
+
+def test_pool_metrics_from_pool_events():
+    metrics = db.PoolMetrics()
+    for _ in range(3):
+        metrics.connection_created(None)
+    metrics.connection_checked_out(SimpleNamespace(duration=0.002))
+    metrics.connection_checked_out(SimpleNamespace(duration=0.004))
+    metrics.connection_checked_in(None)
+    metrics.connection_check_out_failed(None)
+
+    stats = metrics.stats()
+    assert (stats["open"], stats["in_use"], stats["checkouts"], stats["checkout_failures"]) == (3, 1, 2, 1)
+    assert stats["checkout_wait_ms"]["avg"] == 3.0
+    assert stats["checkout_wait_ms"]["max"] == 4.0
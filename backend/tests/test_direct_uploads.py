@@ -0,0 +1,117 @@
+import os
+
+import httpx
+import pytest
+
+import routers.assetsv2 as assetsv2
+from objectstore import R2_BUCKET
+from test_uploads import _image
+
+pytestmark = pytest.mark.anyio
+
+
+async def _create(api, data: bytes, kind: str = "froala", content_type: str = "image/png") -> dict:
+    res = await api.post("/api/assets/uploads", json={"filename": "a.png", "content_type": content_type, "size": len(data), "kind": kind})
+    assert res.status_code == 200
+    return res.json()
+
+
+async def _put(ticket: dict, data: bytes):
+    # What the browser does with the presigned URL(s)
+    async with httpx.AsyncClient() as browser:
+        if "url" in ticket:
+            res = await browser.put(ticket["url"], content=data, headers=ticket["headers"])
+            assert res.status_code == 200
+            return None
+        parts = []
+        for part in ticket["parts"]:
+            offset = (part["part_number"] - 1) * ticket["part_size"]
+            res = await browser.put(part["url"], content=data[offset:offset + ticket["part_size"]])
+            assert res.status_code == 200
+            parts.append({"part_number": part["part_number"], "etag": res.headers["etag"]})
+        return {"parts": parts}
+
+
+async def test_single_put(api, mongo, bucket):
+    data = _image()
+    ticket = await _create(api, data)
+    await _put(ticket, data)
+
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+
+    assert res.status_code == 200
+    asset_id = res.json()["asset_id"]
+    assert asset_id == ticket["upload_id"]
+    # Processing ran as a background task of the request
+    asset = await mongo.assets.find_one({"asset_id": asset_id})
+    assert asset["processing"] == "done"
+    assert asset["variants"]
+    assert (await mongo.blobs.find_one({"_id": asset["blob_id"]}))["refs"] == 1
+    assert (await mongo.uploads.find_one({"_id": ticket["upload_id"]}))["status"] == "done"
+    assert (await api.get(f"/api/assets/{asset_id}", headers={"Accept": "image/png"})).content == data
+
+    # A second /complete doesn't make a second asset
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+    assert res.status_code == 404
+
+
+async def test_multipart(api, mongo, bucket, monkeypatch):
+    monkeypatch.setattr(assetsv2, "MULTIPART_PART_SIZE", 5 * 1024 * 1024)
+    data = os.urandom(5 * 1024 * 1024 + 100)
+    ticket = await _create(api, data)
+    assert len(ticket["parts"]) == 2
+    body = await _put(ticket, data)
+
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete", json=body)
+
+    assert res.status_code == 200
+    stored = bucket.get_object(Bucket=R2_BUCKET, Key=ticket["key"])
+    assert stored["Body"].read() == data
+
+
+async def test_object_not_matching_the_ticket(api, mongo, bucket):
+    data = _image()
+    ticket = await _create(api, data)
+    bucket.put_object(Bucket=R2_BUCKET, Key=ticket["key"], Body=data + b"extra", ContentType="image/png")
+
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+
+    assert res.status_code == 400
+    assert (await mongo.uploads.find_one({"_id": ticket["upload_id"]}))["status"] == "failed"
+    assert bucket.list_objects_v2(Bucket=R2_BUCKET).get("KeyCount") == 0
+    assert await mongo.assets.count_documents({}) == 0
+
+
+async def test_missing_object(api, mongo, bucket):
+    ticket = await _create(api, _image())
+
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Object was not uploaded"
+
+
+async def test_transient_error_hands_the_ticket_back(api, mongo, bucket, monkeypatch):
+    data = _image()
+    ticket = await _create(api, data)
+    await _put(ticket, data)
+    head_object = assetsv2.head_object
+
+    async def unreachable(*args, **kwargs):
+        raise httpx.ConnectError("connection reset")
+
+    monkeypatch.setattr(assetsv2, "head_object", unreachable)
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+    assert res.status_code == 502
+    assert (await mongo.uploads.find_one({"_id": ticket["upload_id"]}))["status"] == "pending"
+
+    monkeypatch.setattr(assetsv2, "head_object", head_object)
+    res = await api.post(f"/api/assets/uploads/{ticket['upload_id']}/complete")
+    assert res.status_code == 200
+
+
+async def test_rejected_tickets(api, mongo, bucket):
+    res = await api.post("/api/assets/uploads", json={"filename": "a.svg", "content_type": "image/svg+xml", "size": 10})
+    assert res.status_code == 400
+    res = await api.post("/api/assets/uploads", json={"filename": "a.png", "content_type": "image/png", "size": assetsv2.DIRECT_UPLOAD_MAX_BYTES + 1})
+    assert res.status_code == 413
@@ -0,0 +1,49 @@
+import pytest
+from starlette.requests import Request
+
+import httpcache
+
+CACHE_CONTROL = httpcache.cache_control(60, 600)
+
+
+def _request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_tagged_entry():
+    entry = httpcache.tagged({"a": 1}, total=1)
+    assert entry["json"] == '{"a":1}'
+    assert entry["etag"] == httpcache.etag_for(b'{"a":1}')
+    assert entry["total"] == 1
+
+
+def test_full_response_without_validator():
+    entry = httpcache.tagged({"a": 1})
+    response = httpcache.respond(_request(), entry, CACHE_CONTROL, {"X-Total-Count": "1"})
+
+    assert response.status_code == 200
+    assert response.body == b'{"a":1}'
+    assert response.headers["etag"] == entry["etag"]
+    assert response.headers["cache-control"] == "public, max-age=60, stale-while-revalidate=600"
+    assert response.headers["x-total-count"] == "1"
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+def test_not_modified(if_none_match):
+    entry = httpcache.tagged({"a": 1})
+    request = _request(if_none_match=if_none_match.format(etag=entry["etag"]))
+    response = httpcache.respond(request, entry, CACHE_CONTROL)
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == entry["etag"]
+    assert response.headers["cache-control"] == CACHE_CONTROL
+
+
+def test_stale_etag_gets_full_response():
+    entry = httpcache.tagged({"a": 2})
+    response = httpcache.respond(_request(if_none_match=httpcache.tagged({"a": 1})["etag"]), entry, CACHE_CONTROL)
+
+    assert response.status_code == 200
+    assert response.body == b'{"a":2}'
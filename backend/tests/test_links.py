@@ -0,0 +1,95 @@
+import links
+
+A = "a" * 32
+B = "b" * 32
+BASE = links.BACKEND_BASE
+VARIANTS = [(320, f"https://cdn.example.com/{A}-320.webp"), (640, f"https://cdn.example.com/{A}-640.webp")]
+
+
+def _resolve(asset_id):
+    if asset_id == A:
+        return {"url": f"https://cdn.example.com/{A}.jpg?a=1&b=2", "srcset": f"https://cdn.example.com/{A}-640.jpg 640w", "variants": VARIANTS}
+    return None
+
+
+URL = f"https://cdn.example.com/{A}.jpg?a=1&amp;b=2"
+
+
+def test_asset_ids_in_document_order():
+    markup = (
+        f'<p><img src="/api/assets/{B}"><img srcset="{BASE}/api/assets/{A}?w=1 1x, /api/assets/{B} 2x"></p>'
+        f'<a href="/api/assets/{A}">link</a>'
+    )
+    assert links.asset_ids(markup) == [B, A]
+    assert links.asset_ids("<p>no images</p>") == []
+
+
+def test_other_hosts_are_not_asset_links():
+    markup = f'<img src="https://evil.example/api/assets/{A}"><img src="//evil.example/api/assets/{A}">'
+
+    assert links.asset_ids(markup) == []
+    assert links.rewrite_asset_links(markup, _resolve) == markup
+
+
+def test_backend_base_links_match_case_insensitively():
+    assert links.asset_ids(f'<img src="{BASE.upper()}/api/assets/{A}">') == [A]
+
+
+def test_text_and_scripts_are_not_links():
+    markup = f"<p>/api/assets/{A}</p><script>load('/api/assets/{A}')</script>"
+    assert links.asset_ids(markup) == []
+    assert links.rewrite_asset_links(markup, _resolve) == markup
+
+
+def test_rewrite_src_adds_srcset():
+    markup = f'<p>Hi</p>\n<img class="x" src="/api/assets/{A}" alt="a &amp; b"/>\n<p>/api/assets/{A}</p>'
+    out = links.rewrite_asset_links(markup, _resolve)
+
+    assert out == (
+        f'<p>Hi</p>\n<img class="x" src="{URL}" alt="a &amp; b"'
+        f' srcset="https://cdn.example.com/{A}-640.jpg 640w"/>\n<p>/api/assets/{A}</p>'
+    )
+
+
+def test_escaped_links_are_rewritten():
+    markup = f'<a href="{BASE}/api/assets/{A}?download=1&amp;x=2">x</a>'
+
+    assert links.rewrite_asset_links(markup, _resolve) == f'<a href="{URL}">x</a>'
+
+
+def test_other_attributes_are_left_alone():
+    # The alt text quotes the link, only src changes
+    markup = f'<img alt="/api/assets/{A}" title=\'say "hi"\' src="/api/assets/{A}" hidden>'
+
+    assert links.rewrite_asset_links(markup, _resolve) == (
+        f'<img alt="/api/assets/{A}" title="say &quot;hi&quot;" src="{URL}" hidden'
+        f' srcset="https://cdn.example.com/{A}-640.jpg 640w">'
+    )
+
+
+def test_width_picks_the_covering_variant():
+    markup = f'<img src="/api/assets/{A}?w=500"><img src="/api/assets/{A}?w=320"><img src="/api/assets/{A}?w=4000">'
+
+    assert links.rewrite_asset_links(markup, _resolve) == (
+        f'<img src="{VARIANTS[1][1]}"><img src="{VARIANTS[0][1]}"><img src="{VARIANTS[1][1]}">'
+    )
+
+
+def test_width_without_variants_uses_the_original():
+    markup = f'<img src="/api/assets/{A}?w=500">'
+
+    assert links.rewrite_asset_links(markup, lambda asset_id: {"url": "https://cdn.example.com/a.png"}) == '<img src="https://cdn.example.com/a.png">'
+
+
+def test_existing_srcset_is_rewritten_not_added():
+    markup = f'<img src="/api/assets/{A}" srcset="/api/assets/{A} 2x, /api/assets/{A}?w=320 320w">'
+    out = links.rewrite_asset_links(markup, _resolve)
+
+    assert out == f'<img src="{URL}" srcset="{URL} 2x, {VARIANTS[0][1]} 320w">'
+
+
+def test_unresolved_links_are_kept():
+    markup = f'<img src="/api/assets/{B}"><a href="{BASE}/api/assets/{A}?download=1">x</a>'
+    out = links.rewrite_asset_links(markup, _resolve)
+
+    assert out == f'<img src="/api/assets/{B}"><a href="{URL}">x</a>'
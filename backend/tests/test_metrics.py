@@ -0,0 +1,41 @@
+import pytest
+
+import auth
+import deps
+from deps import require_admin
+from main import app
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def anonymous(api):
+    # The api client without the admin override
+    app.dependency_overrides.pop(require_admin)
+    return api
+
+
+async def test_metrics_need_auth(anonymous):
+    res = await anonymous.get("/metrics")
+    assert res.status_code == 401
+
+    res = await anonymous.get("/metrics", headers={"Authorization": "Bearer not-a-jwt"})
+    assert res.status_code == 401
+
+
+async def test_metrics_token(anonymous, monkeypatch):
+    monkeypatch.setattr(deps, "METRICS_TOKEN", "scrape-me")
+
+    res = await anonymous.get("/metrics", headers={"Authorization": "Bearer scrape-me"})
+    assert res.status_code == 200
+    assert {"object_cache", "image_pool", "rate_limits", "mongo_pool"} <= set(res.json())
+
+    res = await anonymous.get("/metrics", headers={"Authorization": "Bearer scrape-you"})
+    assert res.status_code == 401
+
+
+async def test_metrics_for_admins(anonymous):
+    auth.token_cache.put("admin-session", {"sub": "user_1"})
+
+    res = await anonymous.get("/metrics", headers={"Authorization": "Bearer admin-session"})
+    assert res.status_code == 200
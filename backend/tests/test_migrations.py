@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import migrations
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_fresh_database_gets_every_migration(mongo):
+    await mongo.posts.insert_one({"title": "Old post", "body": "<p>before search</p>"})
+
+    assert await migrations.migrate(mongo) == migrations.LATEST_VERSION
+
+    state = await mongo.schema_migrations.find_one({"_id": migrations.STATE_ID})
+    assert [a["version"] for a in state["applied"]] == [n for n, _, _ in migrations.MIGRATIONS]
+    assert "search_terms_1" in await mongo.posts.index_information()
+    assert (await mongo.posts.find_one())["search_terms"] == ["before", "old", "post", "search"]
+    # The lock is released
+    assert await mongo.schema_migrations.find_one({"_id": migrations.LOCK_ID}) is None
+
+
+async def test_up_to_date_database_applies_nothing(mongo, monkeypatch):
+    await migrations.migrate(mongo)
+    applied = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(n, name, lambda db, n=n: _record(applied, n)) for n, name, _ in migrations.MIGRATIONS])
+
+    await migrations.migrate(mongo)
+
+    assert applied == []
+
+
+async def test_only_pending_migrations_run(mongo, monkeypatch):
+    applied = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(n, f"m{n}", lambda db, n=n: _record(applied, n)) for n in (1, 2, 3)])
+    monkeypatch.setattr(migrations, "LATEST_VERSION", 3)
+    await mongo.schema_migrations.insert_one({"_id": migrations.STATE_ID, "version": 1})
+
+    assert await migrations.migrate(mongo) == 3
+    assert applied == [2, 3]
+
+
+async def test_concurrent_workers_migrate_once(mongo, monkeypatch):
+    applied = []
+
+    async def slow(db):
+        applied.append(1)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(1, "slow", slow)])
+    monkeypatch.setattr(migrations, "LATEST_VERSION", 1)
+    monkeypatch.setattr(migrations.socket, "gethostname", iter(["worker-1", "worker-2"]).__next__)
+
+    assert await asyncio.gather(migrations.migrate(mongo), migrations.migrate(mongo)) == [1, 1]
+    assert applied == [1]
+
+
+async def test_held_lock_times_out_and_expired_lock_is_taken(mongo):
+    now = datetime.now(timezone.utc)
+    await mongo.schema_migrations.insert_one({"_id": migrations.LOCK_ID, "owner": "other", "expires_at": now + timedelta(minutes=5)})
+
+    with pytest.raises(RuntimeError):
+        await migrations.migrate(mongo, wait=0)
+
+    # A worker that died mid-migration leaves a lock that expires
+    await mongo.schema_migrations.update_one({"_id": migrations.LOCK_ID}, {"$set": {"expires_at": now - timedelta(seconds=1)}})
+    assert await migrations.migrate(mongo, wait=0) == migrations.LATEST_VERSION
+
+
+async def _record(applied, number):
+    applied.append(number)
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+
+from models import post_list_projection, POST_SUMMARY_FIELDS
+
+pytestmark = pytest.mark.anyio
+
+POST = {
+    "title": "Heavy", "slug": "heavy", "summary": "s", "tags": ["t"], "status": "published", "is_deleted": False,
+    "created_at": datetime(2025, 1, 1), "published_at": datetime(2025, 1, 2),
+    "raw": "r" * 1000, "body": "<p>draft</p>", "published_body": "<p>published</p>", "meta": {"k": "v"},
+    "froala_asset_id_list": ["a"], "search_terms": ["heavy"],
+}
+SUMMARY_KEYS = {"id", "title", "slug", "summary", "tags", "status", "is_deleted", "created_at", "published_at"}
+
+
+def test_projection_allowlists_extra_fields():
+    assert set(post_list_projection()) == set(POST_SUMMARY_FIELDS)
+    assert set(post_list_projection(" body, meta ,search_terms,password")) == {*POST_SUMMARY_FIELDS, "body", "meta"}
+
+
+@pytest.mark.parametrize("path", ["/api/public/posts", "/api/posts"])
+async def test_lists_return_the_summary_shape(api, mongo, path):
+    await mongo.posts.insert_one(dict(POST))
+
+    [post] = (await api.get(path)).json()
+
+    assert set(post) == SUMMARY_KEYS
+
+
+async def test_extra_fields_on_request(api, mongo):
+    await mongo.posts.insert_one(dict(POST))
+
+    [admin] = (await api.get("/api/posts", params={"fields": "body,raw,search_terms"})).json()
+    [public] = (await api.get("/api/public/posts", params={"fields": "body"})).json()
+
+    assert set(admin) == SUMMARY_KEYS | {"body", "raw"}
+    # Readers get the published copy of the body
+    assert admin["body"] == "<p>draft</p>"
+    assert public["body"] == "<p>published</p>"
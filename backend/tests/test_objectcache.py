@@ -0,0 +1,88 @@
+import os
+
+from objectcache import ObjectCache, AssetDocCache
+
+
+def test_memory_tier_spills_to_disk(tmp_path):
+    cache = ObjectCache(memory_bytes=100, memory_item_bytes=60, disk_dir=str(tmp_path), disk_bytes=1000)
+    cache.put("a", '"1"', b"a" * 60, {"ETag": '"1"'})
+    cache.put("b", '"1"', b"b" * 60, {"ETag": '"1"'})
+
+    # a was the least recently used, it moved to disk
+    hit = cache.get("a", '"1"')
+    assert hit.tier == "disk"
+    assert hit.data[:] == b"a" * 60
+    hit.close()
+    assert cache.get("b", '"1"').tier == "memory"
+    # Too large for memory, straight to disk
+    cache.put("c", None, b"c" * 200, {})
+    assert cache.get("c").tier == "disk"
+    stats = cache.stats()
+    assert stats["memory_evictions"] == 1
+    assert stats["disk_entries"] == 2
+    cache.close()
+
+
+def test_entries_are_keyed_by_etag():
+    cache = ObjectCache(disk_dir=None)
+    cache.put("a", '"1"', b"old", {})
+
+    assert cache.get("a", '"2"') is None
+    assert cache.get("a", '"1"').data == b"old"
+
+
+def test_invalidate_drops_every_version(tmp_path):
+    cache = ObjectCache(memory_bytes=10, memory_item_bytes=10, disk_dir=str(tmp_path), disk_bytes=1000)
+    cache.put("a", '"1"', b"x" * 8, {})
+    cache.put("a", '"2"', b"y" * 8, {})
+    cache.put("b", '"1"', b"z" * 8, {})
+
+    cache.invalidate("a")
+
+    assert cache.get("a", '"1"') is None
+    assert cache.get("a", '"2"') is None
+    assert cache.get("b", '"1"') is not None
+    assert cache.stats()["invalidations"] == 2
+    cache.close()
+
+
+def test_disk_lfu_keeps_hot_entries(tmp_path):
+    cache = ObjectCache(memory_bytes=0, memory_item_bytes=0, disk_dir=str(tmp_path), disk_bytes=20, disk_policy="lfu")
+    cache.put("hot", None, b"h" * 10, {})
+    cache.put("cold", None, b"c" * 10, {})
+    cache.get("hot").close()
+
+    cache.put("new", None, b"n" * 10, {})
+
+    assert cache.get("cold") is None
+    assert cache.get("hot") is not None
+    cache.close()
+
+
+def test_stale_worker_dirs_are_removed(tmp_path):
+    # A dead worker's directory, and one of a live process that isn't ours
+    dead = tmp_path / "999999999"
+    dead.mkdir()
+    (dead / "entry").write_bytes(b"x")
+    alive = tmp_path / str(os.getppid())
+    alive.mkdir()
+
+    cache = ObjectCache(disk_dir=str(tmp_path))
+
+    assert not dead.exists()
+    assert alive.exists()
+    assert os.path.isdir(cache.disk_dir)
+    cache.close()
+    assert not os.path.exists(cache.disk_dir)
+
+
+def test_asset_doc_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("objectcache.time.monotonic", lambda: now[0])
+    cache = AssetDocCache(maxsize=2, ttl=60)
+    cache.put("a", {"asset_id": "a"})
+
+    assert cache.get("a") == {"asset_id": "a"}
+    now[0] += 61
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
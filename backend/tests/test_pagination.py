@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import pagination
+from pagination import NEXT_CURSOR_HEADER
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2025, 1, 1)
+
+
+def _posts(field, count):
+    # Pairs of posts share a timestamp, so pages also have to break ties on _id
+    return [
+        {"_id": ObjectId(), "title": f"post {i}", "slug": f"post-{i}", "status": "published", "is_deleted": False,
+         field: START - timedelta(days=i // 2)}
+        for i in range(count)
+    ]
+
+
+async def _walk(api, path, limit, **params):
+    titles, cursor, pages = [], None, 0
+    while True:
+        res = await api.get(path, params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})})
+        assert res.status_code == 200
+        titles += [p["title"] for p in res.json()]
+        pages += 1
+        cursor = res.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            return titles, pages
+
+
+@pytest.mark.parametrize("path, field", [("/api/public/posts", "published_at"), ("/api/posts", "created_at")])
+async def test_cursor_walks_every_post_once(api, mongo, path, field):
+    posts = _posts(field, 7)
+    await mongo.posts.insert_many(posts)
+    expected = [p["title"] for p in sorted(posts, key=lambda p: (p[field], p["_id"]), reverse=True)]
+
+    titles, pages = await _walk(api, path, 3)
+
+    assert titles == expected
+    assert pages == 3
+
+
+async def test_posts_published_mid_scroll_dont_shift_pages(api, mongo):
+    posts = _posts("published_at", 6)
+    await mongo.posts.insert_many(posts)
+    first = await api.get("/api/public/posts", params={"limit": 3})
+
+    newest = {**_posts("published_at", 1)[0], "title": "newest", "published_at": START + timedelta(days=1)}
+    await mongo.posts.insert_one(newest)
+    second = await api.get("/api/public/posts", params={"limit": 3, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+
+    expected = [p["title"] for p in sorted(posts, key=lambda p: (p["published_at"], p["_id"]), reverse=True)]
+    assert [p["title"] for p in second.json()] == expected[3:]
+
+
+async def test_last_full_page_points_at_an_empty_one(api, mongo):
+    await mongo.posts.insert_many(_posts("published_at", 3))
+
+    res = await api.get("/api/public/posts", params={"limit": 3})
+    last = await api.get("/api/public/posts", params={"limit": 3, "cursor": res.headers[NEXT_CURSOR_HEADER]})
+
+    assert last.json() == []
+    assert NEXT_CURSOR_HEADER not in last.headers
+
+
+def test_cursor_round_trip_and_missing_values_sort_last():
+    oid = ObjectId()
+    cursor = pagination.encode_cursor({"_id": oid, "published_at": START}, "published_at")
+
+    assert pagination.decode_cursor(cursor, "published_at") == (START, oid)
+    assert pagination.keyset_filter("published_at", pagination.encode_cursor({"_id": oid}, "published_at")) == {
+        "published_at": None, "_id": {"$lt": oid},
+    }
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", pagination.encode_cursor({"_id": ObjectId(), "created_at": START}, "created_at")])
+def test_bad_or_foreign_cursor_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        pagination.decode_cursor(cursor, "published_at")
+    assert exc.value.status_code == 400
+
+
+async def test_bad_cursor_is_a_400(api, mongo):
+    res = await api.get("/api/public/posts", params={"cursor": "garbage"})
+
+    assert res.status_code == 400
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import postcache
+from postcache import PostCache, MemoryBackend
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def cache():
+    return PostCache(MemoryBackend())
+
+
+async def test_loads_once_then_serves_from_cache(cache):
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return {"title": "a"}
+
+    assert await cache.get_or_load("k", load) == {"title": "a"}
+    assert await cache.get_or_load("k", load) == {"title": "a"}
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1
+
+
+async def test_concurrent_misses_share_one_load(cache):
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return {"title": "a"}
+
+    results = await asyncio.gather(*[cache.get_or_load("k", load) for _ in range(5)])
+
+    assert results == [{"title": "a"}] * 5
+    assert len(loads) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+async def test_invalidation_drops_the_post_and_every_listing(cache):
+    post = {"_id": "p1", "slug": "new-slug"}
+    await cache.get_or_load(cache.slug_key("old-slug"), lambda: _value("old"))
+    await cache.get_or_load(cache.id_key("p1"), lambda: _value("old"))
+    list_key = await cache.list_key({"tag": "x"})
+    await cache.get_or_load(list_key, lambda: _value("old"))
+
+    await cache.invalidate_post(post, "old-slug")
+
+    assert await cache.get_or_load(cache.slug_key("old-slug"), lambda: _value("new")) == "new"
+    assert await cache.get_or_load(cache.id_key("p1"), lambda: _value("new")) == "new"
+    assert await cache.list_key({"tag": "x"}) != list_key
+    assert await cache.recently_invalidated()
+
+
+async def test_load_racing_an_invalidation_is_not_stored(cache):
+    async def load():
+        await cache.invalidate_post({"_id": "p1"})
+        return "pre-edit"
+
+    assert await cache.get_or_load("k", load) == "pre-edit"
+    assert await cache.get_or_load("k", lambda: _value("post-edit")) == "post-edit"
+
+
+async def _value(value):
+    return value
+
+
+@pytest.mark.parametrize("env, expected", [(None, 1), ("4", 4), ("many", 1)])
+def test_worker_count_from_web_concurrency(monkeypatch, env, expected):
+    monkeypatch.setattr("sys.argv", ["uvicorn", "main:app", "--workers", "8"])
+    if env is None:
+        monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    else:
+        monkeypatch.setenv("WEB_CONCURRENCY", env)
+
+    assert postcache._worker_count() == expected
+
+
+async def test_admin_edits_show_up_on_the_public_endpoints(api, mongo):
+    post = {"title": "Before", "slug": "a-post", "status": "published", "is_deleted": False, "published_at": datetime(2025, 1, 1)}
+    post_id = str((await mongo.posts.insert_one(post)).inserted_id)
+    assert (await api.get("/api/public/post/a-post")).json()["title"] == "Before"
+    assert [p["title"] for p in (await api.get("/api/public/posts")).json()] == ["Before"]
+
+    # Straight to the database, the cache keeps answering
+    await mongo.posts.update_one({"slug": "a-post"}, {"$set": {"title": "Sneaky"}})
+    assert (await api.get("/api/public/post/a-post")).json()["title"] == "Before"
+
+    res = await api.patch(f"/api/posts/{post_id}/delete")
+    assert res.status_code == 200
+
+    assert (await api.get("/api/public/post/a-post")).status_code == 400
+    assert (await api.get("/api/public/posts")).json() == []
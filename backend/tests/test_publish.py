@@ -0,0 +1,79 @@
+import gzip
+from datetime import datetime
+
+import brotli
+import pytest
+
+import publish
+from objectstore import R2_BUCKET
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, "identity"),
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("x-gzip", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("*", "br"),
+    ("*;q=0", "identity"),
+    ("deflate", "identity"),
+])
+def test_pick_encoding(accept_encoding, expected):
+    assert publish.pick_encoding(accept_encoding, {"identity": {}, "gzip": {}, "br": {}}) == expected
+
+
+def test_pick_encoding_only_offers_stored_encodings():
+    assert publish.pick_encoding("br", {"identity": {}, "gzip": {}}) == "identity"
+
+
+def test_encode_page_skips_encodings_that_dont_shrink():
+    page = b"<p>" + b"hello world " * 200 + b"</p>"
+
+    encoded = publish.encode_page(page)
+    assert gzip.decompress(encoded["gzip"]) == page
+    assert brotli.decompress(encoded["br"]) == page
+
+    assert set(publish.encode_page(b"x")) == {"identity"}
+
+
+@pytest.fixture
+async def published(api, mongo, bucket):
+    post = {"title": "A <title>", "slug": "a-post", "body": "<p>" + "Words and more words. " * 100 + "</p>",
+            "status": "published", "is_deleted": False, "published_at": datetime(2025, 1, 1)}
+    post["_id"] = (await mongo.posts.insert_one(dict(post))).inserted_id
+    encodings = await publish.publish_post(post)
+    return {**post, **await mongo.posts.find_one({"_id": post["_id"]})}, encodings
+
+
+async def test_publish_stores_every_encoding(published, bucket):
+    post, encodings = published
+
+    assert set(encodings) == {"identity", "gzip", "br"}
+    page = bucket.get_object(Bucket=R2_BUCKET, Key=publish.page_key(str(post["_id"])))["Body"].read()
+    assert b"<title>A &lt;title&gt;</title>" in page
+    assert gzip.decompress(bucket.get_object(Bucket=R2_BUCKET, Key=encodings["gzip"]["key"])["Body"].read()) == page
+    assert brotli.decompress(bucket.get_object(Bucket=R2_BUCKET, Key=encodings["br"]["key"])["Body"].read()) == page
+
+
+@pytest.mark.parametrize("accept_encoding, content_encoding", [("br, gzip", "br"), ("gzip", "gzip"), ("identity", None)])
+async def test_page_served_in_the_accepted_encoding(api, published, accept_encoding, content_encoding):
+    post, encodings = published
+
+    res = await api.get(f"/api/assets/{post['html_asset_id']}", headers={"Accept-Encoding": accept_encoding})
+
+    assert res.status_code == 200
+    assert res.headers.get("content-encoding") == content_encoding
+    assert "Accept-Encoding" in res.headers["vary"]
+    assert int(res.headers["content-length"]) == encodings[content_encoding or "identity"]["size"]
+    assert b"Words and more words." in res.content
+
+
+async def test_republish_reuses_the_page_asset(mongo, published):
+    post, _ = published
+
+    await publish.publish_post({**post, "body": "<p>Edited</p>"})
+
+    assert await mongo.assets.count_documents({"post_id": str(post["_id"])}) == 1
+    assert (await mongo.posts.find_one({"_id": post["_id"]}))["html_asset_id"] == post["html_asset_id"]
@@ -0,0 +1,58 @@
+import pytest
+
+import references
+
+pytestmark = pytest.mark.anyio
+
+A, B, C = "a" * 32, "b" * 32, "c" * 32
+
+
+async def _seed(mongo, body: str, ids: list, keys: list) -> dict:
+    for asset_id in (A, B, C):
+        await mongo.assets.insert_one({
+            "asset_id": asset_id,
+            "path": f"froala/{asset_id}.png",
+            "blob_key": f"blobs/{asset_id}.png",
+            "used_by_post": asset_id in ids,
+        })
+    post = {"_id": "p1", "body": body, "froala_asset_id_list": ids, "froala_image_key_list": keys}
+    await mongo.posts.insert_one(post)
+    return post
+
+
+async def _used(mongo) -> dict:
+    return {a["asset_id"]: a["used_by_post"] async for a in mongo.assets.find({})}
+
+
+async def test_lists_follow_the_body(mongo):
+    # A was removed from the body, C pasted in, legacy keys without an asset are kept
+    post = await _seed(mongo, f'<img src="/api/assets/{B}"><img src="/api/assets/{C}">', [A, B], [
+        f"blobs/{A}.png", f"blobs/{B}.png", "froala/legacy.png",
+    ])
+
+    result = await references.reconcile_post_assets(post)
+
+    assert result == {"added": [C], "removed": [A]}
+    stored = await mongo.posts.find_one({"_id": "p1"})
+    assert stored["froala_asset_id_list"] == [B, C]
+    assert stored["froala_image_key_list"] == [f"blobs/{B}.png", f"blobs/{C}.png", "froala/legacy.png"]
+    assert post["froala_asset_id_list"] == [B, C]
+    assert await _used(mongo) == {A: False, B: True, C: True}
+
+
+async def test_removed_asset_used_elsewhere_stays_used(mongo):
+    post = await _seed(mongo, "<p>no images</p>", [A], [f"blobs/{A}.png"])
+    await mongo.posts.insert_one({"_id": "p2", "froala_asset_id_list": [A]})
+
+    result = await references.reconcile_post_assets(post)
+
+    assert result == {"added": [], "removed": [A]}
+    assert (await _used(mongo))[A] is True
+
+
+async def test_nothing_written_when_in_step(mongo):
+    post = await _seed(mongo, f'<img src="/api/assets/{A}">', [A], [f"blobs/{A}.png"])
+    await mongo.posts.update_one({"_id": "p1"}, {"$set": {"marker": 1}})
+
+    assert await references.reconcile_post_assets(post) == {"added": [], "removed": []}
+    assert (await mongo.posts.find_one({"_id": "p1"}))["froala_asset_id_list"] == [A]
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import search
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def _post(title, body="", summary="", tags=(), days_ago=0):
+    post = {
+        "title": title, "summary": summary, "tags": list(tags), "body": body,
+        "slug": title.lower().replace(" ", "-"), "status": "published", "is_deleted": False,
+        "published_at": NOW - timedelta(days=days_ago),
+    }
+    return {**post, **search.search_fields(post)}
+
+
+def test_search_fields_index_words_of_every_source_field():
+    post = {"title": "Python Tips", "summary": "Quick wins", "tags": ["Dev-Ops"], "body": "<p>Use <b>generators</b> &amp; more</p>"}
+
+    assert search.search_fields(post)["search_terms"] == ["dev", "generators", "more", "ops", "python", "quick", "tips", "use", "wins"]
+
+
+def test_search_terms_cap_keeps_title_words(monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_MAX_TERMS", 3)
+    post = {"title": "zeta", "body": "alpha beta gamma delta"}
+
+    assert search.search_fields(post)["search_terms"] == ["alpha", "beta", "zeta"]
+
+
+def test_query_words_last_one_is_a_prefix():
+    assert search.match_filter(search.parse_query("Fast API rout")) == {"$and": [
+        {"search_terms": "fast"}, {"search_terms": "api"}, {"search_terms": {"$regex": "^rout"}},
+    ]}
+    assert len(search.parse_query(" ".join(["w"] * 20))) == search.SEARCH_MAX_QUERY_WORDS
+
+
+def test_snippet_marks_hits_and_escapes():
+    post = {"body": "<p>" + "filler " * 40 + "Routing &lt;tips&gt; for routers</p>"}
+
+    snippet = search.snippet(post, ["rout"])
+
+    assert snippet.startswith("…")
+    assert "<mark>Routing</mark> &lt;tips&gt; for <mark>routers</mark>" in snippet
+
+
+async def test_search_ranks_by_field(api, mongo):
+    await mongo.posts.insert_many([
+        _post("Cooking notes", body="A word on caching here", days_ago=0),
+        _post("Caching in depth", body="All about it", days_ago=5),
+        _post("Tagged", tags=["caching"], days_ago=3),
+        _post("Unrelated", body="Nothing to see", days_ago=1),
+    ])
+
+    res = await api.get("/api/public/posts", params={"q": "cach"})
+
+    assert res.status_code == 200
+    assert [p["title"] for p in res.json()] == ["Caching in depth", "Tagged", "Cooking notes"]
+    assert "<mark>caching</mark>" in res.json()[2]["snippet"]
+    assert "body" not in res.json()[0]
+
+
+async def test_search_matches_every_word(api, mongo):
+    await mongo.posts.insert_many([
+        _post("Mongo indexes", body="compound keys"),
+        _post("Mongo backups"),
+    ])
+
+    res = await api.get("/api/public/posts", params={"q": "mongo comp"})
+
+    assert [p["title"] for p in res.json()] == ["Mongo indexes"]
+
+
+async def test_search_only_ranks_the_newest_candidates(api, mongo, monkeypatch):
+    # Past SEARCH_MAX_CANDIDATES matches, older posts aren't considered however well they'd rank
+    monkeypatch.setattr(search, "SEARCH_MAX_CANDIDATES", 2)
+    await mongo.posts.insert_many([
+        _post("Deploy guide", days_ago=30),
+        _post("Notes", body="deploy", days_ago=1),
+        _post("More notes", body="deploy", days_ago=2),
+    ])
+
+    res = await api.get("/api/public/posts", params={"q": "deploy"})
+
+    assert [p["title"] for p in res.json()] == ["Notes", "More notes"]
@@ -0,0 +1,136 @@
+import time
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from bson import ObjectId
+
+import publish
+import signing
+from conftest import MONGO_TEST_URI
+
+pytestmark = pytest.mark.anyio
+
+
+def _signed(signed_at: datetime, expires_in: int) -> str:
+    return f"https://r2.test/bucket/a.png?X-Amz-Date={signed_at:%Y%m%dT%H%M%SZ}&X-Amz-Expires={expires_in}&X-Amz-Signature=x"
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return time.perf_counter()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(signing, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def bulk_updates(mongo, monkeypatch):
+    # mongomock's bulk_write doesn't take the UpdateOne of current pymongo, apply them one by one
+    if MONGO_TEST_URI:
+        return
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            await self.update_one(op._filter, op._doc)
+
+    monkeypatch.setattr(type(mongo.assets), "bulk_write", bulk_write)
+
+
+def test_link_expiry():
+    signed_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    assert signing.link_expiry(_signed(signed_at, 3600)) == signed_at + timedelta(hours=1)
+    assert signing.link_expiry("https://cdn.example.com/a.png") is None
+    assert signing.link_expiry("https://r2.test/a.png?X-Amz-Expires=60") is None
+
+
+def test_signatures_reused_until_min_remaining(clock):
+    signer = signing.LinkSigner(min_remaining=100)
+
+    url, expires_at = signer.link("a.png", ttl=1000)
+    assert expires_at.timestamp() == pytest.approx(clock.now + 1000)
+    assert signing.link_expiry(url) is not None
+
+    clock.now += 899
+    assert signer.link("a.png", ttl=1000)[0] == url
+    clock.now += 2
+    assert signer.link("a.png", ttl=1000)[1].timestamp() == pytest.approx(clock.now + 1000)
+    assert (signer.stats()["hits"], signer.stats()["signs"]) == (1, 2)
+
+
+def test_min_remaining_is_at_most_half_the_ttl(clock):
+    signer = signing.LinkSigner(min_remaining=3600)
+    signer.url("a.png", ttl=600)
+
+    clock.now += 299
+    signer.url("a.png", ttl=600)
+    assert signer.stats()["signs"] == 1
+
+
+def test_signer_cache_is_bounded(clock):
+    signer = signing.LinkSigner(size=2)
+    for key in ("a", "b", "c"):
+        signer.url(key)
+
+    assert signer.stats()["cached"] == 2
+
+
+async def test_one_sweeper_holds_the_lease(mongo):
+    first, second = signing.LinkSweeper(interval=60), signing.LinkSweeper(interval=60)
+    first.owner, second.owner = "worker-1", "worker-2"
+
+    assert await first.acquire_lease()
+    assert not await second.acquire_lease()
+    # The holder renews its own lease
+    assert await first.acquire_lease()
+
+    await mongo.leases.update_one({"_id": signing.SWEEP_LEASE_ID}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert await second.acquire_lease()
+    assert not await first.acquire_lease()
+
+
+async def test_sweep_resigns_expiring_links_and_refreshes_pages(mongo, bucket, bulk_updates, monkeypatch):
+    now = datetime.now(timezone.utc)
+    expired = _signed(now - timedelta(days=8), 7 * 24 * 3600)
+    fresh = _signed(now, 7 * 24 * 3600)
+    await mongo.assets.insert_many([
+        {"asset_id": "expired", "path": "a.png", "used_by_post": True, "public_link": expired},
+        {"asset_id": "fresh", "path": "b.png", "used_by_post": True, "public_link": fresh},
+        {"asset_id": "unused", "path": "c.png", "used_by_post": False, "public_link": expired},
+    ])
+    due = await mongo.posts.insert_one({"status": "published", "links_expire_at": now + timedelta(hours=1)})
+    await mongo.posts.insert_one({"status": "published", "links_expire_at": now + timedelta(days=6)})
+    refreshed = []
+    monkeypatch.setattr(publish, "schedule_refresh", refreshed.append)
+
+    result = await signing.LinkSweeper().sweep()
+
+    assert result == {"resigned": 1, "expired": 1, "posts_refreshed": 1}
+    links = {a["asset_id"]: a["public_link"] async for a in mongo.assets.find()}
+    assert signing.link_expiry(links["expired"]) > now + timedelta(days=6)
+    assert links["fresh"] == fresh
+    assert links["unused"] == expired
+    assert refreshed == [str(due.inserted_id)]
+
+
+async def test_refresh_claimed_once_per_claim_period(mongo):
+    post_id = (await mongo.posts.insert_one({"status": "published"})).inserted_id
+    draft_id = (await mongo.posts.insert_one({"status": "draft"})).inserted_id
+
+    assert (await publish.claim_refresh(str(post_id)))["_id"] == post_id
+    assert await publish.claim_refresh(str(post_id)) is None
+    assert await publish.claim_refresh(str(draft_id)) is None
+
+    await mongo.posts.update_one({"_id": post_id}, {"$set": {"refresh_claimed_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert await publish.claim_refresh(str(post_id)) is not None
+    assert await publish.claim_refresh(str(ObjectId())) is None
@@ -0,0 +1,122 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import routers.assetsv2 as assetsv2
+from objectstore import R2_BUCKET
+from workers import PoolSaturated
+
+pytestmark = pytest.mark.anyio
+
+
+def _image(width: int = 800, height: int = 600, noise: bool = False, fmt: str = "PNG") -> bytes:
+    # Noise doesn't compress, which makes an image above the 1MB compression threshold
+    if noise:
+        image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    else:
+        image = Image.new("RGB", (width, height), (200, 30, 30))
+    out = io.BytesIO()
+    image.save(out, fmt)
+    return out.getvalue()
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    async def run(*args, **kwargs):
+        raise PoolSaturated("Image worker pool is saturated")
+
+    monkeypatch.setattr(assetsv2.image_pool, "run", run)
+
+
+async def test_saturated_pool_is_a_503(api, saturated):
+    data = _image(700, 700, noise=True)
+    assert len(data) > assetsv2.MAX_SAVE_BYTES
+
+    res = await api.post("/api/assets/upload-image", files={"file": ("big.png", data, "image/png")})
+
+    assert res.status_code == 503
+    assert res.headers["retry-after"] == "5"
+
+
+async def test_froala_upload_stores_variants(api, mongo, bucket):
+    res = await api.post("/api/assets/froala-image/none", files={"file": ("a.png", _image(900, 600), "image/png")})
+
+    assert res.status_code == 200
+    asset_id = res.json()["link"].rsplit("/", 1)[-1]
+    asset = await mongo.assets.find_one({"asset_id": asset_id})
+    widths = sorted((v["width"], v["mime"]) for v in asset["variants"])
+    assert widths == [(320, "image/jpeg"), (320, "image/webp"), (640, "image/jpeg"), (640, "image/webp"), (900, "image/jpeg"), (900, "image/webp")]
+    for variant in asset["variants"]:
+        stored = bucket.head_object(Bucket=R2_BUCKET, Key=variant["key"])
+        assert stored["ContentType"] == variant["mime"]
+        assert stored["ContentLength"] == variant["size"]
+
+
+async def test_saturated_pool_stores_without_variants(api, mongo, bucket, saturated):
+    res = await api.post("/api/assets/froala-image/none", files={"file": ("a.png", _image(), "image/png")})
+
+    assert res.status_code == 200
+    asset = await mongo.assets.find_one({"asset_id": res.json()["link"].rsplit("/", 1)[-1]})
+    assert asset["variants"] == []
+    assert bucket.get_object(Bucket=R2_BUCKET, Key=asset["blob_key"])["Body"].read() == _image()
+
+
+async def _froala_upload(api, data: bytes) -> str:
+    res = await api.post("/api/assets/froala-image/none", files={"file": ("a.png", data, "image/png")})
+    assert res.status_code == 200
+    return res.json()["link"].rsplit("/", 1)[-1]
+
+
+def _stored(bucket) -> set:
+    return {o["Key"] for o in bucket.list_objects_v2(Bucket=R2_BUCKET).get("Contents", [])}
+
+
+async def test_identical_uploads_share_a_blob(api, mongo, bucket):
+    data = _image()
+    first = await _froala_upload(api, data)
+    objects = _stored(bucket)
+    second = await _froala_upload(api, data)
+
+    # Stored once, both assets point at it with their own ids and paths
+    assert _stored(bucket) == objects
+    assets = [await mongo.assets.find_one({"asset_id": i}) for i in (first, second)]
+    assert assets[0]["path"] != assets[1]["path"]
+    assert assets[0]["blob_key"] == assets[1]["blob_key"]
+    blob = await mongo.blobs.find_one({"_id": assets[0]["blob_id"]})
+    assert blob["refs"] == 2
+
+    # Objects stay until the last reference goes
+    assert (await api.delete(f"/api/assets/{first}")).json()["ok"]
+    assert (await mongo.blobs.find_one({"_id": blob["_id"]}))["refs"] == 1
+    assert _stored(bucket) == objects
+    assert (await api.get(f"/api/assets/{second}")).content == data
+
+    assert (await api.delete(f"/api/assets/{second}")).json()["ok"]
+    assert await mongo.blobs.find_one({"_id": blob["_id"]}) is None
+    assert _stored(bucket) == set()
+
+
+@pytest.mark.parametrize("existing", [False, True])
+async def test_failed_asset_save_releases_the_blob(api, mongo, bucket, monkeypatch, existing):
+    data = _image()
+    if existing:
+        await _froala_upload(api, data)
+    objects = _stored(bucket)
+
+    async def fail(doc, uid=None):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(assetsv2, "save_asset_doc", fail)
+    with pytest.raises(RuntimeError):
+        await _froala_upload(api, data)
+
+    blobs = await mongo.blobs.find({}).to_list(None)
+    if existing:
+        assert [b["refs"] for b in blobs] == [1]
+        assert _stored(bucket) == objects
+    else:
+        # Nothing holds the new blob, it's gone with its objects
+        assert blobs == []
+        assert _stored(bucket) == set()
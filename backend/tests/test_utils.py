@@ -0,0 +1,71 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import utils
+
+
+def _photo(width: int, height: int, mode: str = "RGB") -> bytes:
+    # A gradient with noise on top, compresses roughly like a photo
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    image = Image.blend(gradient, noise, 0.3).convert(mode)
+    out = io.BytesIO()
+    image.save(out, "PNG")
+    return out.getvalue()
+
+
+def _best_quality(img: Image.Image, max_size: int) -> int:
+    # What the old binary search found: the highest quality under the target
+    return max(q for q in range(5, 96) if len(utils._encode(img, q)) <= max_size)
+
+
+@pytest.mark.parametrize("max_size", [60_000, 150_000, 400_000])
+def test_predicted_quality_matches_search(max_size):
+    data = _photo(900, 700)
+
+    out, info = utils.compress_image(data, max_size)
+
+    assert len(out) <= max_size
+    assert info["size"] == len(out)
+    assert info["encodes"] <= utils.MAX_FULL_ENCODES
+    best = _best_quality(utils._to_rgb(Image.open(io.BytesIO(data))), max_size)
+    assert best - 3 <= info["quality"] <= best
+    assert Image.open(io.BytesIO(out)).format == "JPEG"
+
+
+def test_large_images_are_downscaled():
+    out, info = utils.compress_image(_photo(1200, 300), 500_000, max_dimension=600)
+
+    assert (info["width"], info["height"]) == (600, 150)
+    assert Image.open(io.BytesIO(out)).size == (600, 150)
+
+
+def test_transparency_is_flattened():
+    out, info = utils.compress_image(_photo(400, 400, "RGBA"), 100_000)
+
+    assert Image.open(io.BytesIO(out)).mode == "RGB"
+
+
+def test_unreachable_target_shrinks_the_image():
+    out, info = utils.compress_image(_photo(800, 800), 3_000)
+
+    assert len(out) <= 3_000
+    assert info["quality"] == 5
+    assert info["width"] < 800
+
+
+
+def test_variants(tmp_path):
+    variants = utils.make_variants(_photo(1000, 500), widths=(320, 640, 1280), formats=("webp", "jpeg"), out_dir=str(tmp_path))
+
+    # Widths above the original are dropped, the original width is always there, largest first
+    assert [(v["width"], v["format"]) for v in variants] == [
+        (1000, "webp"), (1000, "jpeg"), (640, "webp"), (640, "jpeg"), (320, "webp"), (320, "jpeg"),
+    ]
+    for variant in variants:
+        with Image.open(variant["path"]) as image:
+            assert image.size == (variant["width"], variant["height"])
+        assert os.path.getsize(variant["path"]) == variant["size"]
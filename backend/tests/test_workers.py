@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from workers import ImageWorkerPool, PoolSaturated, JobTimeout
+
+pytestmark = pytest.mark.anyio
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A killed child stays a zombie until the executor reaps it
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(")")[-1].split()[0] != "Z"
+
+
+@pytest.fixture
+async def pool():
+    pool = ImageWorkerPool(workers=1, queue_size=1, job_timeout=0.5, recycle_after=1)
+    pool.start()
+    yield pool
+    await pool.shutdown()
+
+
+async def test_runs_jobs_in_workers(pool):
+    pid = await pool.run(os.getpid)
+
+    assert pid != os.getpid()
+    assert await pool.run(divmod, 7, 2) == (3, 1)
+    with pytest.raises(ZeroDivisionError):
+        await pool.run(divmod, 1, 0)
+    stats = pool.stats()
+    assert (stats["completed"], stats["failed"], stats["in_flight"]) == (2, 1, 0)
+
+
+async def test_saturated_pool_rejects(pool):
+    # One job running, one queued, the third has nowhere to go
+    jobs = [asyncio.ensure_future(pool.run(time.sleep, 0.3, timeout=5)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(PoolSaturated):
+        await pool.run(time.sleep, 0)
+
+    await asyncio.gather(*jobs)
+    assert pool.stats()["rejected"] == 1
+    await pool.run(time.sleep, 0)
+
+
+async def test_hung_job_recycles_the_pool(pool):
+    old_executor = pool._executor
+    old_pid = await pool.run(os.getpid)
+
+    with pytest.raises(JobTimeout):
+        await pool.run(time.sleep, 60)
+
+    # A fresh pool takes new jobs right away
+    assert pool._executor is not old_executor
+    assert await pool.run(os.getpid) != old_pid
+    assert pool.stats()["recycles"] == 1
+
+    # The stuck worker is killed once the retired pool's grace period is over
+    await asyncio.sleep(pool.job_timeout + 0.5)
+    assert old_pid in old_executor.worker_pids
+    assert not _alive(old_pid)
+    assert pool.stats()["in_flight"] == 0
+    assert not pool._retiring
+
+
+async def test_shutdown_kills_hung_workers(pool):
+    pool.recycle_after = 5
+    pid = await pool.run(os.getpid)
+    with pytest.raises(JobTimeout):
+        await pool.run(time.sleep, 60)
+
+    started = time.perf_counter()
+    await pool.shutdown()
+
+    assert time.perf_counter() - started < 5
+    assert not _alive(pid)